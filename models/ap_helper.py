@@ -1816,26 +1816,26 @@ def find_matching_boxes_center(proposals):
         # objectness_label: 1 if pred object center is within NEAR_THRESHOLD of any GT object
         # objectness_mask: 0 if pred object center is in gray zone (DONOTCARE), 1 otherwise
         euclidean_dist12 = torch.sqrt(dist12 + 1e-6)
-        objectness_label12 = torch.zeros((1, K), dtype=torch.long).cuda()
-        objectness_mask12 = torch.zeros((1, K)).cuda()
+        objectness_label12 = torch.zeros((1, K), dtype=torch.long, device=dist12.device)
+        objectness_mask12 = torch.zeros((1, K), device=dist12.device)
         objectness_label12[euclidean_dist12 < NEAR_THRESHOLD] = 1
         objectness_mask12[euclidean_dist12 < NEAR_THRESHOLD] = 1
         objectness_mask12[euclidean_dist12 > FAR_THRESHOLD] = 1
 
         euclidean_dist13 = torch.sqrt(dist13 + 1e-6)
-        objectness_label13 = torch.zeros((1, K), dtype=torch.long).cuda()
-        objectness_mask13 = torch.zeros((1, K)).cuda()
+        objectness_label13 = torch.zeros((1, K), dtype=torch.long, device=dist13.device)
+        objectness_mask13 = torch.zeros((1, K), device=dist13.device)
         objectness_label13[euclidean_dist13 < NEAR_THRESHOLD] = 1
         objectness_mask13[euclidean_dist13 < NEAR_THRESHOLD] = 1
         objectness_mask13[euclidean_dist13 > FAR_THRESHOLD] = 1
 
         euclidean_dist14 = torch.sqrt(dist14 + 1e-6)
-        objectness_label14 = torch.zeros((1, K), dtype=torch.long).cuda()
-        objectness_mask14 = torch.zeros((1, K)).cuda()
+        objectness_label14 = torch.zeros((1, K), dtype=torch.long, device=dist14.device)
+        objectness_mask14 = torch.zeros((1, K), device=dist14.device)
         objectness_label14[euclidean_dist14 < NEAR_THRESHOLD] = 1
         objectness_mask14[euclidean_dist14 < NEAR_THRESHOLD] = 1
         objectness_mask14[euclidean_dist14 > FAR_THRESHOLD] = 1
-        initial_mask = torch.ones((1, K)).cuda()
+        initial_mask = torch.ones((1, K), device=dist12.device)
 
         aggregated_mask = (
             objectness_mask13 + objectness_mask12 + objectness_mask14 + initial_mask
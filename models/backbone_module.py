@@ -9,6 +9,8 @@ import torch.nn.functional as F
 import numpy as np
 import sys
 import os
+import contextlib
+from torch.utils.checkpoint import checkpoint
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 ROOT_DIR = os.path.dirname(BASE_DIR)
@@ -16,6 +18,32 @@ sys.path.append(ROOT_DIR)
 sys.path.append(os.path.join(ROOT_DIR, "utils"))
 sys.path.append(os.path.join(ROOT_DIR, "pointnet2"))
 from pointnet2_modules import PointnetSAModuleVotes, PointnetFPModule
+import pointnet2_utils
+
+# stages of Pointnet2Backbone that can be checkpointed, in forward order
+CHECKPOINT_STAGES = ["sa1", "sa2", "sa3", "sa4", "fp1", "fp2"]
+
+
+@contextlib.contextmanager
+def _frozen_bn_stats(module):
+    # the recomputation of a checkpointed stage runs its BatchNorms in train
+    # mode again, which must not update the running statistics twice
+    bns = [
+        m
+        for m in module.modules()
+        if isinstance(m, nn.modules.batchnorm._BatchNorm) and m.track_running_stats
+    ]
+    state = [
+        (m.running_mean.clone(), m.running_var.clone(), m.num_batches_tracked.clone())
+        for m in bns
+    ]
+    try:
+        yield
+    finally:
+        for m, (mean, var, num) in zip(bns, state):
+            m.running_mean.copy_(mean)
+            m.running_var.copy_(var)
+            m.num_batches_tracked.copy_(num)
 
 
 class Pointnet2Backbone(nn.Module):
@@ -71,6 +99,28 @@ class Pointnet2Backbone(nn.Module):
 
         self.fp1 = PointnetFPModule(mlp=[256 + 256, 256, 256])
         self.fp2 = PointnetFPModule(mlp=[256 + 256, 256, 256])
+        # stages whose activations are recomputed in the backward pass, see
+        # set_activation_checkpointing
+        self.checkpoint_stages = []
+
+    def _stage(self, name, *args):
+        stage = getattr(self, name)
+        if name not in self.checkpoint_stages or not (
+            self.training and torch.is_grad_enabled()
+        ):
+            return stage(*args)
+        if isinstance(stage, PointnetSAModuleVotes):
+            # sample outside of the checkpoint, so the recomputation groups
+            # around the same points without running FPS again
+            xyz, features = args
+            inds = pointnet2_utils.sample_points(xyz, stage.npoint, stage.fps_mode)
+            args = (xyz, features, inds)
+        return checkpoint(
+            stage,
+            *args,
+            use_reentrant=False,
+            context_fn=lambda: (contextlib.nullcontext(), _frozen_bn_stats(stage))
+        )
 
     def _break_up_pc(self, pc):
         xyz = pc[..., 0:3].contiguous()
@@ -104,43 +154,49 @@ class Pointnet2Backbone(nn.Module):
         xyz, features = self._break_up_pc(pointcloud)
 
         # --------- 4 SET ABSTRACTION LAYERS ---------
-        xyz, features, fps_inds = self.sa1(xyz, features)
+        xyz, features, fps_inds = self._stage("sa1", xyz, features)
         # features = self.drop1(features)
         end_points["sa1_inds"] = fps_inds
         end_points["sa1_xyz"] = xyz
         end_points["sa1_features"] = features
 
-        xyz, features, fps_inds = self.sa2(
-            xyz, features
+        xyz, features, fps_inds = self._stage(
+            "sa2", xyz, features
         )  # this fps_inds is just 0,1,...,1023
         # features = self.drop2(features)
         end_points["sa2_inds"] = fps_inds
         end_points["sa2_xyz"] = xyz
         end_points["sa2_features"] = features
 
-        xyz, features, fps_inds = self.sa3(
-            xyz, features
+        xyz, features, fps_inds = self._stage(
+            "sa3", xyz, features
         )  # this fps_inds is just 0,1,...,511
         # features = self.drop3(features)
         end_points["sa3_xyz"] = xyz
         end_points["sa3_features"] = features
 
-        xyz, features, fps_inds = self.sa4(
-            xyz, features
+        xyz, features, fps_inds = self._stage(
+            "sa4", xyz, features
         )  # this fps_inds is just 0,1,...,255
         # features = self.drop4(features)
         end_points["sa4_xyz"] = xyz
         end_points["sa4_features"] = features
+        for name in ["sa1", "sa2", "sa3", "sa4"]:
+            # set by pointnet2_modules.set_fps_mode(..., track_coverage=True)
+            if getattr(self, name).coverage is not None:
+                end_points[name + "_coverage"] = getattr(self, name).coverage
 
         # --------- 2 FEATURE UPSAMPLING LAYERS --------
-        features = self.fp1(
+        features = self._stage(
+            "fp1",
             end_points["sa3_xyz"],
             end_points["sa4_xyz"],
             end_points["sa3_features"],
             end_points["sa4_features"],
         )
         # features = self.drop5(features)
-        features = self.fp2(
+        features = self._stage(
+            "fp2",
             end_points["sa2_xyz"],
             end_points["sa3_xyz"],
             end_points["sa2_features"],
@@ -149,13 +205,26 @@ class Pointnet2Backbone(nn.Module):
         # features = self.drop6(features)
         end_points["fp2_features"] = features
         end_points["fp2_xyz"] = end_points["sa2_xyz"]
-        num_seed = end_points["fp2_xyz"].shape[1]
-        end_points["fp2_inds"] = end_points["sa1_inds"][
-            :, 0:num_seed
-        ]  # indices among the entire input point clouds
+        # indices among the entire input point clouds; with exact FPS sa2_inds
+        # is just 0,1,...,1023, the approximate FPS modes pick any sa1 points
+        end_points["fp2_inds"] = torch.gather(
+            end_points["sa1_inds"], 1, end_points["sa2_inds"].long()
+        )
         return end_points
 
 
+def set_activation_checkpointing(module, stages=()):
+    """Checkpoints the given CHECKPOINT_STAGES of every Pointnet2Backbone in
+    module: in training their inner activations (the grouped neighborhoods
+    and the MLP outputs) are freed after the forward pass and recomputed in
+    the backward pass, trading compute for activation memory."""
+    for stage in stages:
+        assert stage in CHECKPOINT_STAGES, stage
+    for m in module.modules():
+        if isinstance(m, Pointnet2Backbone):
+            m.checkpoint_stages = list(stages)
+
+
 if __name__ == "__main__":
     backbone_net = Pointnet2Backbone(input_feature_dim=3).cuda()
     print(backbone_net)
@@ -0,0 +1,96 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+""" Command line plumbing shared by the model tools (inference_export.py,
+quantization.py, scripts/precision_parity.py): the dataset and model flags,
+the dataset config and dataset of --dataset, and a VoteNet with the weights of
+--checkpoint_path, a checkpoint file or a registered log dir.
+"""
+
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BASE_DIR)
+sys.path.append(BASE_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "utils"))
+from checkpoint_registry import load_model_state
+
+DATASETS = ["sunrgbd", "scannet"]
+AP_IOU_THRESHOLDS = [0.25, 0.5]
+# evaluation settings of scripts/train.py
+CONFIG_DICT = {
+    "remove_empty_box": False,
+    "use_3d_nms": True,
+    "nms_iou": 0.25,
+    "use_old_type_nms": False,
+    "cls_nms": True,
+    "per_class_proposal": True,
+    "conf_thresh": 0.05,
+}
+
+
+def add_model_args(parser, dataset="scannet", num_point=40000, cluster_sampling="vote_fps"):
+    parser.add_argument("--dataset", default=dataset, choices=DATASETS, help="Dataset: sunrgbd or scannet [default: %s]" % (dataset))
+    parser.add_argument("--checkpoint_path", required=True, help="Model checkpoint file or log dir with a checkpoint registry")
+    parser.add_argument("--num_point", type=int, default=num_point, help="Point Number [default: %d]" % (num_point))
+    parser.add_argument("--num_target", type=int, default=256, help="Proposal number [default: 256]")
+    parser.add_argument("--cluster_sampling", default=cluster_sampling)
+    parser.add_argument("--use_color", action="store_true")
+    parser.add_argument("--no_height", action="store_true")
+    parser.add_argument("--log_var", action="store_true")
+
+
+def num_input_channels(FLAGS):
+    return int(FLAGS.use_color) * 3 + int(not FLAGS.no_height) * 1
+
+
+def dataset_config(FLAGS):
+    if FLAGS.dataset == "sunrgbd":
+        sys.path.append(os.path.join(ROOT_DIR, "sunrgbd"))
+        from model_util_sunrgbd import SunrgbdDatasetConfig
+
+        return SunrgbdDatasetConfig()
+    sys.path.append(os.path.join(ROOT_DIR, "scannet"))
+    from model_util_scannet import ScannetDatasetConfig
+
+    return ScannetDatasetConfig()
+
+
+def make_dataset(FLAGS, split):
+    """Non augmented dataset of split with the input flags of FLAGS."""
+    kwargs = dict(
+        num_points=FLAGS.num_point,
+        augment=False,
+        use_color=FLAGS.use_color,
+        use_height=(not FLAGS.no_height),
+    )
+    if FLAGS.dataset == "sunrgbd":
+        sys.path.append(os.path.join(ROOT_DIR, "sunrgbd"))
+        from sunrgbd_detection_dataset import SunrgbdDetectionVotesDataset
+
+        return SunrgbdDetectionVotesDataset(split, **kwargs)
+    sys.path.append(os.path.join(ROOT_DIR, "scannet"))
+    from scannet_detection_dataset import ScannetDetectionDataset
+
+    return ScannetDetectionDataset(split, **kwargs)
+
+
+def load_detector(FLAGS, dataset_config, device):
+    """VoteNet of FLAGS with the weights of FLAGS.checkpoint_path, on device."""
+    from votenet import VoteNet
+
+    net = VoteNet(
+        num_class=dataset_config.num_class,
+        num_heading_bin=dataset_config.num_heading_bin,
+        num_size_cluster=dataset_config.num_size_cluster,
+        mean_size_arr=dataset_config.mean_size_arr,
+        num_proposal=FLAGS.num_target,
+        input_feature_dim=num_input_channels(FLAGS),
+        sampling=FLAGS.cluster_sampling,
+        log_var=FLAGS.log_var,
+    ).to(device)
+    net.load_state_dict(load_model_state(FLAGS.checkpoint_path, map_location=device))
+    return net
@@ -0,0 +1,257 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+""" Inference export of a trained VoteNet.
+
+export_votenet copies the model, folds every BatchNorm that follows a conv
+into the conv weights, replaces the dropouts by identities (or keeps only the
+two proposal head dropouts, always on, for MC dropout scoring) and traces it
+into a TorchScript module. The traced module takes the (B,N,3+C) point cloud
+and returns the tensors of OUTPUT_KEYS in that order; the key names and the
+export settings are stored in the archive as extra files.
+
+The pointnet2 ops are recorded as calls to the TorchScript operators of the
+compiled _ext library, so serving only needs torch and that library:
+
+    torch.ops.load_library(ext_library)
+    module = torch.jit.load(path)
+
+Usage example:
+python models/inference_export.py --dataset sunrgbd --checkpoint_path log_sunrgbd --output votenet_sunrgbd.pt
+"""
+
+import os
+import sys
+import json
+import time
+import copy
+import argparse
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BASE_DIR)
+sys.path.append(BASE_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "pointnet2"))
+import pointnet2_utils
+
+OUTPUT_KEYS = [
+    "objectness_scores",
+    "center",
+    "heading_scores",
+    "heading_residuals",
+    "size_scores",
+    "size_residuals",
+    "sem_cls_scores",
+    "aggregated_vote_xyz",
+    "seed_xyz",
+    "vote_xyz",
+]
+# dropouts of the proposal head, enabled by VoteNet.enable_dropouts
+MC_DROPOUTS = ["pnet.drop1", "pnet.drop2"]
+
+
+class MCDropout(nn.Module):
+    """Dropout that stays on in eval mode, so MC dropout survives .eval()."""
+
+    def __init__(self, p):
+        super().__init__()
+        self.p = p
+
+    def forward(self, x):
+        return F.dropout(x, self.p, True)
+
+
+def _is_bn(module):
+    return isinstance(module, nn.modules.batchnorm._BatchNorm)
+
+
+def _unwrap_bn(module):
+    # pytorch_utils.BatchNorm1d/2d wrap the BatchNorm in a Sequential
+    if isinstance(module, nn.Sequential) and len(module) == 1 and _is_bn(module[0]):
+        return module[0]
+    return module if _is_bn(module) else None
+
+
+def fuse_conv_bn(model):
+    """Folds BatchNorms into the preceding convs of an eval mode model, in
+    place. Handles conv/bn pairs of a Sequential (pytorch_utils.SharedMLP and
+    Conv1d/Conv2d) and convK/bnK attribute pairs (VotingModule,
+    ProposalModule). Returns the number of folded BatchNorms."""
+    assert not model.training, "BatchNorm can only be folded in eval mode"
+    num_fused = 0
+    for module in list(model.modules()):
+        names = [name for name, _ in module.named_children()]
+        pairs = []
+        if isinstance(module, nn.Sequential):
+            pairs = [(a, b) for a, b in zip(names[:-1], names[1:])]
+        for name in names:
+            if name.startswith("conv") and "bn" + name[4:] in names:
+                pairs.append((name, "bn" + name[4:]))
+        for conv_name, bn_name in pairs:
+            conv = getattr(module, conv_name)
+            bn = _unwrap_bn(getattr(module, bn_name))
+            if not isinstance(conv, nn.modules.conv._ConvNd) or bn is None:
+                continue
+            setattr(module, conv_name, fuse_conv_bn_eval(conv, bn))
+            setattr(module, bn_name, nn.Identity())
+            num_fused += 1
+    return num_fused
+
+
+def strip_dropouts(model, keep_mc_dropout=False):
+    """Replaces the dropouts of model by identities, in place. With
+    keep_mc_dropout the proposal head dropouts become MCDropout instead."""
+    for name, module in list(model.named_modules()):
+        if not isinstance(module, nn.Dropout):
+            continue
+        parent_name, _, child = name.rpartition(".")
+        parent = model
+        for part in parent_name.split(".") if parent_name else []:
+            parent = getattr(parent, part)
+        if keep_mc_dropout and name in MC_DROPOUTS:
+            setattr(parent, child, MCDropout(module.p))
+        else:
+            setattr(parent, child, nn.Identity())
+    return model
+
+
+class InferenceVoteNet(nn.Module):
+    """Tensor in, tensor tuple out wrapper of VoteNet for tracing."""
+
+    def __init__(self, net, output_keys):
+        super().__init__()
+        self.net = net
+        self.output_keys = output_keys
+
+    def forward(self, point_clouds):
+        end_points = self.net({"point_clouds": point_clouds})
+        return tuple(end_points[key] for key in self.output_keys)
+
+
+def optimize_for_inference(net, keep_mc_dropout=False):
+    """Eval mode copy of net with folded BatchNorms and without dropouts."""
+    net = copy.deepcopy(net).eval()
+    # the approximate FPS modes take Python branches on data dependent sizes
+    for module in net.modules():
+        if getattr(module, "fps_mode", "exact") != "exact":
+            raise ValueError("export needs exact FPS, got %s" % (module.fps_mode))
+    fuse_conv_bn(net)
+    strip_dropouts(net, keep_mc_dropout)
+    return net
+
+
+def ext_library():
+    """Path of the compiled pointnet2 _ext library, which the exported module
+    needs at load time."""
+    if pointnet2_utils._ext is None:
+        raise RuntimeError("export needs the compiled pointnet2 _ext module")
+    return pointnet2_utils._ext.__file__
+
+
+def _max_abs_error(keys, reference, outputs):
+    return {
+        key: float((ref.float() - out.float()).abs().max())
+        for key, ref, out in zip(keys, reference, outputs)
+    }
+
+
+def _time(fn, point_clouds, repeat):
+    with torch.no_grad():
+        fn(point_clouds)
+        if point_clouds.is_cuda:
+            torch.cuda.synchronize()
+        start = time.time()
+        for _ in range(repeat):
+            fn(point_clouds)
+        if point_clouds.is_cuda:
+            torch.cuda.synchronize()
+    return (time.time() - start) / repeat
+
+
+def export_votenet(net, point_clouds, path, keep_mc_dropout=False, repeat=5):
+    """Traces an inference copy of net on the example point_clouds (B,N,3+C)
+    and saves it to path. Returns a report with the largest absolute error of
+    every output against net in eval mode (MC dropout disabled for the
+    comparison) and the per-scene latency of both."""
+    ext_path = ext_library()
+    net = net.eval()
+    output_keys = list(OUTPUT_KEYS)
+    if getattr(net.pnet, "conv4", None) is not None:
+        output_keys.append("log_vars")
+    reference_module = InferenceVoteNet(net, output_keys)
+    fused = InferenceVoteNet(optimize_for_inference(net, keep_mc_dropout), output_keys)
+
+    with torch.no_grad():
+        traced = torch.jit.trace(fused, point_clouds, check_trace=False)
+    extra_files = {
+        "output_keys.json": json.dumps(output_keys),
+        "export.json": json.dumps(
+            {
+                "keep_mc_dropout": keep_mc_dropout,
+                "num_point": int(point_clouds.shape[1]),
+                "input_channels": int(point_clouds.shape[2]),
+                "ext_library": os.path.basename(ext_path),
+            }
+        ),
+    }
+    tmp_path = path + ".tmp.%d" % (os.getpid())
+    traced.save(tmp_path, _extra_files=extra_files)
+    os.replace(tmp_path, path)
+
+    loaded = torch.jit.load(path, map_location=point_clouds.device)
+    if keep_mc_dropout:
+        # compare the deterministic graph, the saved one keeps its dropouts
+        check = InferenceVoteNet(optimize_for_inference(net, False), output_keys)
+        loaded_check = torch.jit.trace(check, point_clouds, check_trace=False)
+    else:
+        loaded_check = loaded
+    with torch.no_grad():
+        reference = reference_module(point_clouds)
+        outputs = loaded_check(point_clouds)
+    batch_size = point_clouds.shape[0]
+    return {
+        "path": path,
+        "ext_library": ext_path,
+        "max_abs_error": _max_abs_error(output_keys, reference, outputs),
+        "eager_latency": _time(reference_module, point_clouds, repeat) / batch_size,
+        "exported_latency": _time(loaded, point_clouds, repeat) / batch_size,
+    }
+
+
+def load_exported(path, ext_library_path, map_location=None):
+    """Loads an exported module with only torch and the _ext library. Returns
+    the module and its output keys."""
+    torch.ops.load_library(ext_library_path)
+    extra_files = {"output_keys.json": ""}
+    module = torch.jit.load(path, map_location=map_location, _extra_files=extra_files)
+    return module, json.loads(extra_files["output_keys.json"])
+
+
+if __name__ == "__main__":
+    from detector_cli import add_model_args, dataset_config, load_detector, num_input_channels
+
+    parser = argparse.ArgumentParser()
+    add_model_args(parser, dataset="sunrgbd", num_point=20000, cluster_sampling="seed_fps")
+    parser.add_argument("--output", required=True, help="Path of the exported TorchScript module")
+    parser.add_argument("--batch_size", type=int, default=1)
+    parser.add_argument("--keep_mc_dropout", action="store_true", help="Keep the proposal head dropouts on")
+    FLAGS = parser.parse_args()
+
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    net = load_detector(FLAGS, dataset_config(FLAGS), device)
+
+    point_clouds = torch.rand(FLAGS.batch_size, FLAGS.num_point, 3 + num_input_channels(FLAGS), device=device)
+    point_clouds[:, :, 0:3] = point_clouds[:, :, 0:3] * 4 - 2
+    report = export_votenet(net, point_clouds, FLAGS.output, FLAGS.keep_mc_dropout)
+    print("Exported %s (needs %s)" % (report["path"], report["ext_library"]))
+    for key, err in report["max_abs_error"].items():
+        print("  max abs error %-20s %.3e" % (key, err))
+    print(
+        "Per scene latency: eager %.1f ms, exported %.1f ms"
+        % (1000 * report["eager_latency"], 1000 * report["exported_latency"])
+    )
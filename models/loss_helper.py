@@ -21,6 +21,20 @@ NEAR_THRESHOLD = 0.3
 GT_VOTE_FACTOR = 3  # number of GT votes per point
 OBJECTNESS_CLS_WEIGHTS = [0.2, 0.8]  # put larger weights on positive objectness
 
+# (num_size_cluster,3) mean size tensors by device and table contents
+_MEAN_SIZE_TENSORS = {}
+
+
+def _mean_size_tensor(mean_size_arr, device):
+    """config.mean_size_arr as a float32 tensor on device, copied once.
+    Constants are not read from end_points: nn.DataParallel concatenates every
+    end_points tensor of the replicas along dim 0."""
+    mean_size_arr = np.asarray(mean_size_arr, dtype=np.float32)
+    key = (str(device), mean_size_arr.shape, mean_size_arr.tobytes())
+    if key not in _MEAN_SIZE_TENSORS:
+        _MEAN_SIZE_TENSORS[key] = torch.as_tensor(mean_size_arr, device=device)
+    return _MEAN_SIZE_TENSORS[key]
+
 
 def compute_vote_loss(end_points):
     """Compute vote loss: Match predicted votes to GT votes.
@@ -105,8 +119,8 @@ def compute_objectness_loss(end_points):
     # objectness_label: 1 if pred object center is within NEAR_THRESHOLD of any GT object
     # objectness_mask: 0 if pred object center is in gray zone (DONOTCARE), 1 otherwise
     euclidean_dist1 = torch.sqrt(dist1 + 1e-6)
-    objectness_label = torch.zeros((B, K), dtype=torch.long).cuda()
-    objectness_mask = torch.zeros((B, K)).cuda()
+    objectness_label = torch.zeros((B, K), dtype=torch.long, device=dist1.device)
+    objectness_mask = torch.zeros((B, K), device=dist1.device)
     objectness_label[euclidean_dist1 < NEAR_THRESHOLD] = 1
     objectness_mask[euclidean_dist1 < NEAR_THRESHOLD] = 1
     objectness_mask[euclidean_dist1 > FAR_THRESHOLD] = 1
@@ -114,7 +128,7 @@ def compute_objectness_loss(end_points):
     # Compute objectness loss
     objectness_scores = end_points["objectness_scores"]
     criterion = nn.CrossEntropyLoss(
-        torch.Tensor(OBJECTNESS_CLS_WEIGHTS).cuda(), reduction="none"
+        objectness_scores.new_tensor(OBJECTNESS_CLS_WEIGHTS), reduction="none"
     )
     objectness_loss = criterion(objectness_scores.transpose(2, 1), objectness_label)
     objectness_loss = torch.sum(objectness_loss * objectness_mask) / (
@@ -217,9 +231,10 @@ def compute_box_and_sem_cls_loss(end_points, config):
     )
 
     # Ref: https://discuss.pytorch.org/t/convert-int-into-one-hot-format/507/3
-    heading_label_one_hot = torch.cuda.FloatTensor(
-        batch_size, heading_class_label.shape[1], num_heading_bin
-    ).zero_()
+    heading_label_one_hot = torch.zeros(
+        (batch_size, heading_class_label.shape[1], num_heading_bin),
+        device=heading_class_label.device,
+    )
     heading_label_one_hot.scatter_(
         2, heading_class_label.unsqueeze(-1), 1
     )  # src==1 so it's *one-hot* (B,K,num_heading_bin)
@@ -251,9 +266,10 @@ def compute_box_and_sem_cls_loss(end_points, config):
         1,
         object_assignment.unsqueeze(-1).repeat(1, 1, 3),
     )  # select (B,K,3) from (B,K2,3)
-    size_label_one_hot = torch.cuda.FloatTensor(
-        batch_size, size_class_label.shape[1], num_size_cluster
-    ).zero_()
+    size_label_one_hot = torch.zeros(
+        (batch_size, size_class_label.shape[1], num_size_cluster),
+        device=size_class_label.device,
+    )
     size_label_one_hot.scatter_(
         2, size_class_label.unsqueeze(-1), 1
     )  # src==1 so it's *one-hot* (B,K,num_size_cluster)
@@ -264,11 +280,9 @@ def compute_box_and_sem_cls_loss(end_points, config):
         end_points["size_residuals_normalized"] * size_label_one_hot_tiled, 2
     )  # (B,K,3)
 
-    mean_size_arr_expanded = (
-        torch.from_numpy(mean_size_arr.astype(np.float32))
-        .cuda()
-        .unsqueeze(0)
-        .unsqueeze(0)
+    mean_size_arr = _mean_size_tensor(mean_size_arr, size_class_label.device)
+    mean_size_arr_expanded = mean_size_arr.unsqueeze(0).unsqueeze(
+        0
     )  # (1,1,num_size_cluster,3)
     mean_size_label = torch.sum(
         size_label_one_hot_tiled * mean_size_arr_expanded, 2
@@ -348,7 +362,7 @@ def get_loss(end_points, config):
     end_points["objectness_mask"] = objectness_mask
     end_points["object_assignment"] = object_assignment
     total_num_proposal = objectness_label.shape[0] * objectness_label.shape[1]
-    end_points["pos_ratio"] = torch.sum(objectness_label.float().cuda()) / float(
+    end_points["pos_ratio"] = torch.sum(objectness_label.float()) / float(
         total_num_proposal
     )
     end_points["neg_ratio"] = (
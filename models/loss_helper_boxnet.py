@@ -45,11 +45,11 @@ def compute_objectness_loss(end_points):
     end_points['seed_labels'] = seed_gt_votes_mask
     aggregated_vote_inds = end_points['aggregated_vote_inds']
     objectness_label = torch.gather(end_points['seed_labels'], 1, aggregated_vote_inds.long()) # select (B,K) from (B,1024)
-    objectness_mask = torch.ones((objectness_label.shape[0], objectness_label.shape[1])).cuda() # no ignore zone anymore
+    objectness_mask = torch.ones((objectness_label.shape[0], objectness_label.shape[1]), device=objectness_label.device) # no ignore zone anymore
 
     # Compute objectness loss
     objectness_scores = end_points['objectness_scores']
-    criterion = nn.CrossEntropyLoss(torch.Tensor(OBJECTNESS_CLS_WEIGHTS).cuda(), reduction='none')
+    criterion = nn.CrossEntropyLoss(objectness_scores.new_tensor(OBJECTNESS_CLS_WEIGHTS), reduction='none')
     objectness_loss = criterion(objectness_scores.transpose(2,1), objectness_label)
     objectness_loss = torch.sum(objectness_loss * objectness_mask)/(torch.sum(objectness_mask)+1e-6)
 
@@ -92,7 +92,7 @@ def get_loss(end_points, config):
     end_points['object_assignment'] = object_assignment
     total_num_proposal = objectness_label.shape[0]*objectness_label.shape[1]
     end_points['pos_ratio'] = \
-        torch.sum(objectness_label.float().cuda())/float(total_num_proposal)
+        torch.sum(objectness_label.float())/float(total_num_proposal)
     end_points['neg_ratio'] = \
         torch.sum(objectness_mask.float())/float(total_num_proposal) - end_points['pos_ratio']
 
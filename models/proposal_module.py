@@ -13,13 +13,22 @@ import sys
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 ROOT_DIR = os.path.dirname(BASE_DIR)
 sys.path.append(os.path.join(ROOT_DIR, "pointnet2"))
+sys.path.append(os.path.join(ROOT_DIR, "utils"))
 from pointnet2_modules import PointnetSAModuleVotes
 import pointnet2_utils
+from mixed_precision import full_precision
 
 
+@full_precision
 def decode_scores(
     net, end_points, num_class, num_heading_bin, num_size_cluster, mean_size_arr
 ):
+    """mean_size_arr: (num_size_cluster,3) tensor on the device of net, numpy
+    arrays are copied to that device on every call."""
+    if not torch.is_tensor(mean_size_arr):
+        mean_size_arr = torch.as_tensor(
+            mean_size_arr, dtype=torch.float32, device=net.device
+        )
     net_transposed = net.transpose(2, 1)  # (batch_size, 1024, ..)
     batch_size = net_transposed.shape[0]
     num_proposal = net_transposed.shape[1]
@@ -59,9 +68,9 @@ def decode_scores(
     )  # Bxnum_proposalxnum_size_clusterx3
     end_points["size_scores"] = size_scores
     end_points["size_residuals_normalized"] = size_residuals_normalized
-    end_points["size_residuals"] = size_residuals_normalized * torch.from_numpy(
-        mean_size_arr.astype(np.float32)
-    ).cuda().unsqueeze(0).unsqueeze(0)
+    end_points["size_residuals"] = size_residuals_normalized * mean_size_arr.to(
+        size_residuals_normalized.dtype
+    ).unsqueeze(0).unsqueeze(0)
 
     sem_cls_scores = net_transposed[
         :, :, 5 + num_heading_bin * 2 + num_size_cluster * 4 :
@@ -91,6 +100,13 @@ class ProposalModule(nn.Module):
         self.num_proposal = num_proposal
         self.sampling = sampling
         self.seed_feat_dim = seed_feat_dim
+        # moved with the module, so decoding needs no host to device copy;
+        # not persistent to keep the checkpoint format
+        self.register_buffer(
+            "mean_size",
+            torch.from_numpy(np.asarray(mean_size_arr, dtype=np.float32)),
+            persistent=False,
+        )
 
         # Vote clustering
         self.vote_aggregation = PointnetSAModuleVotes(
@@ -119,6 +135,36 @@ class ProposalModule(nn.Module):
             self.conv4 = None
         self.bn1 = torch.nn.BatchNorm1d(128)
         self.bn2 = torch.nn.BatchNorm1d(128)
+        # objectness gate of the inference mode, see set_proposal_gate
+        self.gate_top_k = None
+        self.gate_conf_thresh = None
+
+    def gated(self):
+        return not self.training and (
+            self.gate_top_k is not None or self.gate_conf_thresh is not None
+        )
+
+    def objectness_logits(self, net):
+        """(B,2,K) objectness rows of conv3 only."""
+        if isinstance(self.conv3, nn.Conv1d):
+            return F.conv1d(net, self.conv3.weight[0:2], self.conv3.bias[0:2])
+        # e.g. a quantized conv3, that can not be sliced
+        return self.conv3(net)[:, 0:2]
+
+    def select_proposals(self, net):
+        """Indices (B,k) of the proposals that pass the gate, in proposal
+        order. k is the largest number of proposals of a scene with an
+        objectness probability of at least gate_conf_thresh, at most
+        gate_top_k, so the batch stays dense; scenes with fewer proposals
+        above the threshold keep their next best ones."""
+        prob = F.softmax(self.objectness_logits(net).float(), dim=1)[:, 1]  # B,K
+        k = prob.shape[1]
+        if self.gate_conf_thresh is not None:
+            num_above = (prob >= self.gate_conf_thresh).sum(1).max()
+            k = max(1, int(num_above))
+        if self.gate_top_k is not None:
+            k = min(k, self.gate_top_k)
+        return torch.sort(prob.topk(k, dim=1)[1], dim=1)[0]
 
     def forward(self, xyz, features, end_points):
         """
@@ -135,8 +181,10 @@ class ProposalModule(nn.Module):
         elif self.sampling == "seed_fps":
             # FPS on seed and choose the votes corresponding to the seeds
             # This gets us a slightly better coverage of *object* votes than vote_fps (which tends to get more cluster votes)
-            sample_inds = pointnet2_utils.furthest_point_sample(
-                end_points["seed_xyz"], self.num_proposal
+            sample_inds = pointnet2_utils.sample_points(
+                end_points["seed_xyz"],
+                self.num_proposal,
+                self.vote_aggregation.fps_mode,
             )
             xyz, features, _ = self.vote_aggregation(xyz, features, sample_inds)
         elif self.sampling == "random":
@@ -144,12 +192,20 @@ class ProposalModule(nn.Module):
             num_seed = end_points["seed_xyz"].shape[1]
             batch_size = end_points["seed_xyz"].shape[0]
             sample_inds = torch.randint(
-                0, num_seed, (batch_size, self.num_proposal), dtype=torch.int
-            ).cuda()
+                0,
+                num_seed,
+                (batch_size, self.num_proposal),
+                dtype=torch.int,
+                device=xyz.device,
+            )
             xyz, features, _ = self.vote_aggregation(xyz, features, sample_inds)
         else:
             log_string("Unknown sampling strategy: %s. Exiting!" % (self.sampling))
             exit()
+        if self.vote_aggregation.track_coverage:
+            end_points["proposal_coverage"] = pointnet2_utils.sampling_coverage(
+                end_points["vote_xyz"], xyz, self.vote_aggregation.radius
+            )
         end_points["aggregated_vote_xyz"] = xyz  # (batch_size, num_proposal, 3)
         end_points[
             "aggregated_vote_inds"
@@ -158,6 +214,24 @@ class ProposalModule(nn.Module):
         # --------- Proposal Generation with Variational Inference ---------
         net = F.relu(self.bn1(self.conv1(self.drop1(features))))
         net = F.relu(self.bn2(self.conv2(self.drop2(net))))
+        # --------- Objectness gate (inference only) ---------
+        # the rest of conv3 and the decoding only run on the kept proposals.
+        # Given proposal_inds (e.g. of the first MC dropout sample) are reused,
+        # so all samples describe the same proposals
+        if not self.training and "proposal_inds" in end_points:
+            proposal_inds = end_points["proposal_inds"]
+        elif self.gated():
+            proposal_inds = self.select_proposals(net)
+        else:
+            proposal_inds = None
+        if proposal_inds is not None:
+            inds = proposal_inds.long()
+            net = torch.gather(net, 2, inds.unsqueeze(1).expand(-1, net.shape[1], -1))
+            end_points["aggregated_vote_xyz"] = torch.gather(
+                xyz, 1, inds.unsqueeze(-1).expand(-1, -1, 3)
+            )
+            end_points["aggregated_vote_inds"] = torch.gather(sample_inds, 1, inds)
+            end_points["proposal_inds"] = proposal_inds
         # net = self.conv3(self.drop3(net)) # (batch_size, 2+3+num_heading_bin*2+num_size_cluster*4, num_proposal)
         # --------- proposal GENERATION ---------
         # net = F.relu(self.bn1(self.conv1(features)))
@@ -167,7 +241,8 @@ class ProposalModule(nn.Module):
         )  # (batch_size, 2+3+num_heading_bin*2+num_size_cluster*4, num_proposal)
         if self.conv4:
             log_var = self.conv4(net)
-            end_points["log_vars"] = log_var.squeeze(1)
+            # fp32 under autocast, the losses exponentiate it
+            end_points["log_vars"] = log_var.squeeze(1).float()
         else:
             end_points["log_vars"] = None
         end_points = decode_scores(
@@ -176,11 +251,24 @@ class ProposalModule(nn.Module):
             self.num_class,
             self.num_heading_bin,
             self.num_size_cluster,
-            self.mean_size_arr,
+            self.mean_size,
         )
         return end_points
 
 
+def set_proposal_gate(model, top_k=None, conf_thresh=None):
+    """Sets the objectness gate of every ProposalModule of model. In eval
+    mode the head then decodes only the proposals with an objectness
+    probability of at least conf_thresh, at most top_k per scene. With the
+    conf_thresh of parse_predictions the parsed detections are unchanged,
+    the dropped proposals would be discarded there. None disables a limit,
+    both None disables the gate."""
+    for module in model.modules():
+        if isinstance(module, ProposalModule):
+            module.gate_top_k = top_k
+            module.gate_conf_thresh = conf_thresh
+
+
 if __name__ == "__main__":
     sys.path.append(os.path.join(ROOT_DIR, "sunrgbd"))
     from sunrgbd_detection_dataset import SunrgbdDetectionVotesDataset, DC
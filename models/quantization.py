@@ -0,0 +1,321 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+""" Dynamic int8 quantization of VoteNet for CPU inference.
+
+The SharedMLPs of the SA/FP modules and the proposal head conv1..conv3 are
+stacks of 1x1 convs, i.e. dense matmuls over the channels. After folding the
+BatchNorms, quantize_votenet replaces such a unit by QuantizedPointwise, which
+runs the convs as dynamically quantized int8 linear layers on channels last
+features. Calibration runs a handful of scenes through the float model and
+keeps the int8 version of a unit only if its relative output error stays below
+a tolerance and it is faster than the float unit at the calibration shapes.
+The mAP@0.25/0.5 of the float and the quantized model on the calibration
+scenes are reported through APCalculator. The latency check makes the chosen
+units depend on the machine load, so processes that must score with the same
+model calibrate once and rebuild it from the unit names with quantize_units.
+
+MC dropout is kept: the quantized model has the dropouts of the input model
+in the same mode, so it can replace the scoring model of utils/pool_scoring.py.
+Dynamic quantization only has CPU kernels.
+
+Usage example:
+python models/quantization.py --dataset scannet --checkpoint_path log_scannet --num_scenes 8
+"""
+
+import os
+import sys
+import time
+import copy
+import argparse
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, Subset
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BASE_DIR)
+sys.path.append(BASE_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "pointnet2"))
+import pytorch_utils as pt_utils
+from inference_export import fuse_conv_bn
+from ap_helper import APCalculator, parse_predictions, parse_groundtruths
+from detector_cli import AP_IOU_THRESHOLDS, CONFIG_DICT
+
+# single 1x1 convs of the proposal head, the SharedMLPs are found by type
+QUANTIZABLE_CONVS = ["pnet.conv1", "pnet.conv2", "pnet.conv3"]
+
+
+def _is_pointwise(module):
+    return (
+        isinstance(module, (nn.Conv1d, nn.Conv2d))
+        and all(k == 1 for k in module.kernel_size)
+        and all(s == 1 for s in module.stride)
+        and all(p == 0 for p in module.padding)
+        and all(d == 1 for d in module.dilation)
+        and module.groups == 1
+    )
+
+
+def _leaves(module):
+    # not module.modules(), which yields the ReLU instance shared by all layers
+    # of a SharedMLP only once
+    children = list(module.children())
+    if len(children) == 0:
+        return [module]
+    return [leaf for child in children for leaf in _leaves(child)]
+
+
+def pointwise_layers(unit):
+    """The leaf modules of unit in execution order if it only consists of
+    1x1 convs, ReLUs and identities (folded BatchNorms), else None."""
+    leaves = _leaves(unit)
+    for m in leaves:
+        if not (_is_pointwise(m) or isinstance(m, (nn.ReLU, nn.Identity))):
+            return None
+    if not any(_is_pointwise(m) for m in leaves):
+        return None
+    return leaves
+
+
+class QuantizedPointwise(nn.Module):
+    """Stack of 1x1 convs and ReLUs as dynamic int8 linear layers. Takes and
+    returns (B, C, ...) features like the convs, the channels are moved last
+    once for the whole stack. The output stays a channels last view, copying
+    it back to a contiguous (B, C, ...) layout costs more than the int8 matmuls
+    save; the pooling that follows in the SA modules reads it as is."""
+
+    def __init__(self, layers):
+        super().__init__()
+        modules = []
+        for m in layers:
+            if isinstance(m, nn.Identity):
+                continue
+            if isinstance(m, nn.ReLU):
+                modules.append(nn.ReLU(inplace=True))
+                continue
+            linear = nn.Linear(m.in_channels, m.out_channels, bias=m.bias is not None)
+            linear.weight.data.copy_(m.weight.data.flatten(1))
+            if m.bias is not None:
+                linear.bias.data.copy_(m.bias.data)
+            modules.append(linear)
+        self.layers = torch.ao.quantization.quantize_dynamic(
+            nn.Sequential(*modules), {nn.Linear}, dtype=torch.qint8
+        )
+
+    def forward(self, x):
+        return self.layers(x.movedim(1, -1)).movedim(-1, 1)
+
+
+def quantizable_units(net):
+    """Names of the modules of net that quantize_votenet may replace."""
+    names = []
+    for name, module in net.named_modules():
+        if isinstance(module, pt_utils.SharedMLP) or name in QUANTIZABLE_CONVS:
+            names.append(name)
+    return names
+
+
+def _set_module(model, name, module):
+    parent_name, _, child = name.rpartition(".")
+    parent = model.get_submodule(parent_name) if parent_name else model
+    setattr(parent, child, module)
+
+
+class _DropoutsOff(object):
+    """Puts every dropout of model in eval mode and restores their modes."""
+
+    def __init__(self, model):
+        self.dropouts = [m for m in model.modules() if isinstance(m, nn.Dropout)]
+
+    def __enter__(self):
+        self.modes = [m.training for m in self.dropouts]
+        for m in self.dropouts:
+            m.eval()
+
+    def __exit__(self, *args):
+        for m, mode in zip(self.dropouts, self.modes):
+            m.train(mode)
+
+
+def _latency(fn, x, repeat):
+    fn(x)
+    start = time.time()
+    for _ in range(repeat):
+        fn(x)
+    return (time.time() - start) / repeat
+
+
+def _record_inputs(net, names, point_clouds):
+    """Input of every named unit in one forward pass of point_clouds."""
+    inputs = {}
+    hooks = [
+        net.get_submodule(name).register_forward_pre_hook(
+            lambda m, args, name=name: inputs.setdefault(name, args[0])
+        )
+        for name in names
+    ]
+    try:
+        net({"point_clouds": point_clouds})
+    finally:
+        for h in hooks:
+            h.remove()
+    return inputs
+
+
+def quantize_votenet(net, point_clouds, tolerance=0.05, require_speedup=True, repeat=3):
+    """Int8 copy of a CPU VoteNet, calibrated on point_clouds (B,N,3+C).
+
+    Args:
+        net: VoteNet or BoxNet in eval mode, the dropout modes are kept
+        tolerance: largest relative L2 error of a unit output
+        require_speedup: keep only units that are faster in int8
+    Returns:
+        the quantized copy and {unit name: dict} with the relative error, the
+        float and int8 latencies and whether the unit was quantized
+    """
+    assert not point_clouds.is_cuda, "dynamic quantization only runs on CPU"
+    qnet = copy.deepcopy(net)
+    fuse_conv_bn(qnet)
+    names = [n for n in quantizable_units(qnet) if pointwise_layers(qnet.get_submodule(n))]
+    report = {}
+    with torch.no_grad(), _DropoutsOff(qnet):
+        inputs = _record_inputs(qnet, names, point_clouds)
+        for name in names:
+            if name not in inputs:
+                # not used by this configuration, e.g. a disabled head
+                continue
+            unit = qnet.get_submodule(name)
+            quantized = QuantizedPointwise(pointwise_layers(unit))
+            x = inputs[name]
+            expected = unit(x)
+            error = float((quantized(x) - expected).norm() / expected.norm().clamp(min=1e-12))
+            float_time = _latency(unit, x, repeat)
+            int8_time = _latency(quantized, x, repeat)
+            keep = error <= tolerance and (not require_speedup or int8_time < float_time)
+            if keep:
+                _set_module(qnet, name, quantized)
+            report[name] = {
+                "error": error,
+                "float_latency": float_time,
+                "int8_latency": int8_time,
+                "quantized": keep,
+            }
+    return qnet, report
+
+
+def quantize_units(net, names):
+    """Int8 copy of a CPU VoteNet with exactly the named units of
+    quantizable_units quantized, without calibration."""
+    qnet = copy.deepcopy(net)
+    fuse_conv_bn(qnet)
+    for name in names:
+        layers = pointwise_layers(qnet.get_submodule(name))
+        if layers is None:
+            raise ValueError("%s is not a quantizable unit" % (name))
+        _set_module(qnet, name, QuantizedPointwise(layers))
+    return qnet
+
+
+def quantized_unit_names(report):
+    """Names of the units quantize_votenet kept in int8."""
+    return [name for name, unit in report.items() if unit["quantized"]]
+
+
+def evaluate_map(nets, dataloader, config_dict, ap_iou_thresholds=AP_IOU_THRESHOLDS):
+    """mAP of every net of nets on dataloader, dropouts disabled.
+
+    Returns:
+        list with one {iou threshold: mAP} dict per net
+    """
+    calculators = [[APCalculator(t, config_dict["dataset_config"].class2type) for t in ap_iou_thresholds] for _ in nets]
+    for batch_data_label in dataloader:
+        for net, ap_calculators in zip(nets, calculators):
+            with torch.no_grad(), _DropoutsOff(net):
+                end_points = net({"point_clouds": batch_data_label["point_clouds"]})
+            for key in batch_data_label:
+                if key not in end_points:
+                    end_points[key] = batch_data_label[key]
+            batch_pred_map_cls = parse_predictions(end_points, config_dict)
+            batch_gt_map_cls = parse_groundtruths(end_points, config_dict)
+            for ap_calculator in ap_calculators:
+                ap_calculator.step(batch_pred_map_cls, batch_gt_map_cls)
+    return [
+        {t: c.compute_metrics()["mAP"] for t, c in zip(ap_iou_thresholds, ap_calculators)}
+        for ap_calculators in calculators
+    ]
+
+
+def calibration_loader(dataset, num_scenes, batch_size):
+    """DataLoader over the first num_scenes scenes of dataset."""
+    scenes = Subset(dataset, range(min(num_scenes, len(dataset))))
+    return DataLoader(scenes, batch_size=batch_size, shuffle=False, num_workers=0)
+
+
+def quantize_with_calibration(net, dataloader, dataset_config, tolerance=0.05, require_speedup=True):
+    """Calibrates quantize_votenet on the first batch of dataloader and
+    compares the mAP of net and of the quantized model on all its batches.
+
+    Returns:
+        the quantized model and a report with the per unit results ("units")
+        and the float/int8 mAP and their difference per IoU threshold ("mAP")
+    """
+    first = next(iter(dataloader))
+    qnet, units = quantize_votenet(net, first["point_clouds"], tolerance, require_speedup)
+    config_dict = dict(CONFIG_DICT, dataset_config=dataset_config)
+    float_map, int8_map = evaluate_map([net, qnet], dataloader, config_dict)
+    report = {
+        "units": units,
+        "mAP": {
+            t: {"float": float_map[t], "int8": int8_map[t], "delta": int8_map[t] - float_map[t]}
+            for t in AP_IOU_THRESHOLDS
+        },
+    }
+    return qnet, report
+
+
+def print_report(report):
+    for name, unit in report["units"].items():
+        print(
+            "%-40s error %.4f float %7.1f ms int8 %7.1f ms %s"
+            % (
+                name,
+                unit["error"],
+                1000 * unit["float_latency"],
+                1000 * unit["int8_latency"],
+                "int8" if unit["quantized"] else "float",
+            )
+        )
+    for t, m in report["mAP"].items():
+        print("mAP@%.2f float %.4f int8 %.4f delta %+.4f" % (t, m["float"], m["int8"], m["delta"]))
+
+
+if __name__ == "__main__":
+    from detector_cli import add_model_args, dataset_config, make_dataset, load_detector
+
+    parser = argparse.ArgumentParser()
+    add_model_args(parser)
+    parser.add_argument("--split", default="val", help="Split of the calibration scenes [default: val]")
+    parser.add_argument("--num_scenes", type=int, default=8, help="Number of calibration scenes [default: 8]")
+    parser.add_argument("--batch_size", type=int, default=4)
+    parser.add_argument("--tolerance", type=float, default=0.05, help="Largest relative error of a quantized unit [default: 0.05]")
+    parser.add_argument("--num_samples", type=int, default=5, help="MC dropout passes of the throughput comparison [default: 5]")
+    FLAGS = parser.parse_args()
+
+    DC = dataset_config(FLAGS)
+    dataset = make_dataset(FLAGS, FLAGS.split)
+    net = load_detector(FLAGS, DC, torch.device("cpu"))
+    net.eval()
+    net.enable_dropouts()
+
+    dataloader = calibration_loader(dataset, FLAGS.num_scenes, FLAGS.batch_size)
+    qnet, report = quantize_with_calibration(net, dataloader, DC, FLAGS.tolerance)
+    print_report(report)
+
+    point_clouds = next(iter(dataloader))["point_clouds"]
+    with torch.no_grad():
+        for name, model in [("float", net), ("int8", qnet)]:
+            mc = lambda x: [model({"point_clouds": x}) for _ in range(FLAGS.num_samples)]
+            latency = _latency(mc, point_clouds, 1) / point_clouds.shape[0]
+            print("%s: %.1f ms per scene for %d MC passes" % (name, 1000 * latency, FLAGS.num_samples))
@@ -120,6 +120,10 @@ class VoteNet(nn.Module):
         end_points["vote_features"] = features
         if "name" in inputs.keys():
             end_points["names"] = [n for n in inputs["name"]]
+        if "proposal_inds" in inputs:
+            # decode the proposals kept by the objectness gate of an earlier
+            # MC dropout sample, see ProposalModule.select_proposals
+            end_points["proposal_inds"] = inputs["proposal_inds"]
         end_points = self.pnet(xyz, features, end_points)
 
         return end_points
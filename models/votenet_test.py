@@ -0,0 +1,322 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+""" Testing that the VoteNet forward and loss do not depend on CUDA. """
+
+import torch
+import torch.nn as nn
+import numpy as np
+
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BASE_DIR)
+sys.path.append(BASE_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "utils"))
+from mixed_precision import autocast
+from votenet import VoteNet
+from backbone_module import Pointnet2Backbone, set_activation_checkpointing, CHECKPOINT_STAGES
+from proposal_module import set_proposal_gate
+from loss_helper import get_loss
+from inference_export import optimize_for_inference, InferenceVoteNet, OUTPUT_KEYS
+from quantization import (
+    quantize_votenet,
+    quantize_units,
+    quantized_unit_names,
+    quantizable_units,
+    QuantizedPointwise,
+)
+
+
+class _Config(object):
+    num_class = 3
+    num_heading_bin = 1
+    num_size_cluster = 3
+    mean_size_arr = np.array([[0.5, 0.5, 0.5], [1.0, 0.8, 0.6], [2.0, 1.0, 1.0]])
+
+
+def _no_cuda(*args, **kwargs):
+    raise AssertionError(".cuda() called in the forward path")
+
+
+def _labels(B, N, K2, config):
+    center_label = torch.rand(B, K2, 3) * 2
+    size_class_label = torch.randint(0, config.num_size_cluster, (B, K2))
+    return {
+        "center_label": center_label,
+        "heading_class_label": torch.zeros(B, K2, dtype=torch.long),
+        "heading_residual_label": torch.zeros(B, K2),
+        "size_class_label": size_class_label,
+        "size_residual_label": torch.rand(B, K2, 3) * 0.1,
+        "sem_cls_label": size_class_label.clone(),
+        "box_label_mask": torch.ones(B, K2),
+        "vote_label": torch.rand(B, N, 9),
+        "vote_label_mask": torch.randint(0, 2, (B, N)),
+    }
+
+
+def test_cpu_forward_and_loss():
+    """Forward, decoding and loss on CPU with Tensor.cuda and Module.cuda
+    disabled, so any hardcoded device move fails the test."""
+    torch.manual_seed(0)
+    config = _Config()
+    B, N, K2 = 2, 2048, 4
+    for sampling in ["vote_fps", "seed_fps", "random"]:
+        net = VoteNet(
+            config.num_class,
+            config.num_heading_bin,
+            config.num_size_cluster,
+            config.mean_size_arr,
+            num_proposal=16,
+            sampling=sampling,
+            log_var=True,
+        )
+        inputs = {"point_clouds": torch.rand(B, N, 3) * 2}
+        tensor_cuda, module_cuda = torch.Tensor.cuda, nn.Module.cuda
+        torch.Tensor.cuda, nn.Module.cuda = _no_cuda, _no_cuda
+        try:
+            end_points = net(inputs)
+            end_points.update(_labels(B, N, K2, config))
+            loss, end_points = get_loss(end_points, config)
+            loss.backward()
+        finally:
+            torch.Tensor.cuda, nn.Module.cuda = tensor_cuda, module_cuda
+
+        assert torch.isfinite(loss)
+        assert end_points["size_residuals"].device == torch.device("cpu")
+        expected = end_points["size_residuals_normalized"] * torch.from_numpy(
+            config.mean_size_arr.astype(np.float32)
+        )
+        assert torch.allclose(end_points["size_residuals"], expected)
+
+
+def _gather_replicas(outputs):
+    """What nn.DataParallel's gather does with the end_points of the replicas:
+    every tensor is concatenated along dim 0."""
+    gathered = {}
+    for key, value in outputs[0].items():
+        if torch.is_tensor(value):
+            gathered[key] = torch.cat([out[key] for out in outputs], 0)
+        else:
+            gathered[key] = value
+    return gathered
+
+
+def test_data_parallel_gathered_loss():
+    """The loss of end_points gathered from 2 replicas equals the loss of one
+    forward over the whole batch, so no per-model constant is gathered into a
+    (num_size_cluster*num_replicas,3) table."""
+    torch.manual_seed(0)
+    config = _Config()
+    B, N, K2 = 4, 2048, 4
+    net = VoteNet(
+        config.num_class,
+        config.num_heading_bin,
+        config.num_size_cluster,
+        config.mean_size_arr,
+        num_proposal=16,
+    ).eval()
+    point_clouds = torch.rand(B, N, 3) * 2
+    labels = _labels(B, N, K2, config)
+    with torch.no_grad():
+        end_points = net({"point_clouds": point_clouds})
+        replicas = [
+            net({"point_clouds": point_clouds[i : i + B // 2]}) for i in [0, B // 2]
+        ]
+    for key, value in end_points.items():
+        if torch.is_tensor(value):
+            assert value.shape[0] == B, key
+    gathered = _gather_replicas(replicas)
+    end_points.update(labels)
+    gathered.update(labels)
+    loss, end_points = get_loss(end_points, config)
+    gathered_loss, gathered = get_loss(gathered, config)
+    assert torch.allclose(loss, gathered_loss, atol=1e-5)
+    assert torch.allclose(end_points["size_reg_loss"], gathered["size_reg_loss"], atol=1e-5)
+
+
+def test_optimize_for_inference():
+    """Folded BatchNorms and removed dropouts give the outputs of eval mode."""
+    torch.manual_seed(0)
+    config = _Config()
+    net = VoteNet(
+        config.num_class,
+        config.num_heading_bin,
+        config.num_size_cluster,
+        config.mean_size_arr,
+        input_feature_dim=1,
+        num_proposal=16,
+        sampling="seed_fps",
+    )
+    point_clouds = torch.rand(2, 2048, 4) * 2
+    with torch.no_grad():
+        # non trivial running statistics
+        net({"point_clouds": point_clouds})
+        net.eval()
+        fused = optimize_for_inference(net)
+        assert not any(
+            isinstance(m, (nn.modules.batchnorm._BatchNorm, nn.Dropout))
+            for m in fused.modules()
+        )
+        expected = InferenceVoteNet(net, OUTPUT_KEYS)(point_clouds)
+        outputs = InferenceVoteNet(fused, OUTPUT_KEYS)(point_clouds)
+    for key, a, b in zip(OUTPUT_KEYS, expected, outputs):
+        assert torch.allclose(a, b, atol=1e-4), key
+
+
+def test_quantize_votenet():
+    """All SharedMLPs and proposal convs are replaced by int8 units, the MC
+    dropouts stay on and the outputs stay close to the float model."""
+    torch.manual_seed(0)
+    config = _Config()
+    net = VoteNet(
+        config.num_class,
+        config.num_heading_bin,
+        config.num_size_cluster,
+        config.mean_size_arr,
+        input_feature_dim=1,
+        num_proposal=16,
+        sampling="seed_fps",
+    )
+    point_clouds = torch.rand(2, 2048, 4) * 2
+    with torch.no_grad():
+        net({"point_clouds": point_clouds})
+        net.eval()
+        net.enable_dropouts()
+        qnet, report = quantize_votenet(
+            net, point_clouds, tolerance=1.0, require_speedup=False
+        )
+        assert sorted(report) == sorted(quantizable_units(net))
+        for name in report:
+            assert isinstance(qnet.get_submodule(name), QuantizedPointwise), name
+            assert report[name]["error"] < 0.2, name
+        assert qnet.pnet.drop1.training and qnet.pnet.drop2.training
+
+        net.pnet.drop1.eval(), net.pnet.drop2.eval()
+        qnet.pnet.drop1.eval(), qnet.pnet.drop2.eval()
+        expected = net({"point_clouds": point_clouds})
+        outputs = qnet({"point_clouds": point_clouds})
+        # the unit names rebuild the same model without calibration
+        rebuilt = quantize_units(net, quantized_unit_names(report))
+        rebuilt.pnet.drop1.eval(), rebuilt.pnet.drop2.eval()
+        rebuilt_outputs = rebuilt({"point_clouds": point_clouds})
+    for key in ["seed_features", "objectness_scores", "sem_cls_scores"]:
+        error = (outputs[key] - expected[key]).norm() / expected[key].norm()
+        assert error < 0.1, key
+        assert torch.equal(rebuilt_outputs[key], outputs[key]), key
+
+
+def test_bf16_autocast():
+    """Under bf16 autocast the decoded outputs and the loss stay fp32 and
+    close to the fp32 ones, and the backward pass runs."""
+    torch.manual_seed(0)
+    config = _Config()
+    B, N, K2 = 2, 2048, 4
+    net = VoteNet(
+        config.num_class,
+        config.num_heading_bin,
+        config.num_size_cluster,
+        config.mean_size_arr,
+        num_proposal=16,
+        sampling="seed_fps",
+        log_var=True,
+    )
+    inputs = {"point_clouds": torch.rand(B, N, 3) * 2}
+    labels = _labels(B, N, K2, config)
+    with torch.no_grad():
+        net(inputs)
+    net.eval()
+    losses = {}
+    for precision in ["fp32", "bf16"]:
+        with autocast("cpu", precision):
+            end_points = net(inputs)
+        for key in ["center", "objectness_scores", "size_residuals", "log_vars"]:
+            assert end_points[key].dtype == torch.float32, key
+        end_points.update(labels)
+        losses[precision], end_points = get_loss(end_points, config)
+    assert abs(losses["bf16"].item() - losses["fp32"].item()) < 0.05 * losses["fp32"].item()
+    losses["bf16"].backward()
+    assert all(torch.isfinite(p.grad).all() for p in net.parameters() if p.grad is not None)
+
+
+def test_proposal_gate():
+    """The gated head decodes the proposals above the threshold exactly as the
+    full head, and reuses given proposal_inds."""
+    torch.manual_seed(0)
+    config = _Config()
+    net = VoteNet(
+        config.num_class,
+        config.num_heading_bin,
+        config.num_size_cluster,
+        config.mean_size_arr,
+        num_proposal=32,
+        sampling="seed_fps",
+    )
+    inputs = {"point_clouds": torch.rand(2, 2048, 3) * 2}
+    with torch.no_grad():
+        net(inputs)
+        net.eval()
+        full = net(inputs)
+        prob = torch.softmax(full["objectness_scores"], -1)[:, :, 1]
+        thresh = float(prob.mean())
+        set_proposal_gate(net, conf_thresh=thresh)
+        gated = net(inputs)
+    inds = gated["proposal_inds"].long()
+    assert inds.shape[1] == int((prob >= thresh).sum(1).max())
+    for b in range(2):
+        # every proposal above the threshold is kept
+        kept = set(inds[b].tolist())
+        assert set(torch.nonzero(prob[b] >= thresh)[:, 0].tolist()) <= kept
+    for key in ["center", "objectness_scores", "sem_cls_scores", "size_residuals"]:
+        expected = torch.stack([full[key][b, inds[b]] for b in range(2)])
+        assert torch.allclose(gated[key], expected, atol=1e-5), key
+
+    with torch.no_grad():
+        set_proposal_gate(net, top_k=4)
+        first = net(inputs)
+        again = net(dict(inputs, proposal_inds=first["proposal_inds"]))
+        net.train()
+        training = net(inputs)
+    assert first["center"].shape[1] == 4
+    assert torch.equal(again["proposal_inds"], first["proposal_inds"])
+    assert torch.allclose(again["center"], first["center"])
+    # training always decodes all proposals
+    assert training["center"].shape[1] == 32
+
+
+def test_activation_checkpointing():
+    """Checkpointing every backbone stage gives the outputs, gradients and
+    BatchNorm running statistics of the plain training step."""
+    torch.manual_seed(0)
+    point_clouds = torch.rand(2, 2048, 4) * 2
+    results = []
+    for stages in [[], CHECKPOINT_STAGES]:
+        torch.manual_seed(1)
+        net = Pointnet2Backbone(input_feature_dim=1)
+        set_activation_checkpointing(net, stages)
+        end_points = net(point_clouds)
+        end_points["fp2_features"].pow(2).mean().backward()
+        grads = {n: p.grad.clone() for n, p in net.named_parameters()}
+        results.append((end_points, grads, net.state_dict()))
+    (expected, expected_grads, expected_state), (end_points, grads, state) = results
+    for key in ["sa1_inds", "fp2_inds"]:
+        assert torch.equal(end_points[key], expected[key]), key
+    assert torch.allclose(end_points["fp2_features"], expected["fp2_features"], atol=1e-5)
+    for name in expected_grads:
+        assert torch.allclose(grads[name], expected_grads[name], atol=1e-5), name
+    for name in expected_state:
+        # the recomputation does not update the running statistics again
+        assert torch.allclose(state[name], expected_state[name]), name
+
+
+if __name__ == "__main__":
+    test_cpu_forward_and_loss()
+    test_data_parallel_gathered_loss()
+    test_optimize_for_inference()
+    test_quantize_votenet()
+    test_bf16_autocast()
+    test_proposal_gate()
+    test_activation_checkpointing()
@@ -8,3 +8,5 @@
 
 at::Tensor ball_query(at::Tensor new_xyz, at::Tensor xyz, const float radius,
                       const int nsample);
+at::Tensor ball_query_grid(at::Tensor new_xyz, at::Tensor xyz,
+                           const float radius, const int nsample);
@@ -6,9 +6,17 @@
 #include "ball_query.h"
 #include "utils.h"
 
+#ifdef WITH_CUDA
 void query_ball_point_kernel_wrapper(int b, int n, int m, float radius,
                                      int nsample, const float *new_xyz,
                                      const float *xyz, int *idx);
+#endif
+void query_ball_point_cpu_kernel_wrapper(int b, int n, int m, float radius,
+                                         int nsample, const float *new_xyz,
+                                         const float *xyz, int *idx);
+void query_ball_point_grid_cpu_kernel_wrapper(int b, int n, int m, float radius,
+                                              int nsample, const float *new_xyz,
+                                              const float *xyz, int *idx);
 
 at::Tensor ball_query(at::Tensor new_xyz, at::Tensor xyz, const float radius,
                       const int nsample) {
@@ -26,12 +34,40 @@ at::Tensor ball_query(at::Tensor new_xyz, at::Tensor xyz, const float radius,
                    at::device(new_xyz.device()).dtype(at::ScalarType::Int));
 
   if (new_xyz.type().is_cuda()) {
+#ifdef WITH_CUDA
     query_ball_point_kernel_wrapper(xyz.size(0), xyz.size(1), new_xyz.size(1),
                                     radius, nsample, new_xyz.data<float>(),
                                     xyz.data<float>(), idx.data<int>());
+#else
+    AT_CHECK(false, "Not compiled with CUDA support");
+#endif
   } else {
-    AT_CHECK(false, "CPU not supported");
+    query_ball_point_cpu_kernel_wrapper(xyz.size(0), xyz.size(1), new_xyz.size(1),
+                                        radius, nsample, new_xyz.data<float>(),
+                                        xyz.data<float>(), idx.data<int>());
   }
 
   return idx;
 }
+
+// Same result as ball_query. CPU tensors go through the hash grid kernel,
+// whose cost depends on the number of points around a query instead of n;
+// CUDA tensors use the ball_query kernel.
+at::Tensor ball_query_grid(at::Tensor new_xyz, at::Tensor xyz,
+                           const float radius, const int nsample) {
+  if (new_xyz.type().is_cuda() || radius <= 0) {
+    return ball_query(new_xyz, xyz, radius, nsample);
+  }
+  CHECK_CONTIGUOUS(new_xyz);
+  CHECK_CONTIGUOUS(xyz);
+  CHECK_IS_FLOAT(new_xyz);
+  CHECK_IS_FLOAT(xyz);
+
+  at::Tensor idx =
+      torch::zeros({new_xyz.size(0), new_xyz.size(1), nsample},
+                   at::device(new_xyz.device()).dtype(at::ScalarType::Int));
+  query_ball_point_grid_cpu_kernel_wrapper(
+      xyz.size(0), xyz.size(1), new_xyz.size(1), radius, nsample,
+      new_xyz.data<float>(), xyz.data<float>(), idx.data<int>());
+  return idx;
+}
@@ -0,0 +1,161 @@
+// Copyright (c) Facebook, Inc. and its affiliates.
+// 
+// This source code is licensed under the MIT license found in the
+// LICENSE file in the root directory of this source tree.
+
+#include <ATen/Parallel.h>
+#include <algorithm>
+#include <cmath>
+#include <vector>
+
+// input: new_xyz(b, m, 3) xyz(b, n, 3)
+// output: idx(b, m, nsample)
+// Same result as query_ball_point_kernel in ball_query_gpu.cu, parallelized
+// over all query points of all batches.
+void query_ball_point_cpu_kernel_wrapper(int b, int n, int m, float radius,
+                                         int nsample, const float *new_xyz,
+                                         const float *xyz, int *idx) {
+  const float radius2 = radius * radius;
+  at::parallel_for(0, b * m, 64, [&](int64_t begin, int64_t end) {
+    for (int64_t query = begin; query < end; ++query) {
+      const int batch_index = query / m;
+      const float *points = xyz + batch_index * n * 3;
+      const float new_x = new_xyz[query * 3 + 0];
+      const float new_y = new_xyz[query * 3 + 1];
+      const float new_z = new_xyz[query * 3 + 2];
+      int *out = idx + query * nsample;
+      for (int k = 0, cnt = 0; k < n && cnt < nsample; ++k) {
+        const float x = points[k * 3 + 0];
+        const float y = points[k * 3 + 1];
+        const float z = points[k * 3 + 2];
+        const float d2 = (new_x - x) * (new_x - x) + (new_y - y) * (new_y - y) +
+                         (new_z - z) * (new_z - z);
+        if (d2 < radius2) {
+          if (cnt == 0) {
+            for (int l = 0; l < nsample; ++l) {
+              out[l] = k;
+            }
+          }
+          out[cnt] = k;
+          ++cnt;
+        }
+      }
+    }
+  });
+}
+
+// input: new_xyz(b, m, 3) xyz(b, n, 3)
+// output: idx(b, m, nsample)
+// Same result as query_ball_point_cpu_kernel_wrapper, but the points of every
+// batch are first bucketed into a hash grid with cells of size radius, so a
+// query only visits the (up to 27) buckets of the cells around it. Buckets
+// list their points in index order and the in-ball candidates are sorted by
+// index, which keeps the first nsample semantics of the brute force kernel.
+// Hash collisions only add candidates that fail the distance test. The cells
+// are slightly larger than radius so that rounding in the cell coordinates
+// can not move an in-ball point out of the 3x3x3 neighborhood.
+void query_ball_point_grid_cpu_kernel_wrapper(int b, int n, int m, float radius,
+                                              int nsample, const float *new_xyz,
+                                              const float *xyz, int *idx) {
+  const float radius2 = radius * radius;
+  const float cell_size = radius * 1.001f;
+  int64_t table_size = 1;
+  while (table_size < 2 * (int64_t)n) {
+    table_size <<= 1;
+  }
+  const uint64_t mask = table_size - 1;
+  auto bucket_of = [mask](int64_t ix, int64_t iy, int64_t iz) {
+    return (int64_t)(((uint64_t)ix * 73856093ULL) ^ ((uint64_t)iy * 19349663ULL) ^
+                     ((uint64_t)iz * 83492791ULL)) & mask;
+  };
+
+  std::vector<float> lower(b * 3);
+  std::vector<int64_t> starts(b * (table_size + 1));
+  std::vector<int> sorted_points(b * n);
+  at::parallel_for(0, b, 1, [&](int64_t begin, int64_t end) {
+    std::vector<int64_t> point_bucket(n);
+    for (int64_t batch_index = begin; batch_index < end; ++batch_index) {
+      const float *points = xyz + batch_index * n * 3;
+      float *lo = lower.data() + batch_index * 3;
+      for (int d = 0; d < 3; ++d) {
+        lo[d] = n > 0 ? points[d] : 0.f;
+      }
+      for (int k = 1; k < n; ++k) {
+        for (int d = 0; d < 3; ++d) {
+          lo[d] = std::min(lo[d], points[k * 3 + d]);
+        }
+      }
+      // counting sort by bucket, stable so every bucket is in index order
+      int64_t *start = starts.data() + batch_index * (table_size + 1);
+      for (int k = 0; k < n; ++k) {
+        const int64_t ix = (int64_t)std::floor((points[k * 3 + 0] - lo[0]) / cell_size);
+        const int64_t iy = (int64_t)std::floor((points[k * 3 + 1] - lo[1]) / cell_size);
+        const int64_t iz = (int64_t)std::floor((points[k * 3 + 2] - lo[2]) / cell_size);
+        point_bucket[k] = bucket_of(ix, iy, iz);
+        ++start[point_bucket[k] + 1];
+      }
+      for (int64_t t = 0; t < table_size; ++t) {
+        start[t + 1] += start[t];
+      }
+      std::vector<int64_t> fill(start, start + table_size);
+      int *out = sorted_points.data() + batch_index * n;
+      for (int k = 0; k < n; ++k) {
+        out[fill[point_bucket[k]]++] = k;
+      }
+    }
+  });
+
+  at::parallel_for(0, b * m, 64, [&](int64_t begin, int64_t end) {
+    std::vector<int> candidates;
+    int64_t visited[27];
+    for (int64_t query = begin; query < end; ++query) {
+      const int batch_index = query / m;
+      const float *points = xyz + batch_index * n * 3;
+      const float *lo = lower.data() + batch_index * 3;
+      const int64_t *start = starts.data() + batch_index * (table_size + 1);
+      const int *bucket_points = sorted_points.data() + batch_index * n;
+      const float new_x = new_xyz[query * 3 + 0];
+      const float new_y = new_xyz[query * 3 + 1];
+      const float new_z = new_xyz[query * 3 + 2];
+      const int64_t cx = (int64_t)std::floor((new_x - lo[0]) / cell_size);
+      const int64_t cy = (int64_t)std::floor((new_y - lo[1]) / cell_size);
+      const int64_t cz = (int64_t)std::floor((new_z - lo[2]) / cell_size);
+
+      candidates.clear();
+      int num_visited = 0;
+      for (int64_t ix = cx - 1; ix <= cx + 1; ++ix) {
+        for (int64_t iy = cy - 1; iy <= cy + 1; ++iy) {
+          for (int64_t iz = cz - 1; iz <= cz + 1; ++iz) {
+            const int64_t bucket = bucket_of(ix, iy, iz);
+            // neighboring cells can share a bucket, visit it once
+            if (std::find(visited, visited + num_visited, bucket) !=
+                visited + num_visited) {
+              continue;
+            }
+            visited[num_visited++] = bucket;
+            for (int64_t t = start[bucket]; t < start[bucket + 1]; ++t) {
+              const int k = bucket_points[t];
+              const float x = points[k * 3 + 0];
+              const float y = points[k * 3 + 1];
+              const float z = points[k * 3 + 2];
+              const float d2 = (new_x - x) * (new_x - x) +
+                               (new_y - y) * (new_y - y) +
+                               (new_z - z) * (new_z - z);
+              if (d2 < radius2) {
+                candidates.push_back(k);
+              }
+            }
+          }
+        }
+      }
+
+      int *out = idx + query * nsample;
+      const int cnt = std::min((int)candidates.size(), nsample);
+      std::partial_sort(candidates.begin(), candidates.begin() + cnt,
+                        candidates.end());
+      for (int l = 0; l < nsample; ++l) {
+        out[l] = cnt == 0 ? 0 : (l < cnt ? candidates[l] : candidates[0]);
+      }
+    }
+  });
+}
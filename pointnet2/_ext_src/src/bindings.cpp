@@ -8,6 +8,41 @@
 #include "interpolate.h"
 #include "sampling.h"
 
+#include <torch/script.h>
+
+// The forward ops again as TorchScript operators. torch.jit.trace records a
+// Python autograd Function as a node that can not be saved, so pointnet2_utils
+// calls torch.ops.pointnet2.* while tracing and the traced module only needs
+// this library, not the Python sources. Scalars are double and int64_t as
+// required by the schema inference.
+namespace {
+
+at::Tensor furthest_point_sampling_op(at::Tensor points, int64_t nsamples) {
+  return furthest_point_sampling(points, nsamples);
+}
+
+at::Tensor ball_query_op(at::Tensor new_xyz, at::Tensor xyz, double radius,
+                         int64_t nsample) {
+  return ball_query(new_xyz, xyz, radius, nsample);
+}
+
+at::Tensor ball_query_grid_op(at::Tensor new_xyz, at::Tensor xyz,
+                              double radius, int64_t nsample) {
+  return ball_query_grid(new_xyz, xyz, radius, nsample);
+}
+
+static auto registry =
+    torch::RegisterOperators()
+        .op("pointnet2::furthest_point_sampling", &furthest_point_sampling_op)
+        .op("pointnet2::gather_points", &gather_points)
+        .op("pointnet2::ball_query", &ball_query_op)
+        .op("pointnet2::ball_query_grid", &ball_query_grid_op)
+        .op("pointnet2::group_points", &group_points)
+        .op("pointnet2::three_nn", &three_nn)
+        .op("pointnet2::three_interpolate", &three_interpolate);
+
+}  // namespace
+
 PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
   m.def("gather_points", &gather_points);
   m.def("gather_points_grad", &gather_points_grad);
@@ -18,6 +53,7 @@ PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
   m.def("three_interpolate_grad", &three_interpolate_grad);
 
   m.def("ball_query", &ball_query);
+  m.def("ball_query_grid", &ball_query_grid);
 
   m.def("group_points", &group_points);
   m.def("group_points_grad", &group_points_grad);
@@ -0,0 +1,45 @@
+// Copyright (c) Facebook, Inc. and its affiliates.
+// 
+// This source code is licensed under the MIT license found in the
+// LICENSE file in the root directory of this source tree.
+
+#include <ATen/Parallel.h>
+
+// CPU versions of the kernels in group_points_gpu.cu, parallelized over the
+// (batch, channel) rows of the outputs.
+
+// input: points(b, c, n) idx(b, npoints, nsample)
+// output: out(b, c, npoints, nsample)
+void group_points_cpu_kernel_wrapper(int b, int c, int n, int npoints,
+                                     int nsample, const float *points,
+                                     const int *idx, float *out) {
+  at::parallel_for(0, b * c, 1, [&](int64_t begin, int64_t end) {
+    for (int64_t row = begin; row < end; ++row) {
+      const int batch_index = row / c;
+      const float *points_row = points + row * n;
+      const int *idx_batch = idx + batch_index * npoints * nsample;
+      float *out_row = out + row * npoints * nsample;
+      for (int j = 0; j < npoints * nsample; ++j) {
+        out_row[j] = points_row[idx_batch[j]];
+      }
+    }
+  });
+}
+
+// input: grad_out(b, c, npoints, nsample), idx(b, npoints, nsample)
+// output: grad_points(b, c, n)
+void group_points_grad_cpu_kernel_wrapper(int b, int c, int n, int npoints,
+                                          int nsample, const float *grad_out,
+                                          const int *idx, float *grad_points) {
+  at::parallel_for(0, b * c, 1, [&](int64_t begin, int64_t end) {
+    for (int64_t row = begin; row < end; ++row) {
+      const int batch_index = row / c;
+      const float *grad_row = grad_out + row * npoints * nsample;
+      const int *idx_batch = idx + batch_index * npoints * nsample;
+      float *grad_points_row = grad_points + row * n;
+      for (int j = 0; j < npoints * nsample; ++j) {
+        grad_points_row[idx_batch[j]] += grad_row[j];
+      }
+    }
+  });
+}
@@ -6,6 +6,7 @@
 #include "interpolate.h"
 #include "utils.h"
 
+#ifdef WITH_CUDA
 void three_nn_kernel_wrapper(int b, int n, int m, const float *unknown,
                              const float *known, float *dist2, int *idx);
 void three_interpolate_kernel_wrapper(int b, int c, int m, int n,
@@ -15,6 +16,16 @@ void three_interpolate_grad_kernel_wrapper(int b, int c, int n, int m,
                                            const float *grad_out,
                                            const int *idx, const float *weight,
                                            float *grad_points);
+#endif
+void three_nn_cpu_kernel_wrapper(int b, int n, int m, const float *unknown,
+                                 const float *known, float *dist2, int *idx);
+void three_interpolate_cpu_kernel_wrapper(int b, int c, int m, int n,
+                                          const float *points, const int *idx,
+                                          const float *weight, float *out);
+void three_interpolate_grad_cpu_kernel_wrapper(int b, int c, int n, int m,
+                                               const float *grad_out,
+                                               const int *idx, const float *weight,
+                                               float *grad_points);
 
 std::vector<at::Tensor> three_nn(at::Tensor unknowns, at::Tensor knows) {
   CHECK_CONTIGUOUS(unknowns);
@@ -34,11 +45,17 @@ std::vector<at::Tensor> three_nn(at::Tensor unknowns, at::Tensor knows) {
                    at::device(unknowns.device()).dtype(at::ScalarType::Float));
 
   if (unknowns.type().is_cuda()) {
+#ifdef WITH_CUDA
     three_nn_kernel_wrapper(unknowns.size(0), unknowns.size(1), knows.size(1),
                             unknowns.data<float>(), knows.data<float>(),
                             dist2.data<float>(), idx.data<int>());
+#else
+    AT_CHECK(false, "Not compiled with CUDA support");
+#endif
   } else {
-    AT_CHECK(false, "CPU not supported");
+    three_nn_cpu_kernel_wrapper(unknowns.size(0), unknowns.size(1), knows.size(1),
+                                unknowns.data<float>(), knows.data<float>(),
+                                dist2.data<float>(), idx.data<int>());
   }
 
   return {dist2, idx};
@@ -63,12 +80,19 @@ at::Tensor three_interpolate(at::Tensor points, at::Tensor idx,
                    at::device(points.device()).dtype(at::ScalarType::Float));
 
   if (points.type().is_cuda()) {
+#ifdef WITH_CUDA
     three_interpolate_kernel_wrapper(
         points.size(0), points.size(1), points.size(2), idx.size(1),
         points.data<float>(), idx.data<int>(), weight.data<float>(),
         output.data<float>());
+#else
+    AT_CHECK(false, "Not compiled with CUDA support");
+#endif
   } else {
-    AT_CHECK(false, "CPU not supported");
+    three_interpolate_cpu_kernel_wrapper(
+        points.size(0), points.size(1), points.size(2), idx.size(1),
+        points.data<float>(), idx.data<int>(), weight.data<float>(),
+        output.data<float>());
   }
 
   return output;
@@ -92,12 +116,19 @@ at::Tensor three_interpolate_grad(at::Tensor grad_out, at::Tensor idx,
                    at::device(grad_out.device()).dtype(at::ScalarType::Float));
 
   if (grad_out.type().is_cuda()) {
+#ifdef WITH_CUDA
     three_interpolate_grad_kernel_wrapper(
         grad_out.size(0), grad_out.size(1), grad_out.size(2), m,
         grad_out.data<float>(), idx.data<int>(), weight.data<float>(),
         output.data<float>());
+#else
+    AT_CHECK(false, "Not compiled with CUDA support");
+#endif
   } else {
-    AT_CHECK(false, "CPU not supported");
+    three_interpolate_grad_cpu_kernel_wrapper(
+        grad_out.size(0), grad_out.size(1), grad_out.size(2), m,
+        grad_out.data<float>(), idx.data<int>(), weight.data<float>(),
+        output.data<float>());
   }
 
   return output;
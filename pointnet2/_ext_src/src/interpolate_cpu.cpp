@@ -0,0 +1,100 @@
+// Copyright (c) Facebook, Inc. and its affiliates.
+// 
+// This source code is licensed under the MIT license found in the
+// LICENSE file in the root directory of this source tree.
+
+#include <ATen/Parallel.h>
+
+// CPU versions of the kernels in interpolate_gpu.cu.
+
+// input: unknown(b, n, 3) known(b, m, 3)
+// output: dist2(b, n, 3), idx(b, n, 3)
+void three_nn_cpu_kernel_wrapper(int b, int n, int m, const float *unknown,
+                                 const float *known, float *dist2, int *idx) {
+  at::parallel_for(0, b * n, 64, [&](int64_t begin, int64_t end) {
+    for (int64_t query = begin; query < end; ++query) {
+      const int batch_index = query / n;
+      const float *points = known + batch_index * m * 3;
+      const float ux = unknown[query * 3 + 0];
+      const float uy = unknown[query * 3 + 1];
+      const float uz = unknown[query * 3 + 2];
+
+      double best1 = 1e40, best2 = 1e40, best3 = 1e40;
+      int besti1 = 0, besti2 = 0, besti3 = 0;
+      for (int k = 0; k < m; ++k) {
+        const float x = points[k * 3 + 0];
+        const float y = points[k * 3 + 1];
+        const float z = points[k * 3 + 2];
+        const float d =
+            (ux - x) * (ux - x) + (uy - y) * (uy - y) + (uz - z) * (uz - z);
+        if (d < best1) {
+          best3 = best2;
+          besti3 = besti2;
+          best2 = best1;
+          besti2 = besti1;
+          best1 = d;
+          besti1 = k;
+        } else if (d < best2) {
+          best3 = best2;
+          besti3 = besti2;
+          best2 = d;
+          besti2 = k;
+        } else if (d < best3) {
+          best3 = d;
+          besti3 = k;
+        }
+      }
+      dist2[query * 3 + 0] = best1;
+      dist2[query * 3 + 1] = best2;
+      dist2[query * 3 + 2] = best3;
+      idx[query * 3 + 0] = besti1;
+      idx[query * 3 + 1] = besti2;
+      idx[query * 3 + 2] = besti3;
+    }
+  });
+}
+
+// input: points(b, c, m), idx(b, n, 3), weight(b, n, 3)
+// output: out(b, c, n)
+void three_interpolate_cpu_kernel_wrapper(int b, int c, int m, int n,
+                                          const float *points, const int *idx,
+                                          const float *weight, float *out) {
+  at::parallel_for(0, b * c, 1, [&](int64_t begin, int64_t end) {
+    for (int64_t row = begin; row < end; ++row) {
+      const int batch_index = row / c;
+      const float *points_row = points + row * m;
+      const int *idx_batch = idx + batch_index * n * 3;
+      const float *weight_batch = weight + batch_index * n * 3;
+      float *out_row = out + row * n;
+      for (int j = 0; j < n; ++j) {
+        out_row[j] = points_row[idx_batch[j * 3 + 0]] * weight_batch[j * 3 + 0] +
+                     points_row[idx_batch[j * 3 + 1]] * weight_batch[j * 3 + 1] +
+                     points_row[idx_batch[j * 3 + 2]] * weight_batch[j * 3 + 2];
+      }
+    }
+  });
+}
+
+// input: grad_out(b, c, n), idx(b, n, 3), weight(b, n, 3)
+// output: grad_points(b, c, m)
+void three_interpolate_grad_cpu_kernel_wrapper(int b, int c, int n, int m,
+                                               const float *grad_out,
+                                               const int *idx,
+                                               const float *weight,
+                                               float *grad_points) {
+  // every (batch, channel) row is accumulated by one thread only
+  at::parallel_for(0, b * c, 1, [&](int64_t begin, int64_t end) {
+    for (int64_t row = begin; row < end; ++row) {
+      const int batch_index = row / c;
+      const float *grad_row = grad_out + row * n;
+      const int *idx_batch = idx + batch_index * n * 3;
+      const float *weight_batch = weight + batch_index * n * 3;
+      float *grad_points_row = grad_points + row * m;
+      for (int j = 0; j < n; ++j) {
+        grad_points_row[idx_batch[j * 3 + 0]] += grad_row[j] * weight_batch[j * 3 + 0];
+        grad_points_row[idx_batch[j * 3 + 1]] += grad_row[j] * weight_batch[j * 3 + 1];
+        grad_points_row[idx_batch[j * 3 + 2]] += grad_row[j] * weight_batch[j * 3 + 2];
+      }
+    }
+  });
+}
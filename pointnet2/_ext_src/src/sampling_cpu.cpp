@@ -0,0 +1,89 @@
+// Copyright (c) Facebook, Inc. and its affiliates.
+// 
+// This source code is licensed under the MIT license found in the
+// LICENSE file in the root directory of this source tree.
+
+#include <ATen/Parallel.h>
+#include <algorithm>
+
+// CPU versions of the kernels in sampling_gpu.cu, parallelized with
+// at::parallel_for over the independent rows of the outputs.
+
+// input: points(b, c, n) idx(b, m)
+// output: out(b, c, m)
+void gather_points_cpu_kernel_wrapper(int b, int c, int n, int npoints,
+                                      const float *points, const int *idx,
+                                      float *out) {
+  at::parallel_for(0, b * c, 1, [&](int64_t begin, int64_t end) {
+    for (int64_t row = begin; row < end; ++row) {
+      const int i = row / c;
+      const float *points_row = points + row * n;
+      float *out_row = out + row * npoints;
+      for (int j = 0; j < npoints; ++j) {
+        out_row[j] = points_row[idx[i * npoints + j]];
+      }
+    }
+  });
+}
+
+// input: grad_out(b, c, m) idx(b, m)
+// output: grad_points(b, c, n)
+void gather_points_grad_cpu_kernel_wrapper(int b, int c, int n, int npoints,
+                                           const float *grad_out,
+                                           const int *idx,
+                                           float *grad_points) {
+  // every (batch, channel) row is accumulated by one thread only
+  at::parallel_for(0, b * c, 1, [&](int64_t begin, int64_t end) {
+    for (int64_t row = begin; row < end; ++row) {
+      const int i = row / c;
+      const float *grad_row = grad_out + row * npoints;
+      float *grad_points_row = grad_points + row * n;
+      for (int j = 0; j < npoints; ++j) {
+        grad_points_row[idx[i * npoints + j]] += grad_row[j];
+      }
+    }
+  });
+}
+
+// Input dataset: (b, n, 3), tmp: (b, n)
+// Ouput idxs (b, m)
+void furthest_point_sampling_cpu_kernel_wrapper(int b, int n, int m,
+                                                const float *dataset,
+                                                float *temp, int *idxs) {
+  if (m <= 0) return;
+  at::parallel_for(0, b, 1, [&](int64_t begin, int64_t end) {
+    for (int64_t batch_index = begin; batch_index < end; ++batch_index) {
+      const float *points = dataset + batch_index * n * 3;
+      float *dists = temp + batch_index * n;
+      int *out = idxs + batch_index * m;
+
+      int old = 0;
+      out[0] = old;
+      for (int j = 1; j < m; j++) {
+        int besti = 0;
+        float best = -1;
+        const float x1 = points[old * 3 + 0];
+        const float y1 = points[old * 3 + 1];
+        const float z1 = points[old * 3 + 2];
+        for (int k = 0; k < n; k++) {
+          const float x2 = points[k * 3 + 0];
+          const float y2 = points[k * 3 + 1];
+          const float z2 = points[k * 3 + 2];
+          // same as the CUDA kernel: points at the origin are padding
+          const float mag = (x2 * x2) + (y2 * y2) + (z2 * z2);
+          if (mag <= 1e-3) continue;
+          const float d = (x2 - x1) * (x2 - x1) + (y2 - y1) * (y2 - y1) +
+                          (z2 - z1) * (z2 - z1);
+          const float d2 = std::min(d, dists[k]);
+          dists[k] = d2;
+          if (d2 > best) {
+            best = d2;
+            besti = k;
+          }
+        }
+        old = besti;
+        out[j] = old;
+      }
+    }
+  });
+}
@@ -0,0 +1,139 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+""" Pure PyTorch versions of the pointnet2 _ext operators.
+
+Every function has the signature and the result of the _ext binding with the
+same name (see _ext_src/src/bindings.cpp), so pointnet2_utils can use this
+module when the compiled extension is not available, and tests can use it as
+a reference for the kernels. Distance matrices are built in chunks of query
+points to bound memory.
+"""
+import torch
+
+# upper bound on the number of elements of one (B, chunk, N) distance block
+CHUNK_ELEMS = 1 << 24
+
+
+def _chunks(B, n_query, n_ref):
+    step = max(1, CHUNK_ELEMS // max(1, B * n_ref))
+    for start in range(0, n_query, step):
+        yield start, min(n_query, start + step)
+
+
+def _sq_dist(a, b):
+    """(B, n, 3), (B, m, 3) -> (B, n, m) squared distances, summed per axis
+    like the kernels."""
+    diff = a.unsqueeze(2) - b.unsqueeze(1)
+    return (diff * diff).sum(-1)
+
+
+def furthest_point_sampling(points, nsamples):
+    """points: (B, N, 3) -> (B, nsamples) int32 indices. Points closer than
+    sqrt(1e-3) to the origin are never picked, as in the CUDA kernel."""
+    B, N, _ = points.size()
+    idxs = torch.zeros(B, nsamples, dtype=torch.int32, device=points.device)
+    if nsamples <= 0:
+        return idxs
+    valid = (points * points).sum(-1) > 1e-3
+    dists = torch.full((B, N), 1e10, dtype=points.dtype, device=points.device)
+    batch = torch.arange(B, device=points.device)
+    old = torch.zeros(B, dtype=torch.long, device=points.device)
+    for j in range(1, nsamples):
+        diff = points - points[batch, old].unsqueeze(1)
+        dists = torch.where(valid, torch.min(dists, (diff * diff).sum(-1)), dists)
+        # argmax returns the first maximum, skipped points can only win if all are skipped
+        old = torch.where(valid, dists, torch.full_like(dists, -1)).argmax(1)
+        idxs[:, j] = old.int()
+    return idxs
+
+
+def gather_points(points, idx):
+    """points: (B, C, N), idx: (B, M) -> (B, C, M)"""
+    B, C, _ = points.size()
+    return torch.gather(points, 2, idx.long().unsqueeze(1).expand(B, C, idx.size(1)))
+
+
+def gather_points_grad(grad_out, idx, n):
+    B, C, M = grad_out.size()
+    grad_points = grad_out.new_zeros(B, C, n)
+    return grad_points.scatter_add_(2, idx.long().unsqueeze(1).expand(B, C, M), grad_out)
+
+
+def ball_query(new_xyz, xyz, radius, nsample):
+    """new_xyz: (B, M, 3), xyz: (B, N, 3) -> (B, M, nsample) int32 indices of
+    the first nsample points within radius, in index order. Missing slots are
+    filled with the first index, balls without points are all 0."""
+    B, M, _ = new_xyz.size()
+    N = xyz.size(1)
+    k = min(nsample, N)
+    idx = torch.zeros(B, M, nsample, dtype=torch.int32, device=xyz.device)
+    order = torch.arange(N, device=xyz.device)
+    for start, end in _chunks(B, M, N):
+        inside = _sq_dist(new_xyz[:, start:end], xyz) < radius * radius
+        # smallest k indices of the points inside, the others rank after them
+        rank = torch.where(inside, order, torch.full_like(order, N))
+        first = rank.topk(k, dim=-1, largest=False, sorted=True)[0]
+        count = inside.sum(-1, keepdim=True)
+        first = torch.where(first < N, first, first[..., :1])
+        first = torch.where(count > 0, first, torch.zeros_like(first))
+        if k < nsample:
+            first = torch.cat([first, first[..., :1].expand(-1, -1, nsample - k)], -1)
+        idx[:, start:end] = first.int()
+    return idx
+
+
+# the distance blocks are already chunked, there is no separate grid version
+ball_query_grid = ball_query
+
+
+def group_points(points, idx):
+    """points: (B, C, N), idx: (B, M, nsample) -> (B, C, M, nsample)"""
+    B, C, N = points.size()
+    _, M, nsample = idx.size()
+    # gather into the 4d shape directly, callers modify the result in place
+    # and autograd rejects in-place changes of a view returned by a Function
+    index = idx.long().unsqueeze(1).expand(B, C, M, nsample)
+    return torch.gather(points.unsqueeze(-1).expand(B, C, N, nsample), 2, index)
+
+
+def group_points_grad(grad_out, idx, n):
+    B, C, M, nsample = grad_out.size()
+    flat = idx.long().view(B, 1, M * nsample).expand(B, C, M * nsample)
+    grad_points = grad_out.new_zeros(B, C, n)
+    return grad_points.scatter_add_(2, flat, grad_out.reshape(B, C, M * nsample))
+
+
+def three_nn(unknowns, knows):
+    """unknowns: (B, n, 3), knows: (B, m, 3) -> squared distances and int32
+    indices (B, n, 3) of the three nearest knows."""
+    B, n, _ = unknowns.size()
+    m = knows.size(1)
+    # the kernels store their double 1e40 start value, inf as a float
+    dist2 = unknowns.new_full((B, n, 3), float("inf"))
+    idx = torch.zeros(B, n, 3, dtype=torch.int32, device=unknowns.device)
+    k = min(3, m)
+    for start, end in _chunks(B, n, m):
+        d, i = _sq_dist(unknowns[:, start:end], knows).topk(k, dim=-1, largest=False, sorted=True)
+        dist2[:, start:end, :k] = d
+        idx[:, start:end, :k] = i.int()
+    return dist2, idx
+
+
+def three_interpolate(points, idx, weight):
+    """points: (B, c, m), idx: (B, n, 3), weight: (B, n, 3) -> (B, c, n)"""
+    B, c, _ = points.size()
+    n = idx.size(1)
+    flat = idx.long().view(B, 1, n * 3).expand(B, c, n * 3)
+    neighbors = torch.gather(points, 2, flat).view(B, c, n, 3)
+    return (neighbors * weight.unsqueeze(1)).sum(-1)
+
+
+def three_interpolate_grad(grad_out, idx, weight, m):
+    B, c, n = grad_out.size()
+    flat = idx.long().view(B, 1, n * 3).expand(B, c, n * 3)
+    contrib = (grad_out.unsqueeze(-1) * weight.unsqueeze(1)).reshape(B, c, n * 3)
+    grad_points = grad_out.new_zeros(B, c, m)
+    return grad_points.scatter_add_(2, flat, contrib)
@@ -178,11 +178,16 @@ class PointnetSAModuleVotes(nn.Module):
             sigma: float = None, # for RBF pooling
             normalize_xyz: bool = False, # noramlize local XYZ with radius
             sample_uniformly: bool = False,
-            ret_unique_cnt: bool = False
+            ret_unique_cnt: bool = False,
+            fps_mode: str = 'exact'
     ):
         super().__init__()
 
         self.npoint = npoint
+        # sampling backend, see pointnet2_utils.sample_points and set_fps_mode
+        self.fps_mode = fps_mode
+        self.track_coverage = False
+        self.coverage = None
         self.radius = radius
         self.nsample = nsample
         self.pooling = pooling
@@ -233,12 +238,14 @@ class PointnetSAModuleVotes(nn.Module):
 
         xyz_flipped = xyz.transpose(1, 2).contiguous()
         if inds is None:
-            inds = pointnet2_utils.furthest_point_sample(xyz, self.npoint)
+            inds = pointnet2_utils.sample_points(xyz, self.npoint, self.fps_mode)
         else:
             assert(inds.shape[1] == self.npoint)
         new_xyz = pointnet2_utils.gather_operation(
             xyz_flipped, inds
         ).transpose(1, 2).contiguous() if self.npoint is not None else None
+        if self.track_coverage and new_xyz is not None:
+            self.coverage = pointnet2_utils.sampling_coverage(xyz, new_xyz, self.radius)
 
         if not self.ret_unique_cnt:
             grouped_features, grouped_xyz = self.grouper(
@@ -276,6 +283,17 @@ class PointnetSAModuleVotes(nn.Module):
         else:
             return new_xyz, new_features, inds, unique_cnt
 
+def set_fps_mode(module, fps_mode='exact', track_coverage=False):
+    r"""Selects the sampling backend of all PointnetSAModuleVotes in module,
+    one of pointnet2_utils.FPS_MODES. With track_coverage every SA layer keeps
+    the pointnet2_utils.sampling_coverage of its last forward in .coverage."""
+    assert fps_mode in pointnet2_utils.FPS_MODES, fps_mode
+    for m in module.modules():
+        if isinstance(m, PointnetSAModuleVotes):
+            m.fps_mode = fps_mode
+            m.track_coverage = track_coverage
+            m.coverage = None
+
 class PointnetSAModuleMSGVotes(nn.Module):
     ''' Modified based on _PointnetSAModuleBase and PointnetSAModuleMSG
     with extra support for returning point indices for getting their GT votes '''
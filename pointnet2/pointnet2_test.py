@@ -29,5 +29,97 @@ def test_interpolation_grad():
     
     assert (gradcheck(interpolate_func, feats, atol=1e-1, rtol=1e-1))
 
+def test_cpu_ops():
+    ''' CPU kernels against plain torch references on small inputs. '''
+    torch.manual_seed(0)
+    B, N, M, C, nsample, radius = 2, 200, 32, 4, 8, 0.2
+    xyz = torch.rand(B, N, 3)
+    feats = torch.rand(B, C, N)
+
+    # furthest point sampling, points at the origin are skipped like on the GPU
+    inds = pointnet2_utils.furthest_point_sample(xyz, M)
+    for b in range(B):
+        dist = torch.full((N,), 1e10)
+        expected = [0]
+        for _ in range(1, M):
+            dist = torch.min(dist, ((xyz[b] - xyz[b, expected[-1]])**2).sum(1))
+            expected.append(int(torch.argmax(dist)))
+        assert inds[b].tolist() == expected
+
+    new_xyz = pointnet2_utils.gather_operation(xyz.transpose(1,2).contiguous(), inds)
+    assert torch.equal(new_xyz, torch.gather(xyz.transpose(1,2), 2, inds.long().unsqueeze(1).expand(B,3,M)))
+    new_xyz = new_xyz.transpose(1,2).contiguous()
+
+    # ball query: first nsample points within radius, padded with the first one
+    idx = pointnet2_utils.ball_query(radius, nsample, xyz, new_xyz)
+    dist2 = ((new_xyz.unsqueeze(2) - xyz.unsqueeze(1))**2).sum(-1)
+    for b in range(B):
+        for j in range(M):
+            inside = torch.nonzero(dist2[b,j] < radius**2).flatten()[:nsample].tolist()
+            assert idx[b,j].tolist() == (inside + [inside[0]]*nsample)[:nsample]
+
+    grouped = pointnet2_utils.grouping_operation(feats, idx)
+    assert torch.equal(grouped, torch.stack([feats[b][:, idx[b].long()] for b in range(B)]))
+
+    dist, nn_idx = pointnet2_utils.three_nn(xyz, new_xyz)
+    sorted_dist, sorted_idx = dist2.transpose(1,2).sort(-1)
+    assert torch.equal(nn_idx.long(), sorted_idx[:,:,:3])
+    assert torch.allclose(dist, sorted_dist[:,:,:3].sqrt(), atol=1e-5)
+
+    # gradients of the scatter-add backward kernels
+    assert gradcheck(lambda f: pointnet2_utils.grouping_operation(f, idx),
+        feats.clone().requires_grad_(), eps=1e-2, atol=1e-2)
+    weight = torch.rand(B, N, 3)
+    assert gradcheck(lambda f: pointnet2_utils.three_interpolate(f, nn_idx, weight),
+        torch.rand(B, C, M, requires_grad=True), eps=1e-2, atol=1e-2)
+
+    if torch.cuda.is_available():
+        assert torch.equal(pointnet2_utils.ball_query(radius, nsample, xyz.cuda(), new_xyz.cuda()).cpu(), idx)
+
+def test_fps_modes():
+    ''' Every FPS backend picks npoint distinct points that cover most of the cloud. '''
+    torch.manual_seed(0)
+    B, N, npoint, radius = 2, 4000, 256, 0.3
+    xyz = torch.rand(B, N, 3) * torch.tensor([4., 3., 2.])
+    for mode in pointnet2_utils.FPS_MODES:
+        inds = pointnet2_utils.sample_points(xyz, npoint, mode)
+        assert inds.shape == (B, npoint) and inds.dtype == torch.int32
+        for b in range(B):
+            assert len(set(inds[b].tolist())) == npoint
+            assert 0 <= int(inds[b].min()) and int(inds[b].max()) < N
+        new_xyz = torch.gather(xyz, 1, inds.long().unsqueeze(-1).expand(B, npoint, 3))
+        coverage = pointnet2_utils.sampling_coverage(xyz, new_xyz, radius)
+        assert ((coverage > 0.5) & (coverage <= 1)).all()
+    assert torch.equal(pointnet2_utils.sample_points(xyz, npoint, 'exact'),
+        pointnet2_utils.furthest_point_sample(xyz, npoint))
+    # repeated passes (MC dropout samples) pick the same points in every mode
+    for mode in pointnet2_utils.FPS_MODES:
+        assert torch.equal(pointnet2_utils.sample_points(xyz, npoint, mode),
+            pointnet2_utils.sample_points(xyz, npoint, mode)), mode
+
+def test_ball_query_grid():
+    ''' Hash grid ball query against the brute force one, and uniform
+    resampling of the ball points in QueryAndGroup. '''
+    torch.manual_seed(0)
+    B, N, M, nsample = 2, 5000, 300, 16
+    xyz = torch.rand(B, N, 3) * torch.tensor([4., 3., 2.])
+    xyz[:, :N//2, 2] = 0.
+    new_xyz = torch.cat([xyz[:, :M-1], torch.full((B, 1, 3), 10.)], 1).contiguous()
+    ops = pointnet2_utils._ops()
+    for radius in [0.05, 0.2, 0.6]:
+        idx = ops.ball_query(new_xyz, xyz, radius, nsample)
+        assert torch.equal(ops.ball_query_grid(new_xyz, xyz, radius, nsample), idx)
+
+    grouper = pointnet2_utils.QueryAndGroup(0.2, nsample, ret_grouped_xyz=True,
+        sample_uniformly=True, ret_unique_cnt=True)
+    _, _, unique_cnt = grouper(xyz, new_xyz, xyz.transpose(1,2).contiguous())
+    idx = pointnet2_utils.ball_query(0.2, nsample, xyz, new_xyz)
+    for b in range(B):
+        for j in range(M):
+            assert unique_cnt[b,j] == torch.unique(idx[b,j]).shape[0]
+
 if __name__=='__main__':
     test_interpolation_grad()
+    test_cpu_ops()
+    test_fps_modes()
+    test_ball_query_grid()
@@ -22,16 +22,28 @@ try:
 except:
     import __builtin__ as builtins
 
+import os
+import pointnet2_fallback
+
 try:
     import pointnet2._ext as _ext
 except Exception as e:
-    print(e)
     if not getattr(builtins, "__POINTNET2_SETUP__", False):
-        raise ImportError(
-            "Could not import _ext module.\n"
-            "Please see the setup instructions in the README: "
-            "https://github.com/erikwijmans/Pointnet2_PyTorch/blob/master/README.rst"
+        print(
+            "Could not import _ext module ({}), using the PyTorch implementation "
+            "of the pointnet2 ops. See the setup instructions in the README: "
+            "https://github.com/erikwijmans/Pointnet2_PyTorch/blob/master/README.rst".format(e)
         )
+    _ext = None
+
+# POINTNET2_BACKEND=torch selects the PyTorch ops even if _ext is built
+_use_fallback = _ext is None or os.environ.get("POINTNET2_BACKEND") == "torch"
+
+
+def _ops():
+    """The compiled _ext module (CPU and CUDA kernels) or pointnet2_fallback."""
+    return pointnet2_fallback if _use_fallback else _ext
+
 
 if False:
     # Workaround for type hints without depending on the `typing` module
@@ -69,7 +81,7 @@ class FurthestPointSampling(Function):
         torch.Tensor
             (B, npoint) tensor containing the set
         """
-        fps_inds = _ext.furthest_point_sampling(xyz, npoint)
+        fps_inds = _ops().furthest_point_sampling(xyz, npoint)
         ctx.mark_non_differentiable(fps_inds)
         return fps_inds
 
@@ -78,7 +90,195 @@ class FurthestPointSampling(Function):
         return None, None
 
 
-furthest_point_sample = FurthestPointSampling.apply
+def furthest_point_sample(xyz, npoint):
+    # torch.jit.trace can not save calls of the autograd Functions, while
+    # tracing the TorchScript ops registered by the _ext library are used
+    if torch.jit.is_tracing():
+        return torch.ops.pointnet2.furthest_point_sampling(xyz, npoint)
+    return FurthestPointSampling.apply(xyz, npoint)
+
+
+FPS_MODES = ["exact", "voxel", "grid"]
+
+
+def _batch_offsets(counts):
+    return torch.cumsum(counts, 0) - counts
+
+
+def _voxel_representatives(xyz, voxel_size):
+    r"""
+    One point per occupied voxel of each cloud, any point of the voxel.
+
+    Returns
+    -------
+    reps : torch.Tensor
+        (B, R) long indices into the flattened (B*N) points, rows padded with
+        their first representative, R the largest number of occupied voxels
+    counts : torch.Tensor
+        (B,) number of occupied voxels per cloud
+    """
+    B, N, _ = xyz.size()
+    grid = torch.floor((xyz - xyz.min(1, keepdim=True)[0]) / voxel_size).long()
+    dims = grid.view(-1, 3).max(0)[0] + 1
+    num_keys = int(dims[0] * dims[1] * dims[2])
+    keys = (grid[..., 0] * dims[1] + grid[..., 1]) * dims[2] + grid[..., 2]
+    keys = keys + torch.arange(B, device=xyz.device).view(B, 1) * num_keys
+    voxels, inverse = torch.unique(keys.view(-1), return_inverse=True)
+    # any point of a voxel will do, so duplicate scatter indices are fine
+    first = torch.empty_like(voxels).scatter_(
+        0, inverse, torch.arange(B * N, device=xyz.device)
+    )
+    batch = voxels // num_keys
+    counts = torch.bincount(batch, minlength=B)
+    pos = torch.arange(voxels.size(0), device=xyz.device) - _batch_offsets(counts)[batch]
+    reps = first[_batch_offsets(counts)].view(B, 1).repeat(1, int(counts.max()))
+    reps[batch, pos] = first
+    return reps, counts
+
+
+def voxel_furthest_point_sample(xyz, npoint, voxel_size=None):
+    r"""
+    Approximate furthest point sampling: exact FPS over one representative
+    point per occupied voxel, which are far fewer than the input points.
+    Without a voxel_size it starts from a grid of about 8 * npoint cells over
+    the bounding box, smaller voxels give a closer match to exact FPS. The
+    voxel size is halved until every cloud has npoint occupied voxels, and
+    exact FPS is used if that does not happen within a few steps.
+
+    Parameters
+    ----------
+    xyz : torch.Tensor
+        (B, N, 3) tensor where N > npoint
+    npoint : int32
+        number of features in the sampled set
+
+    Returns
+    -------
+    torch.Tensor
+        (B, npoint) int tensor of indices into xyz
+    """
+    B, N, _ = xyz.size()
+    with torch.no_grad():
+        if voxel_size is None:
+            extent = (xyz.max(1)[0] - xyz.min(1)[0]).clamp(min=1e-6)
+            volume = float(extent.prod(1).max())
+            voxel_size = (volume / (8 * npoint)) ** (1.0 / 3)
+        for _ in range(8):
+            reps, counts = _voxel_representatives(xyz, voxel_size)
+            if int(counts.min()) >= npoint:
+                break
+            voxel_size /= 2
+        else:
+            return furthest_point_sample(xyz, npoint)
+        rep_xyz = xyz.reshape(B * N, 3)[reps]
+        inds = torch.gather(reps, 1, furthest_point_sample(rep_xyz, npoint).long())
+        inds -= torch.arange(B, device=xyz.device).view(B, 1) * N
+    return inds.int()
+
+
+def grid_furthest_point_sample(xyz, npoint, grid_size=4, seed=0):
+    r"""
+    Batched furthest point sampling over grid cells. Every cloud is split into
+    grid_size x grid_size columns over x and y, each cell gets a share of
+    npoint proportional to its number of points and FPS runs in all cells of
+    the batch at once, from a random start point per cell. The sequential
+    part shrinks from npoint steps to the largest share.
+
+    The start points are drawn from a generator seeded with seed, so repeated
+    passes over the same input (MC dropout samples) pick the same points like
+    exact FPS does. seed=None draws them from the global RNG.
+
+    Parameters
+    ----------
+    xyz : torch.Tensor
+        (B, N, 3) tensor where N > npoint
+    npoint : int32
+        number of features in the sampled set
+    seed : int or None
+        seed of the random start points
+
+    Returns
+    -------
+    torch.Tensor
+        (B, npoint) int tensor of indices into xyz
+    """
+    B, N, _ = xyz.size()
+    if npoint >= N:
+        return furthest_point_sample(xyz, npoint)
+    G = grid_size * grid_size
+    device = xyz.device
+    with torch.no_grad():
+        lo = xyz[..., 0:2].min(1, keepdim=True)[0]
+        extent = (xyz[..., 0:2].max(1, keepdim=True)[0] - lo).clamp(min=1e-6)
+        ij = ((xyz[..., 0:2] - lo) / extent * grid_size).long().clamp(0, grid_size - 1)
+        cell = ij[..., 0] * grid_size + ij[..., 1]
+        cell = (cell + torch.arange(B, device=device).view(B, 1) * G).view(-1)
+        counts = torch.bincount(cell, minlength=B * G).view(B, G)
+
+        # largest remainder shares, a share never exceeds the points of its cell
+        exact = counts.double() * npoint / N
+        quota = torch.floor(exact).long()
+        remainder = npoint - quota.sum(1, keepdim=True)
+        rank = torch.argsort(torch.argsort(quota.double() - exact, 1), 1)
+        quota += (rank < remainder).long()
+
+        # points grouped by cell in random order, so index 0 of a cell is random
+        generator = None
+        if seed is not None:
+            generator = torch.Generator(device=device).manual_seed(seed)
+        noise = torch.rand(B * N, device=device, dtype=torch.double, generator=generator)
+        order = torch.argsort(cell.double() + noise)
+        counts = counts.view(-1)
+        starts = _batch_offsets(counts)
+        sorted_cell = cell[order]
+        pos = torch.arange(B * N, device=device) - starts[sorted_cell]
+        cells = order[starts.clamp(max=B * N - 1)].view(B * G, 1).repeat(1, int(counts.max()))
+        cells[sorted_cell, pos] = order
+
+        max_quota = int(quota.max())
+        cell_inds = furthest_point_sample(xyz.reshape(B * N, 3)[cells], max_quota).long()
+        inds = torch.gather(cells, 1, cell_inds)
+        keep = torch.arange(max_quota, device=device).view(1, -1) < quota.view(-1, 1)
+        inds = inds[keep].view(B, npoint)
+        inds -= torch.arange(B, device=device).view(B, 1) * N
+    return inds.int()
+
+
+def sample_points(xyz, npoint, mode="exact"):
+    r"""
+    Furthest point sampling with the backend given by mode, one of FPS_MODES:
+    exact FPS, voxel_furthest_point_sample or grid_furthest_point_sample.
+    """
+    if mode == "exact":
+        return furthest_point_sample(xyz, npoint)
+    if mode == "voxel":
+        return voxel_furthest_point_sample(xyz, npoint)
+    if mode == "grid":
+        return grid_furthest_point_sample(xyz, npoint)
+    raise ValueError("Unknown FPS mode %s, expected one of %s" % (mode, FPS_MODES))
+
+
+def sampling_coverage(xyz, new_xyz, radius):
+    r"""
+    Quality of a sampled set: the fraction of the input points within radius
+    of a sampled point, i.e. the points that fall into at least one grouping
+    ball of the SA layer.
+
+    Parameters
+    ----------
+    xyz : torch.Tensor
+        (B, N, 3) input points
+    new_xyz : torch.Tensor
+        (B, npoint, 3) sampled points, npoint >= 3
+
+    Returns
+    -------
+    torch.Tensor
+        (B,) coverage in [0, 1]
+    """
+    with torch.no_grad():
+        dist, _ = three_nn(xyz.contiguous(), new_xyz.contiguous())
+        return (dist[..., 0] < radius).float().mean(1)
 
 
 class GatherOperation(Function):
@@ -105,17 +305,23 @@ class GatherOperation(Function):
 
         ctx.for_backwards = (idx, C, N)
 
-        return _ext.gather_points(features, idx)
+        # the kernels index raw fp32 memory, features may be a strided view
+        # such as the channels last output of a quantized SharedMLP, or a
+        # bf16/fp16 conv output under autocast
+        return _ops().gather_points(features.float().contiguous(), idx)
 
     @staticmethod
     def backward(ctx, grad_out):
         idx, C, N = ctx.for_backwards
 
-        grad_features = _ext.gather_points_grad(grad_out.contiguous(), idx, N)
+        grad_features = _ops().gather_points_grad(grad_out.contiguous(), idx, N)
         return grad_features, None
 
 
-gather_operation = GatherOperation.apply
+def gather_operation(features, idx):
+    if torch.jit.is_tracing():
+        return torch.ops.pointnet2.gather_points(features, idx)
+    return GatherOperation.apply(features, idx)
 
 
 class ThreeNN(Function):
@@ -138,7 +344,7 @@ class ThreeNN(Function):
         idx : torch.Tensor
             (B, n, 3) index of 3 nearest neighbors
         """
-        dist2, idx = _ext.three_nn(unknown, known)
+        dist2, idx = _ops().three_nn(unknown, known)
 
         return torch.sqrt(dist2), idx
 
@@ -147,7 +353,11 @@ class ThreeNN(Function):
         return None, None
 
 
-three_nn = ThreeNN.apply
+def three_nn(unknown, known):
+    if torch.jit.is_tracing():
+        dist2, idx = torch.ops.pointnet2.three_nn(unknown, known)
+        return torch.sqrt(dist2), idx
+    return ThreeNN.apply(unknown, known)
 
 
 class ThreeInterpolate(Function):
@@ -175,7 +385,7 @@ class ThreeInterpolate(Function):
 
         ctx.three_interpolate_for_backward = (idx, weight, m)
 
-        return _ext.three_interpolate(features, idx, weight)
+        return _ops().three_interpolate(features.float().contiguous(), idx, weight)
 
     @staticmethod
     def backward(ctx, grad_out):
@@ -197,14 +407,17 @@ class ThreeInterpolate(Function):
         """
         idx, weight, m = ctx.three_interpolate_for_backward
 
-        grad_features = _ext.three_interpolate_grad(
+        grad_features = _ops().three_interpolate_grad(
             grad_out.contiguous(), idx, weight, m
         )
 
         return grad_features, None, None
 
 
-three_interpolate = ThreeInterpolate.apply
+def three_interpolate(features, idx, weight):
+    if torch.jit.is_tracing():
+        return torch.ops.pointnet2.three_interpolate(features, idx, weight)
+    return ThreeInterpolate.apply(features, idx, weight)
 
 
 class GroupingOperation(Function):
@@ -230,7 +443,7 @@ class GroupingOperation(Function):
 
         ctx.for_backwards = (idx, N)
 
-        return _ext.group_points(features, idx)
+        return _ops().group_points(features.float().contiguous(), idx)
 
     @staticmethod
     def backward(ctx, grad_out):
@@ -250,12 +463,20 @@ class GroupingOperation(Function):
         """
         idx, N = ctx.for_backwards
 
-        grad_features = _ext.group_points_grad(grad_out.contiguous(), idx, N)
+        grad_features = _ops().group_points_grad(grad_out.contiguous(), idx, N)
 
         return grad_features, None
 
 
-grouping_operation = GroupingOperation.apply
+def grouping_operation(features, idx):
+    if torch.jit.is_tracing():
+        return torch.ops.pointnet2.group_points(features, idx)
+    return GroupingOperation.apply(features, idx)
+
+
+# from this many points on CPU ball queries bucket the points into a hash grid
+# (ball_query_grid, same result) instead of scanning all of them per query
+GRID_BALL_QUERY_MIN_POINTS = 2048
 
 
 class BallQuery(Function):
@@ -280,7 +501,10 @@ class BallQuery(Function):
         torch.Tensor
             (B, npoint, nsample) tensor with the indicies of the features that form the query balls
         """
-        inds = _ext.ball_query(new_xyz, xyz, radius, nsample)
+        if xyz.size(1) >= GRID_BALL_QUERY_MIN_POINTS:
+            inds = _ops().ball_query_grid(new_xyz, xyz, radius, nsample)
+        else:
+            inds = _ops().ball_query(new_xyz, xyz, radius, nsample)
         ctx.mark_non_differentiable(inds)
         return inds
 
@@ -289,7 +513,12 @@ class BallQuery(Function):
         return None, None, None, None
 
 
-ball_query = BallQuery.apply
+def ball_query(radius, nsample, xyz, new_xyz):
+    if torch.jit.is_tracing():
+        if xyz.size(1) >= GRID_BALL_QUERY_MIN_POINTS:
+            return torch.ops.pointnet2.ball_query_grid(new_xyz, xyz, radius, nsample)
+        return torch.ops.pointnet2.ball_query(new_xyz, xyz, radius, nsample)
+    return BallQuery.apply(radius, nsample, xyz, new_xyz)
 
 
 class QueryAndGroup(nn.Module):
@@ -344,17 +573,16 @@ class QueryAndGroup(nn.Module):
         idx = ball_query(self.radius, self.nsample, xyz, new_xyz)
 
         if self.sample_uniformly:
-            unique_cnt = torch.zeros((idx.shape[0], idx.shape[1]))
-            for i_batch in range(idx.shape[0]):
-                for i_region in range(idx.shape[1]):
-                    unique_ind = torch.unique(idx[i_batch, i_region, :])
-                    num_unique = unique_ind.shape[0]
-                    unique_cnt[i_batch, i_region] = num_unique
-                    sample_ind = torch.randint(
-                        0, num_unique, (self.nsample - num_unique,), dtype=torch.long
-                    )
-                    all_ind = torch.cat((unique_ind, unique_ind[sample_ind]))
-                    idx[i_batch, i_region, :] = all_ind
+            # ball_query returns the points of a ball in increasing order and
+            # pads with the first one, so the unique points are the first
+            # unique_cnt entries; the padding is redrawn uniformly from them
+            unique_cnt = (idx != idx[..., 0:1]).sum(-1) + 1
+            pad = (
+                torch.rand(idx.shape, device=idx.device) * unique_cnt.unsqueeze(-1)
+            ).long()
+            slot = torch.arange(self.nsample, device=idx.device)
+            idx = torch.where(slot < unique_cnt.unsqueeze(-1), idx, torch.gather(idx, 2, pad))
+            unique_cnt = unique_cnt.float()
 
         xyz_trans = xyz.transpose(1, 2).contiguous()
         grouped_xyz = grouping_operation(xyz_trans, idx)  # (B, 3, npoint, nsample)
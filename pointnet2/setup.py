@@ -4,27 +4,40 @@
 # LICENSE file in the root directory of this source tree.
 
 from setuptools import setup
-from torch.utils.cpp_extension import BuildExtension, CUDAExtension
+from torch.utils.cpp_extension import BuildExtension, CUDAExtension, CppExtension, CUDA_HOME
 import glob
 
 _ext_src_root = "_ext_src"
-_ext_sources = glob.glob("{}/src/*.cpp".format(_ext_src_root)) + glob.glob(
-    "{}/src/*.cu".format(_ext_src_root)
-)
 _ext_headers = glob.glob("{}/include/*".format(_ext_src_root))
+_cxx_args = ["-O2", "-I{}".format("{}/include".format(_ext_src_root))]
+
+# The CPU kernels (*_cpu.cpp) are always built. The CUDA kernels are added
+# when a CUDA toolkit is found, otherwise the ops only accept CPU tensors.
+if CUDA_HOME is not None:
+    _ext_sources = glob.glob("{}/src/*.cpp".format(_ext_src_root)) + glob.glob(
+        "{}/src/*.cu".format(_ext_src_root)
+    )
+    ext_module = CUDAExtension(
+        name='pointnet2._ext',
+        sources=_ext_sources,
+        define_macros=[("WITH_CUDA", None)],
+        extra_compile_args={
+            "cxx": _cxx_args + ["-fopenmp"],
+            "nvcc": ["-O2", "-I{}".format("{}/include".format(_ext_src_root))],
+        },
+        extra_link_args=["-fopenmp"],
+    )
+else:
+    ext_module = CppExtension(
+        name='pointnet2._ext',
+        sources=glob.glob("{}/src/*.cpp".format(_ext_src_root)),
+        extra_compile_args={"cxx": _cxx_args + ["-fopenmp"]},
+        extra_link_args=["-fopenmp"],
+    )
 
 setup(
     name='pointnet2',
-    ext_modules=[
-        CUDAExtension(
-            name='pointnet2._ext',
-            sources=_ext_sources,
-            extra_compile_args={
-                "cxx": ["-O2", "-I{}".format("{}/include".format(_ext_src_root))],
-                "nvcc": ["-O2", "-I{}".format("{}/include".format(_ext_src_root))],
-            },
-        )
-    ],
+    ext_modules=[ext_module],
     cmdclass={
         'build_ext': BuildExtension
     }
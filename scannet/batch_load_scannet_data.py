@@ -6,11 +6,21 @@
 """ Batch mode in loading Scannet scenes with vertices and ground truth labels
 for semantic and instance segmentations
 
-Usage example: python ./batch_load_scannet_data.py
+Scans are exported in parallel by a pool of workers. The status of every scan
+is recorded in <OUTPUT_FOLDER>/export_manifest.json; finished scans are skipped
+on the next run and failed ones are retried, with their errors reported.
+
+Usage example: python ./batch_load_scannet_data.py --num_workers 8
 """
 import os
 import sys
+import json
+import time
+import zlib
+import argparse
 import datetime
+import traceback
+from multiprocessing import Pool
 import numpy as np
 from load_scannet_data import export
 import pdb
@@ -22,6 +32,8 @@ DONOTCARE_CLASS_IDS = np.array([])
 OBJ_CLASS_IDS = np.array([3,4,5,6,7,8,9,10,11,12,14,16,24,28,33,34,36,39])
 MAX_NUM_POINT = 50000
 OUTPUT_FOLDER = './scannet_train_detection_data'
+MANIFEST_FILE = 'export_manifest.json'
+OUTPUT_SUFFIXES = ['_vert.npy', '_sem_label.npy', '_ins_label.npy', '_bbox.npy']
 
 def export_one_scan(scan_name, output_filename_prefix):    
     mesh_file = os.path.join(SCANNET_DIR, scan_name, scan_name + '_vh_clean_2.ply')
@@ -45,35 +57,84 @@ def export_one_scan(scan_name, output_filename_prefix):
 
     N = mesh_vertices.shape[0]
     if N > MAX_NUM_POINT:
-        choices = np.random.choice(N, MAX_NUM_POINT, replace=False)
+        # seeded by the scan name, so the subsample does not depend on which
+        # worker exports the scan
+        rng = np.random.RandomState(zlib.crc32(scan_name.encode()))
+        choices = rng.choice(N, MAX_NUM_POINT, replace=False)
         mesh_vertices = mesh_vertices[choices, :]
         semantic_labels = semantic_labels[choices]
         instance_labels = instance_labels[choices]
 
-    np.save(output_filename_prefix+'_vert.npy', mesh_vertices)
-    np.save(output_filename_prefix+'_sem_label.npy', semantic_labels)
-    np.save(output_filename_prefix+'_ins_label.npy', instance_labels)
-    np.save(output_filename_prefix+'_bbox.npy', instance_bboxes)
+    arrays = [mesh_vertices, semantic_labels, instance_labels, instance_bboxes]
+    for suffix, arr in zip(OUTPUT_SUFFIXES, arrays):
+        tmp_filename = output_filename_prefix + '.tmp%d' % (os.getpid()) + suffix
+        np.save(tmp_filename, arr)
+        os.replace(tmp_filename, output_filename_prefix + suffix)
+
+def export_worker(scan_name):
+    """ Exports one scan and returns its manifest entry instead of raising. """
+    start = time.time()
+    output_filename_prefix = os.path.join(OUTPUT_FOLDER, scan_name)
+    try:
+        export_one_scan(scan_name, output_filename_prefix)
+        status = {'status': 'done'}
+    except Exception:
+        status = {'status': 'failed', 'error': traceback.format_exc()}
+    status['seconds'] = time.time() - start
+    return scan_name, status
+
+def read_manifest():
+    manifest_path = os.path.join(OUTPUT_FOLDER, MANIFEST_FILE)
+    if not os.path.isfile(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+def write_manifest(manifest):
+    manifest_path = os.path.join(OUTPUT_FOLDER, MANIFEST_FILE)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
 
-def batch_export():
+def is_exported(scan_name, manifest):
+    if manifest.get(scan_name, {}).get('status') != 'done':
+        return False
+    prefix = os.path.join(OUTPUT_FOLDER, scan_name)
+    return all(os.path.isfile(prefix + suffix) for suffix in OUTPUT_SUFFIXES)
+
+def batch_export(num_workers=1, overwrite=False):
     if not os.path.exists(OUTPUT_FOLDER):
         print('Creating new data folder: {}'.format(OUTPUT_FOLDER))                
         os.mkdir(OUTPUT_FOLDER)        
-        
-    for scan_name in TRAIN_SCAN_NAMES:
-        print('-'*20+'begin')
-        print(datetime.datetime.now())
-        print(scan_name)
-        output_filename_prefix = os.path.join(OUTPUT_FOLDER, scan_name) 
-        if os.path.isfile(output_filename_prefix+'_vert.npy'):
-            print('File already exists. skipping.')
-            print('-'*20+'done')
-            continue
-        try:            
-            export_one_scan(scan_name, output_filename_prefix)
-        except:
-            print('Failed export scan: %s'%(scan_name))            
-        print('-'*20+'done')
+
+    manifest = read_manifest()
+    todo = [s for s in TRAIN_SCAN_NAMES if overwrite or not is_exported(s, manifest)]
+    print('{}: exporting {} of {} scans, {} already done'.format(
+        datetime.datetime.now(), len(todo), len(TRAIN_SCAN_NAMES), len(TRAIN_SCAN_NAMES) - len(todo)))
+
+    pool = Pool(num_workers) if num_workers > 1 else None
+    results = pool.imap_unordered(export_worker, todo) if pool is not None else map(export_worker, todo)
+    for i, (scan_name, status) in enumerate(results):
+        status['attempts'] = manifest.get(scan_name, {}).get('attempts', 0) + 1
+        manifest[scan_name] = status
+        write_manifest(manifest)
+        print('[{}/{}] {} {} ({:.1f}s)'.format(
+            i + 1, len(todo), scan_name, status['status'], status['seconds']))
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    failed = sorted(s for s in TRAIN_SCAN_NAMES if manifest.get(s, {}).get('status') == 'failed')
+    if len(failed) > 0:
+        print('Failed to export {} scans, run again to retry them:'.format(len(failed)))
+        for scan_name in failed:
+            error = manifest[scan_name]['error'].strip().splitlines()[-1]
+            print('  {} (attempt {}): {}'.format(scan_name, manifest[scan_name]['attempts'], error))
 
 if __name__=='__main__':    
-    batch_export()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_workers', type=int, default=1, help='Number of scans exported in parallel')
+    parser.add_argument('--overwrite', action='store_true', help='Export scans that were already exported again')
+    args = parser.parse_args()
+    batch_export(args.num_workers, args.overwrite)
@@ -0,0 +1,105 @@
+""" Columnar index of the instance files of all ScanNet frames of a split.
+
+The index records, per frame of a frames source list, the sorted names of the
+files in its PCD/instances_<idx> directory together with the class and score
+parsed from every file name. Selecting the frames with at least one instance
+above a score threshold is then a vectorized filter instead of one listdir per
+frame. Loading stats the source list and every instances directory, one
+os.stat per frame; frames whose directory changed are listed again, so the
+directory mtimes the instance box caches are checked against stay current.
+"""
+import os
+import numpy as np
+
+
+def instance_dir(dataset_path, img_name):
+    scene_name = img_name[: img_name.rfind("_")]
+    unformatted = img_name[img_name.rfind("_") + 1 :]
+    return os.path.join(dataset_path, scene_name, "PCD", "instances_{}".format(unformatted))
+
+
+def read_source(source):
+    with open(source) as f:
+        return [line.strip().split("\t")[0] for line in f.readlines()]
+
+
+def _source_stat(source):
+    st = os.stat(source)
+    return np.array([st.st_size, st.st_mtime_ns], dtype=np.int64)
+
+
+def _dir_mtimes(dataset_path, frames):
+    return np.array(
+        [os.stat(instance_dir(dataset_path, f)).st_mtime_ns for f in frames], dtype=np.int64
+    )
+
+
+class FrameIndex(object):
+    def __init__(self, arrays):
+        self.frames = arrays["frames"]
+        self.offsets = arrays["offsets"]
+        self.files = arrays["files"]
+        self.classes = arrays["classes"]
+        self.scores = arrays["scores"]
+        self.dir_mtimes = arrays["dir_mtimes"]
+        self.frame_of_instance = np.repeat(np.arange(len(self.frames)), np.diff(self.offsets))
+
+    @staticmethod
+    def build(source, dataset_path, index_path, previous=None):
+        """Lists the instances dir of every frame of source and writes
+        index_path. Frames of the previous index arrays whose dir mtime did
+        not change reuse their file lists."""
+        frames = read_source(source)
+        source_stat = _source_stat(source)
+        mtimes = _dir_mtimes(dataset_path, frames)
+        previous_frames = {}
+        if previous is not None:
+            previous_frames = {str(f): i for i, f in enumerate(previous["frames"])}
+        files, offsets = [], [0]
+        for img_name, mtime in zip(frames, mtimes):
+            i = previous_frames.get(img_name)
+            if i is not None and previous["dir_mtimes"][i] == mtime:
+                objs_in_frame = list(
+                    previous["files"][previous["offsets"][i] : previous["offsets"][i + 1]]
+                )
+            else:
+                objs_in_frame = sorted(os.listdir(instance_dir(dataset_path, img_name)))
+            files.extend(objs_in_frame)
+            offsets.append(offsets[-1] + len(objs_in_frame))
+        fields = [a[:-4].split("_") for a in files]
+        arrays = {
+            "frames": np.array(frames),
+            "offsets": np.array(offsets, dtype=np.int64),
+            "files": np.array(files),
+            "classes": np.array([float(f[3]) for f in fields]),
+            "scores": np.array([float(f[5]) for f in fields]),
+            "source_stat": source_stat,
+            "dir_mtimes": mtimes,
+        }
+        tmp_path = index_path + ".tmp.%d.npz" % (os.getpid())
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, index_path)
+        return FrameIndex(arrays)
+
+    @staticmethod
+    def load(source, dataset_path, index_path):
+        """Loads index_path, building it if it is missing and updating it if
+        the source list or an instances dir changed."""
+        if not os.path.isfile(index_path):
+            return FrameIndex.build(source, dataset_path, index_path)
+        with np.load(index_path) as f:
+            arrays = {k: f[k] for k in f.files}
+        if np.array_equal(arrays["source_stat"], _source_stat(source)):
+            mtimes = _dir_mtimes(dataset_path, [str(f) for f in arrays["frames"]])
+            if np.array_equal(arrays["dir_mtimes"], mtimes):
+                return FrameIndex(arrays)
+        print("Frame index %s is stale, updating" % (index_path))
+        return FrameIndex.build(source, dataset_path, index_path, previous=arrays)
+
+    def frames_above(self, thresh):
+        """Names of the frames with at least one instance scoring above thresh,
+        in source order."""
+        keep = np.bincount(
+            self.frame_of_instance[self.scores > thresh], minlength=len(self.frames)
+        )
+        return [str(f) for f in self.frames[keep > 0]]
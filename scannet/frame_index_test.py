@@ -0,0 +1,69 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+""" Testing that the frame index follows changes of the instance dirs. """
+
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR)
+from frame_index import FrameIndex, instance_dir
+
+
+def _instance_file(i, cls, score):
+    return "inst_%d_cls_%d_score_%.2f.ply" % (i, cls, score)
+
+
+def _touch(path):
+    open(path, "w").close()
+
+
+def test_frame_index_follows_instance_dirs():
+    """Added instance files and an edited source list are picked up on load,
+    and the recorded dir mtimes are the live ones."""
+    dataset_path = tempfile.mkdtemp()
+    try:
+        frames = ["scene0000_00_0", "scene0000_00_20", "scene0001_00_0"]
+        for img_name in frames:
+            os.makedirs(instance_dir(dataset_path, img_name))
+        _touch(os.path.join(instance_dir(dataset_path, frames[0]), _instance_file(0, 5, 0.9)))
+        _touch(os.path.join(instance_dir(dataset_path, frames[2]), _instance_file(0, 3, 0.1)))
+        source = os.path.join(dataset_path, "train.txt")
+        with open(source, "w") as f:
+            f.write("\n".join(frames) + "\n")
+        index_path = os.path.join(dataset_path, "frame_index_train.npz")
+
+        index = FrameIndex.load(source, dataset_path, index_path)
+        assert index.frames_above(0.3) == [frames[0]]
+        assert FrameIndex.load(source, dataset_path, index_path).frames_above(0.3) == [frames[0]]
+
+        # a new instance file in an indexed frame
+        changed_dir = instance_dir(dataset_path, frames[1])
+        _touch(os.path.join(changed_dir, _instance_file(1, 7, 0.8)))
+        st = os.stat(changed_dir)
+        os.utime(changed_dir, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        index = FrameIndex.load(source, dataset_path, index_path)
+        assert index.frames_above(0.3) == frames[:2]
+        assert index.dir_mtimes[1] == os.stat(changed_dir).st_mtime_ns
+        assert list(index.files) == [
+            _instance_file(0, 5, 0.9),
+            _instance_file(1, 7, 0.8),
+            _instance_file(0, 3, 0.1),
+        ]
+        assert np.array_equal(index.classes, [5, 7, 3])
+
+        with open(source, "w") as f:
+            f.write(frames[1] + "\n")
+        assert FrameIndex.load(source, dataset_path, index_path).frames_above(0.3) == [frames[1]]
+    finally:
+        shutil.rmtree(dataset_path)
+
+
+if __name__ == "__main__":
+    test_frame_index_follows_instance_dirs()
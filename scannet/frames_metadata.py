@@ -0,0 +1,97 @@
+""" Per-scene metadata cache for the ScanNet frames dataset.
+
+Axis align matrices, depth intrinsics, camera poses and the sorted depth file
+names of all scenes are parsed once and stored in a single .npz file. A frame
+then only needs its depth image from disk. The file is read on the first
+lookup, or right after build() in the dataset's constructor, so DataLoader
+workers forked from the main process share the loaded arrays.
+"""
+import os
+import numpy as np
+import pandas as pd
+
+from sc_utils import get_axis_aligned_matrix, get_camera_pose
+
+
+def _write_npz_atomic(path, arrays):
+    tmp_path = path + ".tmp.%d.npz" % (os.getpid())
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+class SceneMetadataCache(object):
+    def __init__(self, cache_path, frames_path):
+        self.cache_path = cache_path
+        self.frames_path = frames_path
+        self._arrays = None
+        self._scene_idx = None
+
+    def _read_scene(self, scene_name):
+        """Parses the metadata of one scene with the same readers the dataset
+        used per frame, so cached values are identical."""
+        scene_dir = os.path.join(self.frames_path, scene_name)
+        poses = sorted(os.listdir(os.path.join(scene_dir, "pose/")))
+        depths = sorted(os.listdir(os.path.join(scene_dir, "depth/")))
+        depth_intrinsic = pd.read_csv(
+            os.path.join(scene_dir, "intrinsics_depth.txt"), header=None, delimiter=" "
+        ).values[:, :-1]
+        camera_poses = np.array(
+            [get_camera_pose(os.path.join(scene_dir, "pose/" + p)) for p in poses]
+        ).reshape(-1, 4, 4)
+        return get_axis_aligned_matrix(scene_name), depth_intrinsic, camera_poses, depths
+
+    def cached_scenes(self):
+        if not os.path.isfile(self.cache_path):
+            return []
+        with np.load(self.cache_path) as f:
+            return [str(s) for s in f["scene_names"]]
+
+    def build(self, scene_names):
+        """Makes sure every scene of scene_names is in the cache file. Missing
+        scenes are parsed and the file is rewritten together with the cached ones."""
+        cached = self.cached_scenes()
+        missing = sorted(set(scene_names) - set(cached))
+        if len(missing) == 0:
+            self._load()
+            return
+        scenes = sorted(set(cached) | set(missing))
+        axis_align, intrinsics, poses, depth_names = [], [], [], []
+        pose_offsets, depth_offsets = [0], [0]
+        for scene_name in scenes:
+            meta = self.get(scene_name) if scene_name in cached else self._read_scene(scene_name)
+            axis_align.append(meta[0])
+            intrinsics.append(meta[1])
+            poses.append(meta[2])
+            depth_names.extend(meta[3])
+            pose_offsets.append(pose_offsets[-1] + len(meta[2]))
+            depth_offsets.append(depth_offsets[-1] + len(meta[3]))
+        _write_npz_atomic(
+            self.cache_path,
+            {
+                "scene_names": np.array(scenes),
+                "axis_align": np.array(axis_align),
+                "depth_intrinsics": np.array(intrinsics),
+                "poses": np.concatenate(poses, 0),
+                "pose_offsets": np.array(pose_offsets),
+                "depth_names": np.array(depth_names),
+                "depth_offsets": np.array(depth_offsets),
+            },
+        )
+        self._load()
+        print("Cached metadata of %d scenes in %s" % (len(scenes), self.cache_path))
+
+    def _load(self):
+        with np.load(self.cache_path) as f:
+            self._arrays = {k: f[k] for k in f.files}
+        self._scene_idx = {str(s): i for i, s in enumerate(self._arrays["scene_names"])}
+
+    def get(self, scene_name):
+        """Returns (axis_align_matrix, depth_intrinsic, camera_poses, depth_names)
+        of a scene, camera_poses and depth_names in sorted file name order."""
+        if self._arrays is None:
+            self._load()
+        a = self._arrays
+        i = self._scene_idx[scene_name]
+        poses = a["poses"][a["pose_offsets"][i] : a["pose_offsets"][i + 1]]
+        depths = a["depth_names"][a["depth_offsets"][i] : a["depth_offsets"][i + 1]]
+        return a["axis_align"][i], a["depth_intrinsics"][i], poses, depths
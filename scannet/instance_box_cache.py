@@ -0,0 +1,100 @@
+""" Per-scene cache of the instance boxes of the ScanNet frames.
+
+get_instance_boxes parses every instance PLY with trimesh to get its AABB
+corners. This pass does that once per scene and writes
+<dataset_path>/<scene>/PCD/instance_boxes.npz with the corners, class and
+score of every instance file of every frame, so the frames dataset reads
+boxes from an array instead of parsing meshes in __getitem__.
+
+Usage example: python scannet/instance_box_cache.py <dataset_path> <frames_source>
+"""
+import os
+import sys
+import numpy as np
+import trimesh
+
+from frame_index import read_source
+
+CACHE_NAME = "instance_boxes.npz"
+INSTANCE_DIR_PREFIX = "instances_"
+
+
+def cache_path(dataset_path, scene_name):
+    return os.path.join(dataset_path, scene_name, "PCD", CACHE_NAME)
+
+
+def build_scene_cache(dataset_path, scene_name):
+    """Parses all instance files of a scene, in the sorted order
+    get_instance_boxes uses, and writes the scene's cache file."""
+    pcd_dir = os.path.join(dataset_path, scene_name, "PCD")
+    frame_dirs = sorted(d for d in os.listdir(pcd_dir) if d.startswith(INSTANCE_DIR_PREFIX))
+    frames, mtimes, files, corners, offsets = [], [], [], [], [0]
+    for d in frame_dirs:
+        instancedir = os.path.join(pcd_dir, d)
+        instances = sorted(os.listdir(instancedir))
+        frames.append(d[len(INSTANCE_DIR_PREFIX) :])
+        mtimes.append(os.stat(instancedir).st_mtime_ns)
+        files.extend(instances)
+        corners.extend(
+            trimesh.load(os.path.join(instancedir, i)).bounding_box.vertices for i in instances
+        )
+        offsets.append(offsets[-1] + len(instances))
+    fields = [a[:-4].split("_") for a in files]
+    arrays = {
+        "frames": np.array(frames),
+        "dir_mtimes": np.array(mtimes, dtype=np.int64),
+        "offsets": np.array(offsets, dtype=np.int64),
+        "files": np.array(files),
+        "corners": np.array(corners, dtype=np.float64).reshape(-1, 8, 3),
+        "classes": np.array([float(f[3]) for f in fields]),
+        "scores": np.array([float(f[5]) for f in fields]),
+    }
+    path = cache_path(dataset_path, scene_name)
+    tmp_path = path + ".tmp.%d.npz" % (os.getpid())
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+    return arrays
+
+
+class SceneBoxes(object):
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.frame_idx = {str(f): i for i, f in enumerate(arrays["frames"])}
+
+    def dir_mtime(self, frame):
+        i = self.frame_idx.get(frame)
+        return None if i is None else self.arrays["dir_mtimes"][i]
+
+    def get_instance_boxes(self, frame, with_classes=False, thresh=0.3):
+        """Same result as sc_utils.get_instance_boxes for the frame's instance dir."""
+        a = self.arrays
+        i = self.frame_idx[frame]
+        s, e = a["offsets"][i], a["offsets"][i + 1]
+        keep = a["scores"][s:e] > thresh
+        boxes = list(a["corners"][s:e][keep])
+        if with_classes == False:
+            return boxes
+        return boxes, a["classes"][s:e][keep]
+
+
+def load_scene_boxes(dataset_path, scene_name, dir_mtimes=None):
+    """Loads the box cache of a scene, building it if it is missing or if the
+    mtime of one of the given instance dirs ({frame: mtime_ns}) differs from
+    the cached one."""
+    path = cache_path(dataset_path, scene_name)
+    if os.path.isfile(path):
+        with np.load(path) as f:
+            scene_boxes = SceneBoxes({k: f[k] for k in f.files})
+        if dir_mtimes is None or all(
+            scene_boxes.dir_mtime(frame) == mtime for frame, mtime in dir_mtimes.items()
+        ):
+            return scene_boxes
+    return SceneBoxes(build_scene_cache(dataset_path, scene_name))
+
+
+if __name__ == "__main__":
+    dataset_path, source = sys.argv[1], sys.argv[2]
+    scenes = sorted(set(f[: f.rfind("_")] for f in read_source(source)))
+    for scene_name in scenes:
+        build_scene_cache(dataset_path, scene_name)
+        print("Cached instance boxes of %s" % (scene_name))
@@ -82,22 +82,10 @@ def export(mesh_file, agg_file, seg_file, meta_file, label_map_file, output_file
 
     # Load semantic and instance labels
     object_id_to_segs, label_to_segs = read_aggregation(agg_file)
-    seg_to_verts, num_verts = read_segmentation(seg_file)
-    label_ids = np.zeros(shape=(num_verts), dtype=np.uint32) # 0: unannotated
-    object_id_to_label_id = {}
-    for label, segs in label_to_segs.items():
-        label_id = label_map[label]
-        for seg in segs:
-            verts = seg_to_verts[seg]
-            label_ids[verts] = label_id
-    instance_ids = np.zeros(shape=(num_verts), dtype=np.uint32) # 0: unannotated
+    seg_indices = scannet_utils.read_segmentation_indices(seg_file)
+    label_ids, instance_ids, object_id_to_label_id = scannet_utils.fill_vertex_labels(
+        seg_indices, object_id_to_segs, label_to_segs, label_map)
     num_instances = len(np.unique(list(object_id_to_segs.keys())))
-    for object_id, segs in object_id_to_segs.items():
-        for seg in segs:
-            verts = seg_to_verts[seg]
-            instance_ids[verts] = object_id
-            if object_id not in object_id_to_label_id:
-                object_id_to_label_id[object_id] = label_ids[verts][0]
     instance_bboxes = np.zeros((num_instances,7))
     for obj_id in object_id_to_segs:
         label_id = object_id_to_label_id[obj_id]
@@ -0,0 +1,75 @@
+""" Packs the per-scene .npy files of scannet_train_detection_data into one
+contiguous, memory-mapped file per split.
+
+For every split <packed_dir>/<split>.bin holds the concatenated vertices,
+instance labels, semantic labels and bounding boxes of all its scenes, and
+<packed_dir>/<split>_index.npz holds the scene names, the per-scene row offsets
+of every section and the byte layout of the .bin file (see
+utils/packed_store.py). Reading a scene then is a zero-copy slice of the
+memory map instead of four np.load calls.
+
+Usage example: python scannet/pack_scannet_data.py --splits train val
+"""
+import os
+import sys
+import argparse
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BASE_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "utils"))
+from packed_store import write_pack, PackedScenes
+
+DATA_DIR = os.path.join(BASE_DIR, "scannet_train_detection_data")
+PACKED_DIR = os.path.join(BASE_DIR, "scannet_packed")
+SECTIONS = ["vert", "ins_label", "sem_label", "bbox"]
+# sections indexed by the scene's points, the others by its boxes
+POINT_SECTIONS = ["vert", "ins_label", "sem_label"]
+
+
+def split_scan_names(split, data_dir=DATA_DIR):
+    """Scene names of a meta_data split that were exported to data_dir."""
+    available = set(
+        x[0:12] for x in os.listdir(data_dir) if x.startswith("scene") and x.endswith("_vert.npy")
+    )
+    if split == "all":
+        return sorted(available)
+    split_filename = os.path.join(BASE_DIR, "meta_data", "scannetv2_{}.txt".format(split))
+    with open(split_filename, "r") as f:
+        return [s for s in f.read().splitlines() if s in available]
+
+
+def pack_split(scan_names, split, data_dir=DATA_DIR, packed_dir=PACKED_DIR):
+    """Writes <split>.bin and <split>_index.npz for scan_names.
+    The headers of all scenes are read first (mmap, no data) to lay out the
+    file, then every section is streamed in scene order."""
+
+    def read_section(scan_name, section, mmap):
+        path = os.path.join(data_dir, scan_name) + "_%s.npy" % (section)
+        return np.load(path, mmap_mode="r" if mmap else None)
+
+    # scenes without boxes are saved as (0,) arrays, the width comes from the others
+    return write_pack(
+        scan_names, SECTIONS, read_section, split, packed_dir, widths={"bbox": 7}
+    )
+
+
+class PackedScannetScenes(PackedScenes):
+    """Scenes of one packed split, load returns (mesh_vertices,
+    instance_labels, semantic_labels, instance_bboxes) as read-only views
+    into the memory map."""
+
+    def __init__(self, split, packed_dir=PACKED_DIR):
+        super().__init__(split, packed_dir, SECTIONS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--splits", nargs="+", default=["train", "val"])
+    parser.add_argument("--data_dir", default=DATA_DIR)
+    parser.add_argument("--packed_dir", default=PACKED_DIR)
+    args = parser.parse_args()
+    for split in args.splits:
+        scan_names = split_scan_names(split, args.data_dir)
+        bin_path, _ = pack_split(scan_names, split, args.data_dir, args.packed_dir)
+        print("Packed %d scenes of %s into %s" % (len(scan_names), split, bin_path))
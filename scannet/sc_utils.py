@@ -6,6 +6,9 @@ import trimesh
 import glob
 import pandas as pd
 import json
+from collections import OrderedDict
+
+from scannet_utils import read_segmentation_indices, fill_vertex_labels
 
 
 def get_label_bbox(label,grid_shape):
@@ -36,19 +39,7 @@ def get_points_inside_boxes(points, boxes):
     Returns:
         [np.array]: [boolean mask for gettig the points inside given boxes\]
     """
-    cond = np.zeros(len(points))
-    for box in boxes:
-        
-        maxx, maxy, maxz = box.max(0)
-
-        minx, miny, minz = box.min(0)
-
-        xs = points[:, 0]
-        ys = points[:, 1]
-        zs = points[:, 2]
-        cond = np.logical_or(cond, (xs <= maxx) & (xs >= minx) & (
-            ys <= maxy) & (ys >= miny) & (zs <= maxz) & (zs >= minz))
-    return cond
+    return points_in_boxes_last(points, boxes) >= 0
 
 
 def get_inside_grid(pts, grid_shape):
@@ -318,18 +309,54 @@ def corners_to_obb(boxes,classes):
         
 
     return np.array(new_boxes)
+def points_in_boxes_last(points, boxes, chunk_size=16384):
+    """Index of the last box containing each point, -1 for points outside all boxes.
+
+    All boxes are tested at once against chunks of chunk_size points, so the
+    (chunk_size, num_boxes) inside mask bounds the memory.
+
+    Args:
+        points ([np.array]): [N x 3 point cloud]
+        boxes ([type]): [list of 8x3 boxes]
+
+    Returns:
+        [np.array]: [(N,) int64 box index]
+    """
+    box_ids = np.zeros(len(points), dtype=np.int64) - 1
+    if len(boxes) == 0 or len(points) == 0:
+        return box_ids
+    boxes = np.asarray(boxes).reshape(len(boxes), -1, 3)
+    mins = boxes.min(1).T.copy()
+    maxs = boxes.max(1).T.copy()
+    num_boxes = len(boxes)
+    # box i has weight i+1, the max weight of a point's inside row is the last box
+    weights = np.arange(1, num_boxes + 1, dtype=np.min_scalar_type(num_boxes))
+    axes = np.ascontiguousarray(points[:, :3].T, dtype=np.float64)
+    for start in range(0, len(points), chunk_size):
+        inside = None
+        for a in range(3):
+            x = axes[a, start : start + chunk_size, None]
+            mask = (x <= maxs[a]) & (x >= mins[a])
+            inside = mask if inside is None else np.logical_and(inside, mask, out=inside)
+        box_ids[start : start + chunk_size] = (inside * weights).max(1).astype(np.int64) - 1
+    return box_ids
+
+
 def get_instance_and_semantic_pcd_from_boxes(points,boxes,classes):
+    """[Labels every point with the instance index and class of the box it is in.
+    Points inside several boxes get the labels of the last one.]
+
+    Returns:
+        [tuple]: [(N,) instance ids and (N,) class ids, -1 outside all boxes]
+    """
+    box_ids = points_in_boxes_last(points, boxes)
+    inside = box_ids >= 0
+    instances = np.zeros(points.shape[0]) - 1
+    class_ids = np.zeros(points.shape[0]) - 1
+    instances[inside] = box_ids[inside]
+    class_ids[inside] = np.asarray(classes)[box_ids[inside]]
+    return instances,class_ids
 
-    instances = np.zeros(points.shape[0]) -1
-    class_ids =  np.zeros(points.shape[0]) - 1
-    instance_ids = np.arange(len(boxes))
-    for idx,box in enumerate(boxes):
-        cond = get_inside_box_mask(points,box)
-        instances[cond] = instance_ids[idx]
-        class_ids[cond] = classes[idx] # TODO: make sure this is correct    
-    # pass 
-    return instances,class_ids    
-        
 
 def get_pcd_from_depth(depth_image, depth_intrinsic):
     """[Vectorized computation of point cloud from given depth image and camera matrix]
@@ -353,6 +380,59 @@ def get_pcd_from_depth(depth_image, depth_intrinsic):
     return pts3d, valid_depth_inds
 
 
+class DepthBackProjector(object):
+    """Back-projects depth images with cached per-intrinsics ray grids.
+
+    pts = R (K^-1 [u*d, v*d, d]) + t = d * (R K^-1 [u, v, 1]) + t, so the unit
+    rays K^-1 [u, v, 1] of an image size are computed once per intrinsics and
+    rotation and translation are fused into one multiply-add per pixel. Only
+    max_cached ray grids are kept, ScanNet scenes share few distinct intrinsics.
+    """
+
+    def __init__(self, dtype=np.float32, max_depth=3, max_cached=8):
+        self.dtype = dtype
+        self.max_depth = max_depth
+        self.max_cached = max_cached
+        self._rays = OrderedDict()
+
+    def rays(self, depth_intrinsic, image_shape):
+        """(H*W,3) rays in row-major pixel order, as in get_pcd_from_depth."""
+        intrinsic = np.ascontiguousarray(depth_intrinsic[:3, :3], dtype=np.float64)
+        key = (intrinsic.tobytes(), tuple(image_shape))
+        if key in self._rays:
+            self._rays.move_to_end(key)
+            return self._rays[key]
+        img_inds = np.indices(image_shape).reshape(2, -1).T
+        pixels = np.ones([img_inds.shape[0], 3])
+        pixels[:, 0] = img_inds[:, 1]
+        pixels[:, 1] = img_inds[:, 0]
+        rays = np.matmul(pixels, np.linalg.inv(intrinsic).T).astype(self.dtype)
+        self._rays[key] = rays
+        if len(self._rays) > self.max_cached:
+            self._rays.popitem(last=False)
+        return rays
+
+    def project(self, depth_image, depth_intrinsic, transform, num_samples=None):
+        """Points of the valid depth pixels (0 < depth < max_depth) in the frame
+        of the 4x4 transform. With num_samples, a random subset of at most
+        num_samples valid pixels is projected.
+
+        Returns:
+            (M,3) points of dtype self.dtype
+        """
+        depths = depth_image.reshape(-1)
+        inds = np.flatnonzero((depths > 0) & (depths < self.max_depth))
+        if num_samples is not None and inds.shape[0] > num_samples:
+            inds = np.sort(np.random.choice(inds, num_samples, replace=False))
+        rays = self.rays(depth_intrinsic, depth_image.shape)[inds]
+        rot = transform[:3, :3].astype(self.dtype)
+        tl = transform[:3, 3].astype(self.dtype)
+        pts = np.matmul(rays, rot.T)
+        pts *= depths[inds, None].astype(self.dtype)
+        pts += tl
+        return pts
+
+
 def tsdf_from_depth(grid_shape, VOX_SIZE, TRUNCATION, depth_intrinsic, depth_image, worldToCam, translate, upshift=0):
     """[TSDF computation from given input depth image]
 
@@ -627,24 +707,10 @@ def read_scan_properties(scan_path, scene_name, label_map, axis_align_matrix):
     scene_mesh = scene_mesh.vertices
     object_id_to_segs, label_to_segs = read_aggregation(os.path.join(
         scan_path, "{}_vh_clean.aggregation.json".format(scene_name)))
-    seg_to_verts, num_verts = read_segmentation(os.path.join(
+    seg_indices = read_segmentation_indices(os.path.join(
         scan_path, "{}_vh_clean_2.0.010000.segs.json".format(scene_name)))
-    label_ids = np.zeros(shape=(num_verts), dtype=np.uint32)  # 0: unannotated
-    object_id_to_label_id = {}
-    for label, segs in label_to_segs.items():
-        label_id = label_map[label]
-        for seg in segs:
-            verts = seg_to_verts[seg]
-            label_ids[verts] = label_id
-    instance_ids = np.zeros(
-        shape=(num_verts), dtype=np.uint32)  # 0: unannotated
-    num_instances = len(np.unique(list(object_id_to_segs.keys())))
-    for object_id, segs in object_id_to_segs.items():
-        for seg in segs:
-            verts = seg_to_verts[seg]
-            instance_ids[verts] = object_id
-            if object_id not in object_id_to_label_id:
-                object_id_to_label_id[object_id] = label_ids[verts][0]
+    label_ids, instance_ids, object_id_to_label_id = fill_vertex_labels(
+        seg_indices, object_id_to_segs, label_to_segs, label_map)
     return instance_ids, label_ids, object_id_to_segs, scene_mesh, object_id_to_label_id, colors
 
 
@@ -0,0 +1,82 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+""" Testing the chunked point in box labeling against the per-box loop. """
+
+import os
+import sys
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR)
+from sc_utils import (
+    points_in_boxes_last,
+    get_instance_and_semantic_pcd_from_boxes,
+    get_points_inside_boxes,
+    get_inside_box_mask,
+)
+
+
+def _corners(center, size):
+    offsets = np.array(
+        [[dx, dy, dz] for dx in (-0.5, 0.5) for dy in (-0.5, 0.5) for dz in (-0.5, 0.5)]
+    )
+    return center + offsets * size
+
+
+def _labels_loop(points, boxes, classes):
+    """The per-box loop points_in_boxes_last replaced, later boxes overwrite."""
+    instances = np.zeros(points.shape[0]) - 1
+    class_ids = np.zeros(points.shape[0]) - 1
+    for idx, box in enumerate(boxes):
+        cond = get_inside_box_mask(points, box)
+        instances[cond] = idx
+        class_ids[cond] = classes[idx]
+    return instances, class_ids
+
+
+def _scene(rng, num_points, num_boxes):
+    points = rng.rand(num_points, 3) * 4
+    boxes = [_corners(rng.rand(3) * 4, rng.rand(3) * 1.5 + 0.1) for _ in range(num_boxes)]
+    # a box nested in the first one and a box around both: the last box wins
+    boxes.append(_corners(boxes[0].mean(0), (boxes[0].max(0) - boxes[0].min(0)) * 0.5))
+    boxes.append(_corners(boxes[0].mean(0), (boxes[0].max(0) - boxes[0].min(0)) * 1.01))
+    # points on the corners and faces of the boxes are inside
+    points = np.concatenate([points, np.concatenate(boxes, 0)], 0)
+    classes = rng.randint(1, 40, len(boxes))
+    return points, boxes, classes
+
+
+def test_points_in_boxes_last_matches_loop():
+    """Same instance and class ids as the per-box loop, over several chunks and
+    with overlapping boxes, where the last box containing a point wins."""
+    rng = np.random.RandomState(0)
+    for num_points, num_boxes in [(5000, 12), (300, 1), (2000, 40)]:
+        points, boxes, classes = _scene(rng, num_points, num_boxes)
+        instances, class_ids = _labels_loop(points, boxes, classes)
+        for chunk_size in [64, 1000, 16384]:
+            box_ids = points_in_boxes_last(points, boxes, chunk_size=chunk_size)
+            assert np.array_equal(box_ids, instances.astype(np.int64))
+        new_instances, new_class_ids = get_instance_and_semantic_pcd_from_boxes(
+            points, boxes, classes
+        )
+        assert np.array_equal(new_instances, instances)
+        assert np.array_equal(new_class_ids, class_ids)
+        assert np.array_equal(get_points_inside_boxes(points, boxes), instances >= 0)
+        # the nested box is covered by the last box, which gets all its points
+        inside_first = get_inside_box_mask(points, boxes[0])
+        assert np.all(box_ids[inside_first] == len(boxes) - 1)
+
+
+def test_points_in_boxes_last_empty():
+    points = np.random.RandomState(1).rand(10, 3)
+    assert np.array_equal(points_in_boxes_last(points, []), -np.ones(10, dtype=np.int64))
+    box = _corners(np.zeros(3), np.ones(3))
+    assert points_in_boxes_last(np.zeros((0, 3)), [box]).shape == (0,)
+
+
+if __name__ == "__main__":
+    test_points_in_boxes_last_matches_loop()
+    test_points_in_boxes_last_empty()
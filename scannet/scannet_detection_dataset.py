@@ -19,6 +19,7 @@ import utils.pc_util as pc_util
 from scannet.model_util_scannet import rotate_aligned_boxes
 
 from scannet.model_util_scannet import ScannetDatasetConfig
+from scannet.pack_scannet_data import PackedScannetScenes
 
 DC = ScannetDatasetConfig()
 MAX_NUM_OBJ = 64
@@ -36,21 +37,32 @@ class ScannetDetectionDataset(Dataset):
         rot=None,
         ratio=None,
         custom_path=None,
+        packed_dir=None,
+        sampler=None,
     ):
         self.custom_path = custom_path
 
         self.data_path = os.path.join(BASE_DIR, "scannet_train_detection_data")
-        all_scan_names = list(
-            set(
-                [
-                    os.path.basename(x)[0:12]
-                    for x in os.listdir(self.data_path)
-                    if x.startswith("scene")
-                ]
+        self.packed = None
+        if packed_dir is not None:
+            # scenes come from the split's pack (see pack_scannet_data.py),
+            # the index replaces the directory listing
+            pack_split = "train" if split_set.endswith("train") else split_set
+            self.packed = PackedScannetScenes(pack_split, packed_dir)
+            all_scan_names = self.packed.scan_names
+        else:
+            all_scan_names = list(
+                set(
+                    [
+                        os.path.basename(x)[0:12]
+                        for x in os.listdir(self.data_path)
+                        if x.startswith("scene")
+                    ]
+                )
             )
-        )
+        all_scan_names = set(all_scan_names)
         if split_set == "all":
-            self.scan_names = all_scan_names
+            self.scan_names = sorted(all_scan_names)
 
         elif split_set is "single_train":
             split_filenames = os.path.join(
@@ -121,6 +133,8 @@ class ScannetDetectionDataset(Dataset):
         self.use_height = use_height
         self.augment = augment
         self.rot = rot
+        # utils/point_sampling.py sampler, None keeps pc_util.random_sampling
+        self.sampler = sampler
 
     def __len__(self):
         return len(self.scan_names)
@@ -143,21 +157,36 @@ class ScannetDetectionDataset(Dataset):
         """
 
         scan_name = self.scan_names[idx]
-        mesh_vertices = np.load(os.path.join(self.data_path, scan_name) + "_vert.npy")
-        instance_labels = np.load(
-            os.path.join(self.data_path, scan_name) + "_ins_label.npy"
-        )
-        semantic_labels = np.load(
-            os.path.join(self.data_path, scan_name) + "_sem_label.npy"
-        )
-        instance_bboxes = np.load(os.path.join(self.data_path, scan_name) + "_bbox.npy")
+        if self.packed is not None:
+            # read-only views into the memory map, nothing below writes to them
+            (
+                mesh_vertices,
+                instance_labels,
+                semantic_labels,
+                instance_bboxes,
+            ) = self.packed.load(scan_name)
+        else:
+            mesh_vertices = np.load(
+                os.path.join(self.data_path, scan_name) + "_vert.npy"
+            )
+            instance_labels = np.load(
+                os.path.join(self.data_path, scan_name) + "_ins_label.npy"
+            )
+            semantic_labels = np.load(
+                os.path.join(self.data_path, scan_name) + "_sem_label.npy"
+            )
+            instance_bboxes = np.load(
+                os.path.join(self.data_path, scan_name) + "_bbox.npy"
+            )
 
+        pcl_color = mesh_vertices[:, 3:6]
         if not self.use_color:
             point_cloud = mesh_vertices[:, 0:3]  # do not use color for now
-            pcl_color = mesh_vertices[:, 3:6]
         else:
-            point_cloud = mesh_vertices[:, 0:6]
-            point_cloud[:, 3:] = (point_cloud[:, 3:] - MEAN_COLOR_RGB) / 256.0
+            point_cloud = np.concatenate(
+                [mesh_vertices[:, 0:3], (mesh_vertices[:, 3:6] - MEAN_COLOR_RGB) / 256.0],
+                1,
+            )
 
         if self.use_height and self.rot is None:
             floor_height = np.percentile(point_cloud[:, 2], 0.99)
@@ -172,9 +201,12 @@ class ScannetDetectionDataset(Dataset):
         size_classes = np.zeros((MAX_NUM_OBJ,))
         size_residuals = np.zeros((MAX_NUM_OBJ, 3))
 
-        point_cloud, choices = pc_util.random_sampling(
-            point_cloud, self.num_points, return_choices=True
-        )
+        if self.sampler is None:
+            point_cloud, choices = pc_util.random_sampling(
+                point_cloud, self.num_points, return_choices=True
+            )
+        else:
+            point_cloud, choices = self.sampler(point_cloud, self.num_points, scan_name)
         instance_labels = instance_labels[choices]
         semantic_labels = semantic_labels[choices]
 
@@ -217,20 +249,13 @@ class ScannetDetectionDataset(Dataset):
         # pc instance_labels (it had been filtered
         # in the data preparation step) we'll compute the instance bbox
         # from the points sharing the same instance label.
-        point_votes = np.zeros([self.num_points, 3])
-        point_votes_mask = np.zeros(self.num_points)
-        for i_instance in np.unique(instance_labels):
-            # find all points belong to that instance
-            ind = np.where(instance_labels == i_instance)[0]
-            # find the semantic label
-            if semantic_labels[ind[0]] in DC.nyu40ids:
-                x = point_cloud[ind, :3]
-                center = 0.5 * (x.min(0) + x.max(0))
-                point_votes[ind, :] = center - x
-                point_votes_mask[ind] = 1.0
+        point_votes, point_votes_mask = pc_util.instance_center_votes(
+            point_cloud, instance_labels, semantic_labels, DC.nyu40ids
+        )
         point_votes = np.tile(point_votes, (1, 3))  # make 3 votes identical
 
-        class_ind = [np.where(DC.nyu40ids == x)[0][0] for x in instance_bboxes[:, -1]]
+        # DC.nyu40ids is sorted, the box classes are a subset of it
+        class_ind = np.searchsorted(DC.nyu40ids, instance_bboxes[:, -1])
         # NOTE: set size class as semantic class. Consider use size2class.
         size_classes[0 : instance_bboxes.shape[0]] = class_ind
         size_residuals[0 : instance_bboxes.shape[0], :] = (
@@ -246,10 +271,7 @@ class ScannetDetectionDataset(Dataset):
         ret_dict["size_class_label"] = size_classes.astype(np.int64)
         ret_dict["size_residual_label"] = size_residuals.astype(np.float32)
         target_bboxes_semcls = np.zeros((MAX_NUM_OBJ))
-        target_bboxes_semcls[0 : instance_bboxes.shape[0]] = [
-            DC.nyu40id2class[x]
-            for x in instance_bboxes[:, -1][0 : instance_bboxes.shape[0]]
-        ]
+        target_bboxes_semcls[0 : instance_bboxes.shape[0]] = class_ind
         ret_dict["sem_cls_label"] = target_bboxes_semcls.astype(np.int64)
         ret_dict["box_label_mask"] = target_bboxes_mask.astype(np.float32)
         ret_dict["vote_label"] = point_votes.astype(np.float32)
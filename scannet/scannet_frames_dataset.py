@@ -22,6 +22,7 @@ from sc_utils import (
     get_instance_boxes,
     get_pcd_from_depth,
     corners_to_obb,
+    DepthBackProjector,
 )
 import torch
 
@@ -37,6 +38,9 @@ from sc_utils import (
     get_instance_and_semantic_pcd_from_boxes,
 )
 from model_util_scannet import ScannetDatasetConfig
+from frames_metadata import SceneMetadataCache
+from frame_index import FrameIndex
+from instance_box_cache import load_scene_boxes
 
 DC = ScannetDatasetConfig()
 MAX_NUM_OBJ = 64
@@ -56,6 +60,7 @@ class ScannetDetectionFramesDataset(Dataset):
         center_noise_var=0,
         overfit=False,
         box_noise_var=0,
+        presample_points=None,
     ):
         """[summary]
 
@@ -69,15 +74,28 @@ class ScannetDetectionFramesDataset(Dataset):
         from pandas.core.dtypes.common import classes
                     ratio ([type], optional): [description]. Defaults to None.
                     custom_path ([type], optional): [description]. Defaults to None.
+                    presample_points (int, optional): Number of valid depth pixels randomly kept before back-projection, None projects all of them. Defaults to None.
         """
         self._path = setting["dataset_path"]
         self._train_source = setting["train_source"]
         self._eval_source = setting["eval_source"]
         self._frames_path = setting["frames_path"]
+        self._frame_index_dir = setting.get("frame_index_dir", self._path)
         self.thresh = thresh
 
         self.overfit = overfit
         self.scan_names = self._get_file_names(split_set, thresh)
+        self.metadata = SceneMetadataCache(
+            setting.get(
+                "metadata_cache",
+                os.path.join(self._frames_path, "scene_metadata.npz"),
+            ),
+            self._frames_path,
+        )
+        self.metadata.build(
+            set(item[0][: item[0].rfind("_")] for item in self.scan_names)
+        )
+        self.scene_boxes = self._load_scene_boxes()
 
         self.num_points = num_points
         self._file_length = len(self.scan_names)
@@ -88,44 +106,46 @@ class ScannetDetectionFramesDataset(Dataset):
         self.center_noise_var = center_noise_var
         self.box_size_noise_mean = 0
         self.box_noise_var = box_noise_var
+        self.presample_points = presample_points
+        self.backprojector = DepthBackProjector()
         print("init")
 
     def __len__(self):
         return len(self.scan_names)
 
+    def _load_scene_boxes(self):
+        """Instance box caches of all scenes of the split, (re)built where the
+        instance dirs changed since the cache was written."""
+        dir_mtimes = {}
+        for img_name, mtime in zip(
+            self._frame_index.frames, self._frame_index.dir_mtimes
+        ):
+            img_name = str(img_name)
+            scene_name = img_name[: img_name.rfind("_")]
+            frame = img_name[img_name.rfind("_") + 1 :]
+            dir_mtimes.setdefault(scene_name, {})[frame] = mtime
+        scenes = set(item[0][: item[0].rfind("_")] for item in self.scan_names)
+        return {
+            scene_name: load_scene_boxes(
+                self._path, scene_name, dir_mtimes.get(scene_name)
+            )
+            for scene_name in scenes
+        }
+
     def _get_file_names(self, split_name, thresh=0.3):
         assert split_name in ["train", "val"]
         source = self._train_source
         if split_name == "val":
             source = self._eval_source
 
-        file_names = []
-        with open(source) as f:
-            files = f.readlines()  # FIXME undo this
-        # files = [files,files]
-
-        # files = files[:500]
-        print("Recreating files")
-
         st = time.time()
-        for item in files[:]:
-            item = item.strip()
-            item = item.split("\t")
-            img_name = item[0]
-            item_idx = img_name
-            scene_name = item_idx[: item_idx.rfind("_")]
-            unformatted = item_idx[item_idx.rfind("_") + 1 :]
-
-            instancedir = os.path.join(
-                self._path, scene_name, "PCD", "instances_{}".format(unformatted)
-            )
-
-            objs_in_scene = os.listdir(instancedir)
-            # instances = get_instance_boxes(instancedir,with_classes=False,thresh=thresh)
-
-            scores = np.array([float(a[:-4].split("_")[5]) for a in objs_in_scene])
-            if len(scores[scores > thresh]) > 0:
-                file_names.append([img_name, None])
+        # instance files of every frame are indexed once, see frame_index.py
+        index_path = os.path.join(
+            self._frame_index_dir, "frame_index_{}.npz".format(split_name)
+        )
+        frame_index = FrameIndex.load(source, self._path, index_path)
+        self._frame_index = frame_index
+        file_names = [[img_name, None] for img_name in frame_index.frames_above(thresh)]
         with open("{}_{}.txt".format(str(thresh), split_name), "w") as out:
             for f in file_names:
                 out.write(f[0] + "\n")
@@ -148,45 +168,27 @@ class ScannetDetectionFramesDataset(Dataset):
 
         formatted = format(100 * int(item_idx[item_idx.rfind("_") + 1 :]), "06d")
         unformatted = item_idx[item_idx.rfind("_") + 1 :]
-        axis_align_matrix = get_axis_aligned_matrix(scene_name)
         # pcd_path = os.path.join(self._path,scene_name,"PCD","frame{}.ply".format(formatted)) # maybe reading with trimesh would be faster
 
-        instancedir = os.path.join(
-            self._path, scene_name, "PCD", "instances_{}".format(unformatted)
-        )
-
-        poses = sorted(os.listdir(os.path.join(self._frames_path, scene_name, "pose/")))
-
-        depths = sorted(
-            os.listdir(os.path.join(self._frames_path, scene_name, "depth/"))
-        )
-        pose_path = os.path.join(
-            self._frames_path, scene_name, "pose/" + poses[int(unformatted)]
+        # poses and depths are in sorted file name order, as in the frames dirs
+        axis_align_matrix, depth_intrinsic, poses, depths = self.metadata.get(
+            scene_name
         )
         depth_image_path = os.path.join(
             self._frames_path, scene_name, "depth/" + depths[int(unformatted)]
         )
-        camera_pose = get_camera_pose(pose_path)
-        path_to_depth_intr = os.path.join(
-            self._frames_path, scene_name, "intrinsics_depth.txt"
-        )
-        depth_intrinsic = pd.read_csv(
-            path_to_depth_intr, header=None, delimiter=" "
-        ).values[:, :-1]
+        camera_pose = poses[int(unformatted)]
 
         depth_image = (
             np.array(cv2.imread(depth_image_path, -1), dtype=np.float32) / 1000
         )
-        pts3d, valid_depth_inds = get_pcd_from_depth(
-            depth_image=depth_image, depth_intrinsic=depth_intrinsic
-        )
         transform = np.matmul(axis_align_matrix, camera_pose)
-        rot = transform[:3, :3]
-        tl = transform[:-1, 3]
-        pts = np.matmul(rot, pts3d[valid_depth_inds].T).T + tl
+        pts = self.backprojector.project(
+            depth_image, depth_intrinsic, transform, num_samples=self.presample_points
+        )
         # worldToCam = get_grid_to_camera(camera_pose=camera_pose,axis_align_matrix=axis_align_matrix)
-        boxes, classes = get_instance_boxes(
-            instancedir=instancedir, with_classes=True, thresh=self.thresh
+        boxes, classes = self.scene_boxes[scene_name].get_instance_boxes(
+            unformatted, with_classes=True, thresh=self.thresh
         )
         classes += 0
         instance_labels, semantic_labels = get_instance_and_semantic_pcd_from_boxes(
@@ -254,19 +256,12 @@ class ScannetDetectionFramesDataset(Dataset):
         # pc instance_labels (it had been filtered
         # in the data preparation step) we'll compute the instance bbox
         # from the points sharing the same instance label.
-        point_votes = np.zeros([self.num_points, 3])
-        point_votes_mask = np.zeros(self.num_points)
-        for i_instance in np.unique(instance_labels):
-            # find all points belong to that instance
-            ind = np.where(instance_labels == i_instance)[0]
-            # find the semantic label
-            if semantic_labels[ind[0]] in DC.class_ids:
-                x = point_cloud[ind, :3]
-                center = 0.5 * (x.min(0) + x.max(0))
-                point_votes[ind, :] = center - x
-                point_votes_mask[ind] = 1.0
+        point_votes, point_votes_mask = pc_util.instance_center_votes(
+            point_cloud, instance_labels, semantic_labels, DC.class_ids
+        )
         point_votes = np.tile(point_votes, (1, 3))  # make 3 votes identical
-        class_ind = [np.where(DC.class_ids == x)[0][0] for x in instance_bboxes[:, -1]]
+        # DC.class_ids is sorted, the box classes are a subset of it
+        class_ind = np.searchsorted(DC.class_ids, instance_bboxes[:, -1])
 
         # NOTE: set size class as semantic class. Consider use size2class.
         center_noise = (
@@ -42,6 +42,45 @@ def read_label_mapping(filename, label_from='raw_category', label_to='nyu40id'):
         mapping = {int(k):v for k,v in mapping.items()}
     return mapping
 
+def read_segmentation_indices(filename):
+    ''' Segment id of every vertex as an array, instead of the seg_to_verts
+        dict of read_segmentation. '''
+    assert os.path.isfile(filename)
+    with open(filename) as f:
+        data = json.load(f)
+    return np.array(data['segIndices'], dtype=np.int64)
+
+
+def fill_vertex_labels(seg_indices, object_id_to_segs, label_to_segs, label_map):
+    ''' Per-vertex nyu40 label ids and instance ids from the aggregation, with
+        the same result as assigning seg_to_verts[seg] for every segment of
+        every label and object in order: labels are set per segment and then
+        gathered for all vertices at once.
+    Returns label_ids (N,), instance_ids (N,), object_id_to_label_id '''
+    segs_present, vert_seg = np.unique(seg_indices, return_inverse=True)
+    vert_seg = vert_seg.reshape(-1)
+
+    def seg_positions(segs):
+        segs = np.asarray(segs, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(segs_present, segs), len(segs_present) - 1)
+        missing = segs_present[pos] != segs
+        if np.any(missing):
+            raise KeyError(int(segs[missing][0]))
+        return pos
+
+    seg_label = np.zeros(len(segs_present), dtype=np.uint32) # 0: unannotated
+    for label, segs in label_to_segs.items():
+        seg_label[seg_positions(segs)] = label_map[label]
+    seg_instance = np.zeros(len(segs_present), dtype=np.uint32) # 0: unannotated
+    object_id_to_label_id = {}
+    for object_id, segs in object_id_to_segs.items():
+        if len(segs) == 0: continue
+        pos = seg_positions(segs)
+        seg_instance[pos] = object_id
+        object_id_to_label_id[object_id] = seg_label[pos[0]]
+    return seg_label[vert_seg], seg_instance[vert_seg], object_id_to_label_id
+
+
 def read_mesh_vertices(filename):
     """ read XYZ for each vertex.
     """
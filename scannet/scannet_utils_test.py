@@ -0,0 +1,91 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+""" Testing the per-segment vertex labels against the per-vertex loops. """
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR)
+from scannet_utils import fill_vertex_labels, read_segmentation_indices
+
+
+def _labels_loop(seg_indices, object_id_to_segs, label_to_segs, label_map):
+    """The loops of load_scannet_data.export that fill_vertex_labels replaced."""
+    seg_to_verts = {}
+    for i, seg in enumerate(seg_indices):
+        seg_to_verts.setdefault(seg, []).append(i)
+    num_verts = len(seg_indices)
+    label_ids = np.zeros(shape=(num_verts), dtype=np.uint32)
+    object_id_to_label_id = {}
+    for label, segs in label_to_segs.items():
+        label_id = label_map[label]
+        for seg in segs:
+            verts = seg_to_verts[seg]
+            label_ids[verts] = label_id
+    instance_ids = np.zeros(shape=(num_verts), dtype=np.uint32)
+    for object_id, segs in object_id_to_segs.items():
+        for seg in segs:
+            verts = seg_to_verts[seg]
+            instance_ids[verts] = object_id
+            if object_id not in object_id_to_label_id:
+                object_id_to_label_id[object_id] = label_ids[verts][0]
+    return label_ids, instance_ids, object_id_to_label_id
+
+
+def _aggregation(rng, num_verts, num_segs, num_objects):
+    seg_ids = rng.choice(100000, num_segs, replace=False)
+    seg_indices = seg_ids[rng.randint(0, num_segs, num_verts)]
+    label_map = {"label%d" % (i): i + 1 for i in range(8)}
+    object_id_to_segs, label_to_segs = {}, {}
+    for object_id in rng.permutation(num_objects) + 1:
+        # segments are shared between objects, the later object wins
+        segs = [int(s) for s in rng.choice(np.unique(seg_indices), rng.randint(1, 6))]
+        object_id_to_segs[int(object_id)] = segs
+        label_to_segs.setdefault("label%d" % (rng.randint(8)), []).extend(segs)
+    return seg_indices, object_id_to_segs, label_to_segs, label_map
+
+
+def test_fill_vertex_labels_matches_loop():
+    """Same label ids, instance ids and object labels as the old loops,
+    including segments claimed by several objects and labels."""
+    rng = np.random.RandomState(0)
+    for num_verts, num_segs, num_objects in [(3000, 200, 30), (500, 20, 40), (50, 1, 1)]:
+        aggregation = _aggregation(rng, num_verts, num_segs, num_objects)
+        expected = _labels_loop(*aggregation)
+        label_ids, instance_ids, object_id_to_label_id = fill_vertex_labels(*aggregation)
+        assert label_ids.dtype == expected[0].dtype
+        assert np.array_equal(label_ids, expected[0])
+        assert np.array_equal(instance_ids, expected[1])
+        assert object_id_to_label_id == expected[2]
+
+    seg_indices, object_id_to_segs, label_to_segs, label_map = aggregation
+    try:
+        fill_vertex_labels(seg_indices, {1: [-1]}, label_to_segs, label_map)
+        assert False, "a segment without vertices must fail like the old dict lookup"
+    except KeyError:
+        pass
+
+
+def test_read_segmentation_indices():
+    seg_indices = np.random.RandomState(1).randint(0, 50, 100)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmp_dir, "scene0000_00_vh_clean_2.0.010000.segs.json")
+        with open(filename, "w") as f:
+            json.dump({"segIndices": seg_indices.tolist()}, f)
+        assert np.array_equal(read_segmentation_indices(filename), seg_indices)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    test_fill_vertex_labels_matches_loop()
+    test_read_segmentation_indices()
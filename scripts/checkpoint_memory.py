@@ -0,0 +1,107 @@
+""" Memory/throughput report of the backbone activation checkpointing.
+
+Runs training steps (forward, backward and an Adam step) of a Pointnet2Backbone
+on random scenes with each set of checkpointed stages and reports the time per
+step, the activations saved for the backward pass and the peak CUDA memory.
+The saved activations are counted with saved tensor hooks, so they are also
+reported on CPU; storages shared by several saved tensors count once.
+
+Sample usage:
+python scripts/checkpoint_memory.py --num_point 40000 --batch_size 8 \
+    --stages none sa1 sa1,sa2 sa1,sa2,sa3,sa4,fp1,fp2
+"""
+import os
+import sys
+import time
+import argparse
+import torch
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BASE_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "utils"))
+sys.path.append(os.path.join(ROOT_DIR, "models"))
+
+from backbone_module import Pointnet2Backbone, set_activation_checkpointing, CHECKPOINT_STAGES
+from mixed_precision import autocast, PRECISIONS
+
+
+def _saved_bytes(fn):
+    """Runs fn and returns its result and the bytes of the distinct storages
+    autograd saved for the backward pass while it ran."""
+    storages = {}
+
+    def pack(tensor):
+        storage = tensor.untyped_storage()
+        storages[storage.data_ptr()] = storage.nbytes()
+        return tensor
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+        result = fn()
+    return result, sum(storages.values())
+
+
+def benchmark(net, point_clouds, stages, precision="fp32", steps=5):
+    """Seconds per training step, saved activation bytes and peak CUDA memory
+    in bytes (None on CPU) of net with the given stages checkpointed."""
+    device = point_clouds.device
+    set_activation_checkpointing(net, stages)
+    net.train()
+    optimizer = torch.optim.Adam(net.parameters(), lr=1e-4)
+
+    def step():
+        optimizer.zero_grad()
+        with autocast(device, precision):
+            end_points, saved = _saved_bytes(lambda: net(point_clouds))
+        loss = end_points["fp2_features"].float().pow(2).mean()
+        loss.backward()
+        optimizer.step()
+        return saved
+
+    # warm up, also allocates the Adam state
+    step()
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats(device)
+    start = time.time()
+    for _ in range(steps):
+        saved = step()
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    step_time = (time.time() - start) / steps
+    peak_memory = torch.cuda.max_memory_allocated(device) if device.type == "cuda" else None
+    return step_time, saved, peak_memory
+
+
+def _memory_string(num_bytes):
+    return "n/a" if num_bytes is None else "%.1f MB" % (num_bytes / 2.0 ** 20)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_point", type=int, default=40000, help="Point Number [default: 40000]")
+    parser.add_argument("--batch_size", type=int, default=8)
+    parser.add_argument("--input_feature_dim", type=int, default=1, help="Point feature channels [default: 1, height]")
+    parser.add_argument("--precision", default="fp32", choices=sorted(PRECISIONS))
+    parser.add_argument("--steps", type=int, default=5, help="Timed training steps [default: 5]")
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        default=["none", "sa1", "sa1,sa2", ",".join(CHECKPOINT_STAGES)],
+        help="Comma separated checkpointed stages of each run, none for no checkpointing",
+    )
+    FLAGS = parser.parse_args()
+
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    torch.manual_seed(0)
+    net = Pointnet2Backbone(input_feature_dim=FLAGS.input_feature_dim).to(device)
+    point_clouds = torch.rand(FLAGS.batch_size, FLAGS.num_point, 3 + FLAGS.input_feature_dim, device=device)
+    point_clouds[:, :, 0:3] = point_clouds[:, :, 0:3] * 4 - 2
+
+    print("%-32s %12s %14s %12s" % ("checkpointed stages", "ms per step", "saved", "peak memory"))
+    for run in FLAGS.stages:
+        stages = [] if run == "none" else run.split(",")
+        step_time, saved, peak_memory = benchmark(net, point_clouds, stages, FLAGS.precision, FLAGS.steps)
+        print(
+            "%-32s %12.1f %14s %12s"
+            % (run, 1000 * step_time, _memory_string(saved), _memory_string(peak_memory))
+        )
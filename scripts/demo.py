@@ -28,6 +28,7 @@ sys.path.append(os.path.join(ROOT_DIR, 'utils'))
 sys.path.append(os.path.join(ROOT_DIR, 'models'))
 from pc_util import random_sampling, read_ply
 from ap_helper import parse_predictions
+from checkpoint_registry import load_model_state
 
 def preprocess_point_cloud(point_cloud):
     ''' Prepare the numpy point cloud (N,3) for forward pass '''
@@ -71,13 +72,9 @@ if __name__=='__main__':
         mean_size_arr=DC.mean_size_arr).to(device)
     print('Constructed model.')
     
-    # Load checkpoint
-    optimizer = optim.Adam(net.parameters(), lr=0.001)
-    checkpoint = torch.load(checkpoint_path)
-    net.load_state_dict(checkpoint['model_state_dict'])
-    optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
-    epoch = checkpoint['epoch']
-    print("Loaded checkpoint %s (epoch: %d)"%(checkpoint_path, epoch))
+    # Load checkpoint, a checkpoint file or a log dir with a checkpoint registry
+    net.load_state_dict(load_model_state(checkpoint_path, map_location=device))
+    print("Loaded checkpoint %s"%(checkpoint_path))
    
     # Load and preprocess input point cloud 
     net.eval() # set model to eval mode (for bn and dp)
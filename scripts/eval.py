@@ -20,7 +20,11 @@ BASE_DIR = os.path.dirname(os.path.abspath("/home/yildirir/workspace/votenet/mod
 ROOT_DIR = BASE_DIR
 print(ROOT_DIR)
 sys.path.append(os.path.join(ROOT_DIR, 'models'))
+sys.path.append(os.path.join(ROOT_DIR, 'utils'))
 from ap_helper import APCalculator, parse_predictions, parse_groundtruths
+from mixed_precision import autocast, PRECISIONS
+from proposal_module import set_proposal_gate
+from checkpoint_registry import load_model_state
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--model', default='votenet', help='Model file name [default: votenet]')
@@ -45,6 +49,9 @@ parser.add_argument('--conf_thresh', type=float, default=0.05, help='Filter out
 parser.add_argument('--faster_eval', action='store_true', help='Faster evaluation by skippling empty bounding box removal.')
 parser.add_argument('--shuffle_dataset', action='store_true', help='Shuffle the dataset (random order).')
 parser.add_argument('--thresholds', type=float,nargs="+", default=[0.3],help='thresholds for rejecting objects while loading frames')
+parser.add_argument('--gate_proposals', action='store_true', help='Decode only the proposals with objectness above --conf_thresh (same detections, losses over the kept proposals only).')
+parser.add_argument('--gate_top_k', type=int, default=None, help='With --gate_proposals, decode at most this many proposals per scene.')
+parser.add_argument('--precision', default='fp32', choices=sorted(PRECISIONS), help='Autocast precision of the forward pass, bf16 on CPU. [default: fp32]')
 FLAGS = parser.parse_args()
 
 if FLAGS.use_cls_nms:
@@ -132,18 +139,14 @@ net = Detector(num_class=DATASET_CONFIG.num_class,
                vote_factor=FLAGS.vote_factor,
                sampling=FLAGS.cluster_sampling)
 net.to(device)
+if FLAGS.gate_proposals:
+    set_proposal_gate(net, top_k=FLAGS.gate_top_k, conf_thresh=FLAGS.conf_thresh)
 criterion = MODEL.get_loss
 
-# Load the Adam optimizer
-optimizer = optim.Adam(net.parameters(), lr=0.001)
-
-# Load checkpoint if there is any
-if CHECKPOINT_PATH is not None and os.path.isfile(CHECKPOINT_PATH):
-    checkpoint = torch.load(CHECKPOINT_PATH)
-    net.load_state_dict(checkpoint['model_state_dict'])
-    optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
-    epoch = checkpoint['epoch']
-    log_string("Loaded checkpoint %s (epoch: %d)"%(CHECKPOINT_PATH, epoch))
+# Load checkpoint if there is any, a checkpoint file or a log dir with a checkpoint registry
+if CHECKPOINT_PATH is not None and os.path.exists(CHECKPOINT_PATH):
+    net.load_state_dict(load_model_state(CHECKPOINT_PATH, map_location=device))
+    log_string("Loaded checkpoint %s"%(CHECKPOINT_PATH))
 
 # Used for AP calculation
 CONFIG_DICT = {'remove_empty_box': (not FLAGS.faster_eval), 'use_3d_nms': FLAGS.use_3d_nms, 'nms_iou': FLAGS.nms_iou,
@@ -173,7 +176,7 @@ def evaluate_one_epoch():
                     print(e)
             # Forward pass
             inputs = {'point_clouds': batch_data_label['point_clouds']}
-            with torch.no_grad():
+            with torch.no_grad(), autocast(device, FLAGS.precision):
                 end_points = net(inputs)
 
             # Compute loss
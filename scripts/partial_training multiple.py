@@ -2,8 +2,11 @@
 
 import subprocess
 import os
+import sys
 from subprocess import Popen, PIPE
-import glob
+
+sys.path.append("utils")
+from checkpoint_registry import require_latest_checkpoint, checkpoint_path as registered_path
 
 splits = os.listdir("/home/yildirir/workspace/votenet/splits")
 trial_start = 3
@@ -15,17 +18,10 @@ for n in range(trial_start,trial_end + 1):
         log_dir =  os.path.join("logs","second_random_accumulation_{}_{}".format(idx,n))
         if idx > 0:
             prev_log_dir =  os.path.join("logs","second_random_accumulation_{}_{}".format(idx-1,n))
-            checkpoints = glob.glob("{}/*.tar".format(prev_log_dir))
             print(prev_log_dir)
-            checkpoints.sort(key=os.path.getmtime, reverse=True)
-            
-            start_iter = checkpoints[0]
-            dash = start_iter.rfind("_")
-            dot = start_iter.rfind(".")
-            start_iter = start_iter[dash+1:dot]
-
-
-            checkpoint_path =  os.path.join("logs","second_random_accumulation_{}_{}".format(idx-1,n),"best_checkpoint_{}.tar".format(start_iter))
+            entry = require_latest_checkpoint(prev_log_dir)
+            start_iter = entry["iteration"]
+            checkpoint_path = registered_path(prev_log_dir, entry)
         else:
             # continue
             checkpoint_path =  "NONEXISTING/PATH"
@@ -2,8 +2,11 @@
 
 import subprocess
 import os
+import sys
 from subprocess import Popen, PIPE
-import glob
+
+sys.path.append("utils")
+from checkpoint_registry import require_latest_checkpoint, checkpoint_path as registered_path
 
 
 def select_data_via_entropy(checkpoint_path,idx,n):
@@ -41,31 +44,15 @@ for n in range(trial_start, trial_end + 1):
         if idx > 0:
             prev_log_dir = os.path.join(
                 "logs", "{}_{}_{}".format(exp_name, idx-1, n))
-            checkpoints = glob.glob("{}/*.tar".format(prev_log_dir))
             print(prev_log_dir)
-            checkpoints.sort(key=os.path.getmtime, reverse=True)
-
-            start_iter = checkpoints[0]
-            dash = start_iter.rfind("_")
-            dot = start_iter.rfind(".")
-            start_iter = start_iter[dash+1:dot]
-
-            checkpoint_path = os.path.join("logs", "{}_{}_{}".format(
-                exp_name, idx-1, n), "best_checkpoint_{}.tar".format(start_iter))
+            entry = require_latest_checkpoint(prev_log_dir)
+            start_iter = entry["iteration"]
+            checkpoint_path = registered_path(prev_log_dir, entry)
         else:
             # continue
-            checkpoint_path = "logs/random_accumulation_0_{}".format(n)
-            checkpoints = glob.glob("{}/*.tar".format(checkpoint_path))
-            
-            checkpoints.sort(key=os.path.getmtime, reverse=True)
-
-            start_iter = checkpoints[0]
-            dash = start_iter.rfind("_")
-            dot = start_iter.rfind(".")
-            start_iter = start_iter[dash+1:dot]
-
-            checkpoint_path = os.path.join("logs", "{}_{}_{}".format(
-                "random_accumulation", 0, n), "best_checkpoint_{}.tar".format(start_iter))
+            random_log_dir = "logs/random_accumulation_0_{}".format(n)
+            entry = require_latest_checkpoint(random_log_dir)
+            checkpoint_path = registered_path(random_log_dir, entry)
             start_iter = 0
         
         print("Checkpoint : ", checkpoint_path)
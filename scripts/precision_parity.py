@@ -0,0 +1,155 @@
+""" Parity benchmark of the mixed precision modes.
+
+Runs the same validation scenes through a trained detector in fp32 and in
+--precision and reports, for both, the mean loss terms, the mAP@0.25/0.5,
+the forward latency and the peak CUDA memory. With --train_steps it also
+trains copies of the detector from the same weights on these scenes and prints
+both loss curves, fp16 with loss scaling.
+
+Sample usage:
+python scripts/precision_parity.py --dataset scannet --checkpoint_path log_scannet \
+    --precision bf16 --num_scenes 32 --train_steps 20
+"""
+import os
+import sys
+import copy
+import time
+import argparse
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Subset
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BASE_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "utils"))
+sys.path.append(os.path.join(ROOT_DIR, "models"))
+
+from mixed_precision import autocast, grad_scaler, PRECISIONS
+from ap_helper import APCalculator, parse_predictions, parse_groundtruths
+from detector_cli import AP_IOU_THRESHOLDS, CONFIG_DICT
+
+
+def _to_device(batch_data_label, device):
+    return {
+        key: value.to(device) if torch.is_tensor(value) else value
+        for key, value in batch_data_label.items()
+    }
+
+
+def evaluate(net, criterion, dataloader, dataset_config, device, precision):
+    """Mean loss terms, {iou threshold: mAP}, forward seconds per batch and
+    peak CUDA memory in bytes (None on CPU) of net under precision."""
+    config_dict = dict(CONFIG_DICT, dataset_config=dataset_config)
+    ap_calculators = [APCalculator(t, dataset_config.class2type) for t in AP_IOU_THRESHOLDS]
+    stat_dict = {}
+    forward_time = 0.0
+    if device.type == "cuda":
+        torch.cuda.reset_peak_memory_stats(device)
+    net.eval()
+    for batch_data_label in dataloader:
+        batch_data_label = _to_device(batch_data_label, device)
+        inputs = {"point_clouds": batch_data_label["point_clouds"]}
+        start = time.time()
+        with torch.no_grad(), autocast(device, precision):
+            end_points = net(inputs)
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+        forward_time += time.time() - start
+
+        for key in batch_data_label:
+            assert key not in end_points
+            end_points[key] = batch_data_label[key]
+        with torch.no_grad():
+            loss, end_points = criterion(end_points, dataset_config)
+        for key in end_points:
+            if "loss" in key and torch.is_tensor(end_points[key]):
+                stat_dict[key] = stat_dict.get(key, 0.0) + end_points[key].item()
+
+        batch_pred_map_cls = parse_predictions(end_points, config_dict)
+        batch_gt_map_cls = parse_groundtruths(end_points, config_dict)
+        for ap_calculator in ap_calculators:
+            ap_calculator.step(batch_pred_map_cls, batch_gt_map_cls)
+    num_batches = float(len(dataloader))
+    losses = {key: value / num_batches for key, value in stat_dict.items()}
+    maps = {t: c.compute_metrics()["mAP"] for t, c in zip(AP_IOU_THRESHOLDS, ap_calculators)}
+    peak_memory = torch.cuda.max_memory_allocated(device) if device.type == "cuda" else None
+    return losses, maps, forward_time / num_batches, peak_memory
+
+
+def train_losses(net, criterion, dataloader, dataset_config, device, precision, steps, lr):
+    """Loss of each of steps Adam steps on a copy of net, cycling over
+    dataloader. The numpy and torch seeds are reset, so runs of different
+    precisions see the same batches."""
+    net = copy.deepcopy(net).train()
+    optimizer = torch.optim.Adam(net.parameters(), lr=lr)
+    scaler = grad_scaler(device, precision)
+    torch.manual_seed(0)
+    np.random.seed(0)
+    losses = []
+    while len(losses) < steps:
+        for batch_data_label in dataloader:
+            if len(losses) == steps:
+                break
+            batch_data_label = _to_device(batch_data_label, device)
+            optimizer.zero_grad()
+            with autocast(device, precision):
+                end_points = net({"point_clouds": batch_data_label["point_clouds"]})
+            for key in batch_data_label:
+                end_points[key] = batch_data_label[key]
+            loss, end_points = criterion(end_points, dataset_config)
+            scaler.scale(loss).backward()
+            scaler.step(optimizer)
+            scaler.update()
+            losses.append(loss.item())
+    return losses
+
+
+def _memory_string(num_bytes):
+    return "n/a" if num_bytes is None else "%.1f MB" % (num_bytes / 2.0 ** 20)
+
+
+if __name__ == "__main__":
+    from detector_cli import add_model_args, dataset_config, make_dataset, load_detector
+    from votenet import get_loss
+
+    parser = argparse.ArgumentParser()
+    add_model_args(parser)
+    parser.add_argument("--precision", default="bf16", choices=sorted(PRECISIONS), help="Precision compared against fp32 [default: bf16]")
+    parser.add_argument("--split", default="val", help="Split of the benchmark scenes [default: val]")
+    parser.add_argument("--num_scenes", type=int, default=32, help="Number of benchmark scenes [default: 32]")
+    parser.add_argument("--batch_size", type=int, default=8)
+    parser.add_argument("--train_steps", type=int, default=0, help="Training steps of the loss curve comparison [default: 0]")
+    parser.add_argument("--learning_rate", type=float, default=0.001)
+    FLAGS = parser.parse_args()
+
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    DC = dataset_config(FLAGS)
+    dataset = make_dataset(FLAGS, FLAGS.split)
+    net = load_detector(FLAGS, DC, device)
+
+    scenes = Subset(dataset, range(min(FLAGS.num_scenes, len(dataset))))
+    dataloader = DataLoader(scenes, batch_size=FLAGS.batch_size, shuffle=False, num_workers=0)
+
+    results = {}
+    for precision in ["fp32", FLAGS.precision]:
+        np.random.seed(0)
+        results[precision] = evaluate(net, get_loss, dataloader, DC, device, precision)
+    (ref_losses, ref_maps, ref_time, ref_memory) = results["fp32"]
+    (losses, maps, forward_time, memory) = results[FLAGS.precision]
+    print("%-24s %12s %12s %12s" % ("", "fp32", FLAGS.precision, "delta"))
+    for key in sorted(ref_losses):
+        print("%-24s %12.5f %12.5f %+12.5f" % (key, ref_losses[key], losses[key], losses[key] - ref_losses[key]))
+    for t in AP_IOU_THRESHOLDS:
+        print("%-24s %12.4f %12.4f %+12.4f" % ("mAP@%.2f" % (t), ref_maps[t], maps[t], maps[t] - ref_maps[t]))
+    print("%-24s %12.1f %12.1f" % ("forward ms per batch", 1000 * ref_time, 1000 * forward_time))
+    print("%-24s %12s %12s" % ("peak memory", _memory_string(ref_memory), _memory_string(memory)))
+
+    if FLAGS.train_steps > 0:
+        curves = {
+            precision: train_losses(
+                net, get_loss, dataloader, DC, device, precision, FLAGS.train_steps, FLAGS.learning_rate
+            )
+            for precision in ["fp32", FLAGS.precision]
+        }
+        for step, (a, b) in enumerate(zip(curves["fp32"], curves[FLAGS.precision])):
+            print("train step %3d loss fp32 %.5f %s %.5f" % (step, a, FLAGS.precision, b))
@@ -19,7 +19,9 @@ from torch.utils.data import DataLoader
 BASE_DIR =os.path.dirname(os.path.abspath("models"))
 ROOT_DIR = BASE_DIR
 sys.path.append(os.path.join(ROOT_DIR, 'models'))
+sys.path.append(os.path.join(ROOT_DIR, 'utils'))
 from ap_helper import APCalculator, parse_predictions, parse_groundtruths ,softmax
+from checkpoint_registry import load_model_state
 
 
 # ## Setting up initial parameters and paths
@@ -117,16 +119,10 @@ net = Detector(num_class=DATASET_CONFIG.num_class,
 net.to(device)
 criterion = MODEL.get_loss
 
-# Load the Adam optimizer
-optimizer = optim.Adam(net.parameters(), lr=0.001)
-
-# Load checkpoint if there is any
-if CHECKPOINT_PATH is not None and os.path.isfile(CHECKPOINT_PATH):
-    checkpoint = torch.load(CHECKPOINT_PATH)
-    net.load_state_dict(checkpoint['model_state_dict'])
-    optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
-    epoch = checkpoint['epoch']
-    log_string("Loaded checkpoint %s (epoch: %d)"%(CHECKPOINT_PATH, epoch))
+# Load checkpoint if there is any, a checkpoint file or a log dir with a checkpoint registry
+if CHECKPOINT_PATH is not None and os.path.exists(CHECKPOINT_PATH):
+    net.load_state_dict(load_model_state(CHECKPOINT_PATH, map_location=device))
+    log_string("Loaded checkpoint %s"%(CHECKPOINT_PATH))
 
 # Used for AP calculation
 CONFIG_DICT = {'remove_empty_box': (not FLAGS.faster_eval), 'use_3d_nms': FLAGS.use_3d_nms, 'nms_iou': FLAGS.nms_iou,
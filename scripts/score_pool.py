@@ -0,0 +1,220 @@
+""" Parallel, sharded MC dropout scoring of the unlabeled ScanNet pool.
+
+Splits the pool into shards, scores them with one process per device (or
+--num-workers CPU processes), writes every shard result atomically and skips
+shards that are already done when restarted. The most uncertain --budget scenes
+are then selected with a streaming top-k.
+
+With --prefilter-fraction < 1 scoring runs in two stages: every scene is first
+scored with --prefilter-points points and --prefilter-samples MC samples, then
+only the most uncertain fraction is rescored at full resolution with all
+--num-samples. Rerunning with another fraction or budget rescores the full
+resolution stage, the pre-filter scores are kept. To tune the cutoff, a random
+sample of --audit-samples pruned scenes is also scored at full resolution.
+<out-dir>/rank_agreement.txt gets the rank agreement of both stages on the kept
+scenes and the estimated recall of the full resolution top --budget scenes.
+
+With QUANTIZE = True in the config, CPU workers score with a dynamic int8 copy
+of the model (see models/quantization.py). Its int8 units are QUANTIZE_UNITS
+of the config or are calibrated once on QUANTIZE_SCENES validation scenes, and
+are recorded in <out-dir>/quantized_units.txt for all workers and resumed runs.
+
+Sample usage:
+python scripts/score_pool.py --config-path configs/scannet.py \
+    --pool-path uncertainty_splits/remaining_3.txt --out-dir pool_scores/round_1 \
+    --devices 0,1 --num-shards 64 --budget 120 \
+    --selected-path uncertainty_splits/accumulating_3.txt \
+    --remaining-path uncertainty_splits/remaining_3.txt \
+    --prefilter-fraction 0.25 --prefilter-points 8000 --prefilter-samples 2
+"""
+import os
+import sys
+import math
+import argparse
+import multiprocessing as mp
+
+import torch
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BASE_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "utils"))
+
+from pool_scoring import (
+    load_flags,
+    read_scan_names,
+    write_atomic,
+    make_shards,
+    pending_shards,
+    load_scoring_model,
+    scoring_quantized_units,
+    score_shard,
+    select_top_k,
+    read_scores,
+    rank_agreement,
+    sample_pruned,
+    pruned_top_k_recall,
+    shard_prefix,
+    SHARD_LIST_EXT,
+)
+
+
+def worker_loop(
+    config_path,
+    device_name,
+    task_queue,
+    out_dir,
+    num_samples,
+    num_points,
+    num_threads,
+    quantized_units,
+):
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    FLAGS = load_flags(config_path)
+    device = torch.device(device_name)
+    net = load_scoring_model(FLAGS, device, quantized_units)
+    while True:
+        shard_idx = task_queue.get()
+        if shard_idx is None:
+            break
+        num_scored = score_shard(
+            net, FLAGS, out_dir, shard_idx, num_samples, device, num_points=num_points
+        )
+        print("[%s] shard %d done: %d scenes" % (device_name, shard_idx, num_scored))
+
+
+def get_devices(args):
+    if args.devices == "cpu":
+        return ["cpu"] * args.num_workers
+    return ["cuda:%s" % (d) for d in args.devices.split(",")]
+
+
+def run_stage(
+    args, pool, out_dir, num_samples, num_points=None, quantized_units=None, rebuild=False
+):
+    """Scores all scenes of pool into out_dir, resuming from finished shards.
+    With rebuild, shards recorded for a different pool are scored again."""
+    shards = make_shards(pool, args.num_shards, out_dir, rebuild=rebuild)
+    todo = pending_shards(out_dir, len(shards))
+    print("%s: %d shards, %d already scored" % (out_dir, len(shards), len(shards) - len(todo)))
+    if len(todo) == 0:
+        return
+
+    devices = get_devices(args)
+    num_threads = 0
+    if args.devices == "cpu":
+        num_threads = max(1, mp.cpu_count() // len(devices))
+    ctx = mp.get_context("spawn")
+    task_queue = ctx.Queue()
+    for shard_idx in todo:
+        task_queue.put(shard_idx)
+    for _ in devices:
+        task_queue.put(None)
+    workers = [
+        ctx.Process(
+            target=worker_loop,
+            args=(
+                args.config_path,
+                d,
+                task_queue,
+                out_dir,
+                num_samples,
+                num_points,
+                num_threads,
+                quantized_units,
+            ),
+        )
+        for d in devices
+    ]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    failed = pending_shards(out_dir, len(shards))
+    if len(failed) > 0:
+        for shard_idx in failed:
+            print(
+                "Shard %d failed, no result for the %d scenes of %s"
+                % (shard_idx, len(shards[shard_idx]), shard_prefix(out_dir, shard_idx) + SHARD_LIST_EXT)
+            )
+        print("%d of %d shards of %s failed. Rerun to resume." % (len(failed), len(shards), out_dir))
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config-path", required=True)
+    parser.add_argument("--pool-path", required=True, help="Text file with the candidate scene names")
+    parser.add_argument("--out-dir", required=True, help="Directory for shard lists and shard results")
+    parser.add_argument("--num-shards", type=int, default=32)
+    parser.add_argument("--devices", default="cpu", help="cpu, or comma separated CUDA device ids [default: cpu]")
+    parser.add_argument("--num-workers", type=int, default=4, help="Number of CPU worker processes [default: 4]")
+    parser.add_argument("--num-samples", type=int, default=5, help="Number of MC dropout samples")
+    parser.add_argument("--prefilter-fraction", type=float, default=1.0, help="Fraction of the pool rescored at full resolution, 1 disables the pre-filter [default: 1.0]")
+    parser.add_argument("--prefilter-points", type=int, default=8000, help="Point count of the pre-filter stage [default: 8000]")
+    parser.add_argument("--prefilter-samples", type=int, default=2, help="MC dropout samples of the pre-filter stage [default: 2]")
+    parser.add_argument("--audit-samples", type=int, default=32, help="Pruned scenes scored at full resolution to estimate the recall of the cutoff [default: 32]")
+    parser.add_argument("--audit-seed", type=int, default=0, help="Seed of the audit sample [default: 0]")
+    parser.add_argument("--budget", type=int, default=0, help="Number of scenes to select, 0 only scores")
+    parser.add_argument("--selected-path", default=None, help="Selected scenes are appended to this split file")
+    parser.add_argument("--remaining-path", default=None, help="Unselected scenes are written to this split file")
+    args = parser.parse_args()
+
+    pool = read_scan_names(args.pool_path)
+    # the int8 units are chosen once, all workers score with the same model
+    quantized_units = scoring_quantized_units(load_flags(args.config_path), args.out_dir)
+    if args.prefilter_fraction < 1.0:
+        coarse_dir = os.path.join(args.out_dir, "prefilter")
+        fine_dir = os.path.join(args.out_dir, "full")
+        run_stage(
+            args, pool, coarse_dir, args.prefilter_samples, args.prefilter_points, quantized_units
+        )
+        num_kept = max(args.budget, int(math.ceil(args.prefilter_fraction * len(pool))))
+        kept = [name for _, name in select_top_k(coarse_dir, num_kept)]
+        print("Pre-filter kept %d of %d scenes" % (len(kept), len(pool)))
+        # the kept scenes change with --prefilter-fraction and --budget, a
+        # stale full resolution stage is scored again
+        run_stage(
+            args, kept, fine_dir, args.num_samples, quantized_units=quantized_units, rebuild=True
+        )
+
+        # rank_agreement only sees the survivors, the audit scores a random
+        # sample of the pruned scenes to estimate what the cutoff dropped
+        audit = sample_pruned(pool, kept, args.audit_samples, args.audit_seed)
+        audit_scores = {}
+        if len(audit) > 0:
+            audit_dir = os.path.join(args.out_dir, "audit")
+            run_stage(
+                args, audit, audit_dir, args.num_samples, quantized_units=quantized_units, rebuild=True
+            )
+            audit_scores = read_scores(audit_dir)
+        fine_scores = read_scores(fine_dir)
+        agreement = rank_agreement(read_scores(coarse_dir), fine_scores, args.budget)
+        agreement.update(
+            pruned_top_k_recall(fine_scores, audit_scores, len(pool) - len(kept), args.budget)
+        )
+        write_atomic(
+            os.path.join(args.out_dir, "rank_agreement.txt"),
+            ["%s\t%s" % (key, agreement[key]) for key in sorted(agreement)],
+        )
+        for key in sorted(agreement):
+            print("rank agreement %s: %s" % (key, agreement[key]))
+    else:
+        fine_dir = args.out_dir
+        run_stage(args, pool, fine_dir, args.num_samples, quantized_units=quantized_units)
+
+    if args.budget > 0:
+        selected = [name for _, name in select_top_k(fine_dir, args.budget)]
+        print("Selected %d scenes" % (len(selected)))
+        if args.selected_path is not None:
+            labeled = []
+            if os.path.isfile(args.selected_path):
+                labeled = read_scan_names(args.selected_path)
+            write_atomic(args.selected_path, labeled + selected)
+        if args.remaining_path is not None:
+            selected = set(selected)
+            write_atomic(args.remaining_path, [s for s in pool if s not in selected])
+
+
+if __name__ == "__main__":
+    main()
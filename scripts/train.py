@@ -44,6 +44,9 @@ sys.path.append(os.path.join(ROOT_DIR, "models"))
 
 from ap_helper import APCalculator, parse_predictions, parse_groundtruths
 from initialization_utils import initialize_dataloader, initialize_model, log_string
+from checkpoint_registry import save_checkpoint
+from batch_augment import augment_batch, AUGMENT_SETTINGS
+from mixed_precision import autocast
 
 
 def get_current_lr(epoch, FLAGS):
@@ -110,6 +113,14 @@ def train_one_epoch(net, optimizer, criterion, bnm_scheduler, FLAGS):
                 batch_data_label[key] = batch_data_label[key].to(FLAGS.DEVICE)
 
             # Forward pass
+        if getattr(FLAGS, "BATCH_AUGMENT", False) and FLAGS.DATASET in AUGMENT_SETTINGS:
+            batch_data_label = augment_batch(
+                batch_data_label,
+                FLAGS.DATASET_CONFIG,
+                use_height=(not FLAGS.NO_HEIGHT),
+                use_color=FLAGS.USE_COLOR,
+                **AUGMENT_SETTINGS[FLAGS.DATASET]
+            )
 
         optimizer.zero_grad()
         if "name" not in batch_data_label.keys():
@@ -120,15 +131,18 @@ def train_one_epoch(net, optimizer, criterion, bnm_scheduler, FLAGS):
                 "point_clouds": batch_data_label["point_clouds"],
                 "name": batch_data_label["name"],
             }
-        end_points = net(inputs)
+        with autocast(FLAGS.DEVICE, FLAGS.PRECISION):
+            end_points = net(inputs)
 
         # Compute loss and gradients, update parameters.
+        # The decoded end_points are fp32, the loss runs outside autocast
         for key in batch_data_label:
             assert key not in end_points
             end_points[key] = batch_data_label[key]
         loss, end_points = criterion(end_points, FLAGS.DATASET_CONFIG)
-        loss.backward()
-        optimizer.step()
+        FLAGS.GRAD_SCALER.scale(loss).backward()
+        FLAGS.GRAD_SCALER.step(optimizer)
+        FLAGS.GRAD_SCALER.update()
 
         # pdb.set_trace()
         print("ADDED SIGMA ", FLAGS.SIGMA)
@@ -210,7 +224,7 @@ def evaluate_one_epoch(net, criterion, FLAGS):
             }
 
         # inputs = {'point_clouds': batch_data_label['point_clouds']}
-        with torch.no_grad():
+        with torch.no_grad(), autocast(FLAGS.DEVICE, FLAGS.PRECISION):
             end_points = net(inputs)
 
         # Compute loss8
@@ -300,13 +314,21 @@ def train(FLAGS):
 
             NUM_ITERS_TOTAL = FLAGS.START_ITER + ITERS_PER_EPOCH * epoch
             save_dict["model_state_dict"] = net.state_dict()
-            torch.save(
-                save_dict,
-                os.path.join(
-                    FLAGS.LOG_DIR, "best_checkpoint_{}.tar".format(NUM_ITERS_TOTAL)
-                ),
-            )  #
+            # only metrics of an evaluation of these weights are registered,
+            # best_checkpoint must not rank checkpoints by placeholder values
+            metrics = None
             # loss,curr_map = evaluate_one_epoch(net,criterion,FLAGS)
+            # metrics = {"mAP": curr_map}
+            save_checkpoint(
+                FLAGS.LOG_DIR,
+                NUM_ITERS_TOTAL,
+                save_dict["epoch"],
+                save_dict["model_state_dict"],
+                optimizer_state_dict=save_dict["optimizer_state_dict"],
+                loss=save_dict["loss"],
+                metrics=metrics,
+                split_path=FLAGS.CUSTOM_PATH,
+            )  #
         # Save checkpoint
         save_dict = {
             "epoch": epoch
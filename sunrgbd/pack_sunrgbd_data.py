@@ -0,0 +1,70 @@
+''' Packs the per-scene files written by sunrgbd_data.py into one contiguous,
+memory-mapped file per data folder.
+
+For a folder such as sunrgbd_pc_bbox_votes_50k_v1_train, <packed_dir>/<folder>.bin
+holds the point clouds, votes and boxes of all its scenes and
+<packed_dir>/<folder>_index.npz the scene names, the per-scene row offsets of
+every section and the byte layout of the .bin file (see utils/packed_store.py).
+A sample is then a slice of the memory map instead of decompressing _pc.npz and
+_votes.npz every epoch.
+With --float16 the point clouds and votes are stored as float16, which halves
+the memory needed to keep a whole split in the page cache.
+
+Usage example: python sunrgbd/pack_sunrgbd_data.py --folders sunrgbd_pc_bbox_votes_50k_v1_train sunrgbd_pc_bbox_votes_50k_v1_val
+'''
+import os
+import sys
+import argparse
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BASE_DIR)
+sys.path.append(os.path.join(ROOT_DIR, 'utils'))
+from packed_store import write_pack, PackedScenes
+
+PACKED_DIR = os.path.join(BASE_DIR, 'sunrgbd_packed')
+SECTIONS = ['pc', 'votes', 'bbox']
+# sections that can be stored as float16, the boxes always keep their dtype
+HALF_SECTIONS = ['pc', 'votes']
+
+def load_scene(data_path, scan_name, section):
+    prefix = os.path.join(data_path, scan_name)
+    if section == 'pc':
+        return np.load(prefix + '_pc.npz')['pc']
+    if section == 'votes':
+        return np.load(prefix + '_votes.npz')['point_votes']
+    return np.load(prefix + '_bbox.npy')
+
+def pack_folder(data_path, packed_dir=PACKED_DIR, float16=False):
+    ''' Writes <folder>.bin and <folder>_index.npz for all scenes of data_path.
+    Scenes are read twice, once for the layout and once to stream them to the
+    file, so only one scene is in memory at a time. '''
+    folder = os.path.basename(os.path.normpath(data_path))
+    scan_names = sorted(set(os.path.basename(x)[0:6] for x in os.listdir(data_path)))
+    read_section = lambda scan_name, section, mmap: load_scene(data_path, scan_name, section)
+    dtypes = {s: np.float16 for s in HALF_SECTIONS} if float16 else None
+    return write_pack(scan_names, SECTIONS, read_section, folder, packed_dir,
+        widths={'bbox': 8}, dtypes=dtypes)
+
+class PackedSunrgbdScenes(PackedScenes):
+    ''' Scenes of one packed folder. '''
+
+    def __init__(self, folder, packed_dir=PACKED_DIR):
+        super().__init__(folder, packed_dir, SECTIONS)
+
+    def load(self, scan_name):
+        ''' Returns (point_cloud, bboxes, point_votes) as read-only views into
+        the memory map. '''
+        pc, votes, bbox = super().load(scan_name)
+        return pc, bbox, votes
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--folders', nargs='+', default=['sunrgbd_pc_bbox_votes_50k_v1_train',
+        'sunrgbd_pc_bbox_votes_50k_v1_val'], help='Folders written by sunrgbd_data.py, relative to this directory.')
+    parser.add_argument('--packed_dir', default=PACKED_DIR)
+    parser.add_argument('--float16', action='store_true', help='Store point clouds and votes as float16.')
+    args = parser.parse_args()
+    for folder in args.folders:
+        bin_path, _ = pack_folder(os.path.join(BASE_DIR, folder), args.packed_dir, args.float16)
+        print('Packed %s into %s' % (folder, bin_path))
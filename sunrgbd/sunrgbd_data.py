@@ -168,9 +168,94 @@ def data_viz(data_dir, dump_dir=os.path.join(BASE_DIR, 'data_viz_dump')):
         print('Type anything to continue to the next sample...')
         input()
 
+def compute_point_votes(pc, obbs):
+    """ Ground truth votes of pc (N,3+) for the objects obbs (K,8).
+    Returns (N,10): 0/1 whether the point is in an object's OBB, then three
+    votes. The first object containing a point fills all three slots, the
+    second one the second slot and later ones the third slot. """
+    N = pc.shape[0]
+    point_votes = np.zeros((N,10)) # 3 votes and 1 vote mask 
+    point_vote_idx = np.zeros((N)).astype(np.int32) # in the range of [0,2]
+    for obb in obbs:
+        inds = sunrgbd_utils.points_in_obb(pc, obb[0:3], obb[3:6], obb[6])
+        # Assign first dimension to indicate it is in an object box
+        point_votes[inds,0] = 1
+        sparse_inds = np.flatnonzero(inds)
+        votes = np.expand_dims(obb[0:3],0) - pc[sparse_inds,0:3]
+        slots = point_vote_idx[sparse_inds]
+        # Populate votes with the first vote
+        first = slots == 0
+        point_votes[sparse_inds[first],1:10] = np.tile(votes[first], (1,3))
+        for slot in [1,2]:
+            in_slot = slots == slot
+            point_votes[sparse_inds[in_slot],slot*3+1:slot*3+4] = votes[in_slot]
+        point_vote_idx[sparse_inds] = np.minimum(2, slots+1)
+    return point_votes
+
+def _save_atomic(save_fn, path, **arrays):
+    # write to a temporary name first, so an interrupted run never leaves a
+    # truncated file that a resumed run would skip
+    tmp_path = path[:-4] + '.tmp%d' % (os.getpid()) + path[-4:]
+    save_fn(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+def extract_scene(data_idx, dataset, output_folder, num_point=20000,
+    type_whitelist=DEFAULT_TYPE_WHITELIST, save_votes=False,
+    skip_empty_scene=True, compress=False, resume=True):
+    """ Extracts one scene, see extract_sunrgbd_data. Returns False if the
+    scene was skipped. <id>_bbox.npy is written last and marks a finished scene. """
+    bbox_path = os.path.join(output_folder, '%06d_bbox.npy'%(data_idx))
+    if resume and os.path.exists(bbox_path):
+        return False
+    objects = dataset.get_label_objects(data_idx)
+
+    # Skip scenes with 0 object
+    if skip_empty_scene and (len(objects)==0 or \
+        len([obj for obj in objects if obj.classname in type_whitelist])==0):
+            return False
+
+    object_list = []
+    for obj in objects:
+        if obj.classname not in type_whitelist: continue
+        obb = np.zeros((8))
+        obb[0:3] = obj.centroid
+        # Note that compared with that in data_viz, we do not time 2 to l,w.h
+        # neither do we flip the heading angle
+        obb[3:6] = np.array([obj.l,obj.w,obj.h])
+        obb[6] = obj.heading_angle
+        obb[7] = sunrgbd_utils.type2class[obj.classname]
+        object_list.append(obb)
+    if len(object_list)==0:
+        obbs = np.zeros((0,8))
+    else:
+        obbs = np.vstack(object_list) # (K,8)
+
+    pc_upright_depth = dataset.get_depth(data_idx)
+    pc_upright_depth_subsampled = pc_util.random_sampling(pc_upright_depth, num_point)
+
+    savez = np.savez_compressed if compress else np.savez
+    _save_atomic(savez, os.path.join(output_folder,'%06d_pc.npz'%(data_idx)),
+        pc=pc_upright_depth_subsampled)
+    if save_votes:
+        _save_atomic(savez, os.path.join(output_folder, '%06d_votes.npz'%(data_idx)),
+            point_votes = compute_point_votes(pc_upright_depth_subsampled, obbs))
+    _save_atomic(np.save, bbox_path, arr=obbs)
+    return True
+
+def _extract_scene_star(args):
+    data_idx, kwargs = args
+    dataset = sunrgbd_object('./sunrgbd_trainval', kwargs.pop('split'), use_v1=kwargs.pop('use_v1'))
+    return data_idx, extract_scene(data_idx, dataset, **kwargs)
+
+def _reseed_worker():
+    # forked workers inherit the numpy RNG state of the parent and would draw
+    # the same point subsamples, reseed every worker from fresh entropy
+    np.random.seed()
+
 def extract_sunrgbd_data(idx_filename, split, output_folder, num_point=20000,
     type_whitelist=DEFAULT_TYPE_WHITELIST,
-    save_votes=False, use_v1=False, skip_empty_scene=True):
+    save_votes=False, use_v1=False, skip_empty_scene=True,
+    num_workers=1, compress=False, resume=True):
     """ Extract scene point clouds and 
     bounding boxes (centroids, box sizes, heading angles, semantic classes).
     Dumped point clouds and boxes are in upright depth coord.
@@ -181,6 +266,9 @@ def extract_sunrgbd_data(idx_filename, split, output_folder, num_point=20000,
         save_votes: whether to compute and save Ground truth votes.
         use_v1: use the SUN RGB-D V1 data
         skip_empty_scene: if True, skip scenes that contain no object (no objet in whitelist)
+        num_workers: number of processes the scenes are distributed over
+        compress: write .npz files with np.savez_compressed instead of np.savez
+        resume: skip scenes whose <id>_bbox.npy already exists
 
     Dumps:
         <id>_pc.npz of (N,6) where N is for number of subsampled points and 6 is
@@ -191,74 +279,30 @@ def extract_sunrgbd_data(idx_filename, split, output_folder, num_point=20000,
             then three sets of GT votes for up to three objects. If the point is only in one
             object's OBB, then the three GT votes are the same.
     """
-    dataset = sunrgbd_object('./sunrgbd_trainval', split, use_v1=use_v1)
     data_idx_list = [int(line.rstrip()) for line in open(idx_filename)]
 
     if not os.path.exists(output_folder):
         os.mkdir(output_folder)
 
-    for data_idx in data_idx_list:
-        print('------------- ', data_idx)
-        objects = dataset.get_label_objects(data_idx)
-
-        # Skip scenes with 0 object
-        if skip_empty_scene and (len(objects)==0 or \
-            len([obj for obj in objects if obj.classname in type_whitelist])==0):
-                continue
-
-        object_list = []
-        for obj in objects:
-            if obj.classname not in type_whitelist: continue
-            obb = np.zeros((8))
-            obb[0:3] = obj.centroid
-            # Note that compared with that in data_viz, we do not time 2 to l,w.h
-            # neither do we flip the heading angle
-            obb[3:6] = np.array([obj.l,obj.w,obj.h])
-            obb[6] = obj.heading_angle
-            obb[7] = sunrgbd_utils.type2class[obj.classname]
-            object_list.append(obb)
-        if len(object_list)==0:
-            obbs = np.zeros((0,8))
-        else:
-            obbs = np.vstack(object_list) # (K,8)
-
-        pc_upright_depth = dataset.get_depth(data_idx)
-        pc_upright_depth_subsampled = pc_util.random_sampling(pc_upright_depth, num_point)
-
-        np.savez_compressed(os.path.join(output_folder,'%06d_pc.npz'%(data_idx)),
-            pc=pc_upright_depth_subsampled)
-        np.save(os.path.join(output_folder, '%06d_bbox.npy'%(data_idx)), obbs)
-       
-        if save_votes:
-            N = pc_upright_depth_subsampled.shape[0]
-            point_votes = np.zeros((N,10)) # 3 votes and 1 vote mask 
-            point_vote_idx = np.zeros((N)).astype(np.int32) # in the range of [0,2]
-            indices = np.arange(N)
-            for obj in objects:
-                if obj.classname not in type_whitelist: continue
-                try:
-                    # Find all points in this object's OBB
-                    box3d_pts_3d = sunrgbd_utils.my_compute_box_3d(obj.centroid,
-                        np.array([obj.l,obj.w,obj.h]), obj.heading_angle)
-                    pc_in_box3d,inds = sunrgbd_utils.extract_pc_in_box3d(\
-                        pc_upright_depth_subsampled, box3d_pts_3d)
-                    # Assign first dimension to indicate it is in an object box
-                    point_votes[inds,0] = 1
-                    # Add the votes (all 0 if the point is not in any object's OBB)
-                    votes = np.expand_dims(obj.centroid,0) - pc_in_box3d[:,0:3]
-                    sparse_inds = indices[inds] # turn dense True,False inds to sparse number-wise inds
-                    for i in range(len(sparse_inds)):
-                        j = sparse_inds[i]
-                        point_votes[j, int(point_vote_idx[j]*3+1):int((point_vote_idx[j]+1)*3+1)] = votes[i,:]
-                        # Populate votes with the fisrt vote
-                        if point_vote_idx[j] == 0:
-                            point_votes[j,4:7] = votes[i,:]
-                            point_votes[j,7:10] = votes[i,:]
-                    point_vote_idx[inds] = np.minimum(2, point_vote_idx[inds]+1)
-                except:
-                    print('ERROR ----',  data_idx, obj.classname)
-            np.savez_compressed(os.path.join(output_folder, '%06d_votes.npz'%(data_idx)),
-                point_votes = point_votes)
+    kwargs = dict(split=split, use_v1=use_v1, output_folder=output_folder,
+        num_point=num_point, type_whitelist=type_whitelist, save_votes=save_votes,
+        skip_empty_scene=skip_empty_scene, compress=compress, resume=resume)
+    jobs = [(data_idx, dict(kwargs)) for data_idx in data_idx_list]
+    if num_workers > 1:
+        from multiprocessing import Pool
+        pool = Pool(num_workers, initializer=_reseed_worker)
+        results = pool.imap_unordered(_extract_scene_star, jobs, chunksize=8)
+    else:
+        pool = None
+        results = map(_extract_scene_star, jobs)
+    num_done = 0
+    for data_idx, done in results:
+        num_done += int(done)
+        print('------------- ', data_idx, '' if done else '(skipped)')
+    if pool is not None:
+        pool.close()
+        pool.join()
+    print('Extracted %d of %d scenes to %s' % (num_done, len(data_idx_list), output_folder))
 
     
 def get_box3d_dim_statistics(idx_filename,
@@ -309,6 +353,9 @@ if __name__=='__main__':
     parser.add_argument('--compute_median_size', action='store_true', help='Compute median 3D bounding box sizes for each class.')
     parser.add_argument('--gen_v1_data', action='store_true', help='Generate V1 dataset.')
     parser.add_argument('--gen_v2_data', action='store_true', help='Generate V2 dataset.')
+    parser.add_argument('--num_workers', type=int, default=1, help='Number of processes to extract scenes with.')
+    parser.add_argument('--compress', action='store_true', help='Write compressed .npz files.')
+    parser.add_argument('--overwrite', action='store_true', help='Re-extract scenes that were already extracted.')
     args = parser.parse_args()
 
     if args.viz:
@@ -323,18 +370,22 @@ if __name__=='__main__':
         extract_sunrgbd_data(os.path.join(BASE_DIR, 'sunrgbd_trainval/train_data_idx.txt'),
             split = 'training',
             output_folder = os.path.join(BASE_DIR, 'sunrgbd_pc_bbox_votes_50k_v1_train'),
-            save_votes=True, num_point=50000, use_v1=True, skip_empty_scene=False)
+            save_votes=True, num_point=50000, use_v1=True, skip_empty_scene=False,
+            num_workers=args.num_workers, compress=args.compress, resume=not args.overwrite)
         extract_sunrgbd_data(os.path.join(BASE_DIR, 'sunrgbd_trainval/val_data_idx.txt'),
             split = 'training',
             output_folder = os.path.join(BASE_DIR, 'sunrgbd_pc_bbox_votes_50k_v1_val'),
-            save_votes=True, num_point=50000, use_v1=True, skip_empty_scene=False)
+            save_votes=True, num_point=50000, use_v1=True, skip_empty_scene=False,
+            num_workers=args.num_workers, compress=args.compress, resume=not args.overwrite)
     
     if args.gen_v2_data:
         extract_sunrgbd_data(os.path.join(BASE_DIR, 'sunrgbd_trainval/train_data_idx.txt'),
             split = 'training',
             output_folder = os.path.join(BASE_DIR, 'sunrgbd_pc_bbox_votes_50k_v2_train'),
-            save_votes=True, num_point=50000, use_v1=False, skip_empty_scene=False)
+            save_votes=True, num_point=50000, use_v1=False, skip_empty_scene=False,
+            num_workers=args.num_workers, compress=args.compress, resume=not args.overwrite)
         extract_sunrgbd_data(os.path.join(BASE_DIR, 'sunrgbd_trainval/val_data_idx.txt'),
             split = 'training',
             output_folder = os.path.join(BASE_DIR, 'sunrgbd_pc_bbox_votes_50k_v2_val'),
-            save_votes=True, num_point=50000, use_v1=False, skip_empty_scene=False)
+            save_votes=True, num_point=50000, use_v1=False, skip_empty_scene=False,
+            num_workers=args.num_workers, compress=args.compress, resume=not args.overwrite)
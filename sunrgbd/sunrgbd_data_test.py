@@ -0,0 +1,68 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+""" Testing the vectorized SUN RGB-D votes against the per-point loop. """
+
+import os
+import sys
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR)
+import sunrgbd_utils
+from sunrgbd_data import compute_point_votes
+
+
+def _votes_loop(pc, obbs):
+    """The Delaunay hull and per-point loop compute_point_votes replaced."""
+    N = pc.shape[0]
+    point_votes = np.zeros((N, 10))
+    point_vote_idx = np.zeros((N)).astype(np.int32)
+    indices = np.arange(N)
+    for obb in obbs:
+        box3d_pts_3d = sunrgbd_utils.my_compute_box_3d(obb[0:3], obb[3:6], obb[6])
+        pc_in_box3d, inds = sunrgbd_utils.extract_pc_in_box3d(pc, box3d_pts_3d)
+        point_votes[inds, 0] = 1
+        votes = np.expand_dims(obb[0:3], 0) - pc_in_box3d[:, 0:3]
+        sparse_inds = indices[inds]
+        for i in range(len(sparse_inds)):
+            j = sparse_inds[i]
+            point_votes[j, int(point_vote_idx[j] * 3 + 1) : int((point_vote_idx[j] + 1) * 3 + 1)] = votes[i, :]
+            if point_vote_idx[j] == 0:
+                point_votes[j, 4:7] = votes[i, :]
+                point_votes[j, 7:10] = votes[i, :]
+        point_vote_idx[inds] = np.minimum(2, point_vote_idx[inds] + 1)
+    return point_votes
+
+
+def test_compute_point_votes_matches_loop():
+    """Same vote masks and votes as the old code, with up to four overlapping
+    objects per point so that all three vote slots and the overflow are used."""
+    rng = np.random.RandomState(0)
+    pc = np.concatenate([rng.rand(5000, 3) * 4 - 2, rng.rand(5000, 3)], 1)
+    obbs = np.zeros((10, 8))
+    obbs[:, 0:3] = rng.rand(10, 3) * 2 - 1
+    obbs[:, 3:6] = rng.rand(10, 3) * 0.8 + 0.2
+    obbs[:, 6] = rng.rand(10) * 2 * np.pi - np.pi
+    obbs[:, 7] = rng.randint(0, 10, 10)
+    # four rotated copies of one box around the origin
+    obbs[6:10, 0:3] = 0
+    obbs[6:10, 6] = [0, 0.3, -0.5, 1.2]
+
+    expected = _votes_loop(pc, obbs)
+    point_votes = compute_point_votes(pc, obbs)
+    assert np.array_equal(point_votes[:, 0], expected[:, 0])
+    assert np.allclose(point_votes, expected, rtol=0, atol=1e-12)
+    inside = np.stack(
+        [sunrgbd_utils.points_in_obb(pc, o[0:3], o[3:6], o[6]) for o in obbs], 1
+    )
+    assert inside.sum(1).max() >= 4
+
+    empty = compute_point_votes(pc, np.zeros((0, 8)))
+    assert empty.shape == (5000, 10) and not empty.any()
+
+
+if __name__ == "__main__":
+    test_compute_point_votes_matches_loop()
@@ -32,15 +32,20 @@ sys.path.append(os.path.join(ROOT_DIR, 'utils'))
 import pc_util
 import sunrgbd_utils
 from model_util_sunrgbd import SunrgbdDatasetConfig
+from pack_sunrgbd_data import PackedSunrgbdScenes
 
 DC = SunrgbdDatasetConfig() # dataset specific config
 MAX_NUM_OBJ = 64 # maximum number of objects allowed per scene
 MEAN_COLOR_RGB = np.array([0.5,0.5,0.5]) # sunrgbd color is in 0~1
 
+def _from_pack(a, writable):
+    dtype = np.promote_types(a.dtype, np.float32)
+    return np.array(a, dtype=dtype) if writable else np.asarray(a, dtype=dtype)
+
 class SunrgbdDetectionVotesDataset(Dataset):
     def __init__(self, split_set='train', num_points=20000,
         use_color=False, use_height=False, use_v1=False,
-        augment=False, scan_idx_list=None):
+        augment=False, scan_idx_list=None, sampler=None, packed_dir=None):
 
         assert(num_points<=50000)
         self.use_v1 = use_v1 
@@ -52,14 +57,22 @@ class SunrgbdDetectionVotesDataset(Dataset):
                 'sunrgbd/sunrgbd_pc_bbox_votes_50k_v2_%s'%(split_set))
 
         self.raw_data_path = os.path.join(ROOT_DIR, 'sunrgbd/sunrgbd_trainval')
-        self.scan_names = sorted(list(set([os.path.basename(x)[0:6] \
-            for x in os.listdir(self.data_path)])))
+        self.packed = None
+        if packed_dir is not None:
+            # samples come from the folder's pack (see pack_sunrgbd_data.py)
+            self.packed = PackedSunrgbdScenes(os.path.basename(self.data_path), packed_dir)
+            self.scan_names = list(self.packed.scan_names)
+        else:
+            self.scan_names = sorted(list(set([os.path.basename(x)[0:6] \
+                for x in os.listdir(self.data_path)])))
         if scan_idx_list is not None:
             self.scan_names = [self.scan_names[i] for i in scan_idx_list]
         self.num_points = num_points
         self.augment = augment
         self.use_color = use_color
         self.use_height = use_height
+        # utils/point_sampling.py sampler, None keeps pc_util.random_sampling
+        self.sampler = sampler
        
     def __len__(self):
         return len(self.scan_names)
@@ -83,9 +96,18 @@ class SunrgbdDetectionVotesDataset(Dataset):
             max_gt_bboxes: unused
         """
         scan_name = self.scan_names[idx]
-        point_cloud = np.load(os.path.join(self.data_path, scan_name)+'_pc.npz')['pc'] # Nx6
-        bboxes = np.load(os.path.join(self.data_path, scan_name)+'_bbox.npy') # K,8
-        point_votes = np.load(os.path.join(self.data_path, scan_name)+'_votes.npz')['point_votes'] # Nx10
+        if self.packed is not None:
+            # read-only views, copied only where they are written in place: by
+            # the augmentation and, for the points, by the color centering.
+            # float16 packs are widened to float32, which copies anyway
+            point_cloud, bboxes, point_votes = self.packed.load(scan_name)
+            point_cloud = _from_pack(point_cloud, self.augment or self.use_color)
+            bboxes = _from_pack(bboxes, self.augment)
+            point_votes = _from_pack(point_votes, self.augment)
+        else:
+            point_cloud = np.load(os.path.join(self.data_path, scan_name)+'_pc.npz')['pc'] # Nx6
+            bboxes = np.load(os.path.join(self.data_path, scan_name)+'_bbox.npy') # K,8
+            point_votes = np.load(os.path.join(self.data_path, scan_name)+'_votes.npz')['point_votes'] # Nx10
 
         if not self.use_color:
             point_cloud = point_cloud[:,0:3]
@@ -189,7 +211,10 @@ class SunrgbdDetectionVotesDataset(Dataset):
             target_bbox = np.array([(xmin+xmax)/2, (ymin+ymax)/2, (zmin+zmax)/2, xmax-xmin, ymax-ymin, zmax-zmin])
             target_bboxes[i,:] = target_bbox
 
-        point_cloud, choices = pc_util.random_sampling(point_cloud, self.num_points, return_choices=True)
+        if self.sampler is None:
+            point_cloud, choices = pc_util.random_sampling(point_cloud, self.num_points, return_choices=True)
+        else:
+            point_cloud, choices = self.sampler(point_cloud, self.num_points, scan_name)
         point_votes_mask = point_votes[choices,0]
         point_votes = point_votes[choices,1:]
 
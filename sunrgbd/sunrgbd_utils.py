@@ -222,6 +222,13 @@ def extract_pc_in_box3d(pc, box3d):
     box3d_roi_inds = in_hull(pc[:,0:3], box3d)
     return pc[box3d_roi_inds,:], box3d_roi_inds
 
+def points_in_obb(pc, center, size, heading_angle):
+    ''' Same as extract_pc_in_box3d on the corners of my_compute_box_3d, but
+        with a test in box coordinates instead of a Delaunay hull.
+        pc: (N,3+), size: half lengths (l,w,h). Returns (N,) bool '''
+    local = np.dot(pc[:,0:3] - np.reshape(center, (1,3)), rotz(-1*heading_angle))
+    return np.all(np.abs(local) <= np.reshape(size, (1,3)), axis=1)
+
 
 def my_compute_box_3d(center, size, heading_angle):
     R = rotz(-1*heading_angle)
@@ -0,0 +1,175 @@
+""" Batched data augmentation on the training device.
+
+ScannetDetectionDataset and SunrgbdDetectionVotesDataset augment every sample
+with NumPy inside the DataLoader workers. augment_batch applies the same
+random flips, z rotations, scaling and (SUN RGB-D) color jitter to a collated
+batch that is already on the training device, one random draw per sample,
+with batched matrix ops. The datasets are then built with augment=False and
+workers only read and sample points.
+
+Labels are transformed instead of recomputed from the augmented points:
+centers and votes go through the same per-sample matrix as the points, box
+sizes and headings are updated in closed form and turned back into size and
+heading residuals. For SUN RGB-D this matches the per-sample augmentation. For
+ScanNet, whose votes point to the AABB of the rotated instance points, the
+rotated vote is a close approximation for the +-5 degree rotations used.
+"""
+import numpy as np
+import torch
+
+# same ranges as the per-sample augmentation of the datasets
+AUGMENT_SETTINGS = {
+    "scannet": {
+        "flip_x": True,
+        "flip_y": True,
+        "max_rot_angle": np.pi / 36,
+        "scale_range": None,
+        "oriented_boxes": False,
+        "color_mean": None,
+    },
+    "sunrgbd": {
+        "flip_x": True,
+        "flip_y": False,
+        "max_rot_angle": np.pi / 6,
+        "scale_range": (0.85, 1.15),
+        "oriented_boxes": True,
+        "color_mean": (0.5, 0.5, 0.5),
+    },
+}
+
+
+def _random_sign(batch_size, enabled, device):
+    if not enabled:
+        return torch.ones(batch_size, device=device)
+    return torch.where(
+        torch.rand(batch_size, device=device) > 0.5,
+        -torch.ones(batch_size, device=device),
+        torch.ones(batch_size, device=device),
+    )
+
+
+def _angle2class(angle, num_heading_bin):
+    """Batched version of the dataset configs' angle2class."""
+    angle_per_class = 2 * np.pi / float(num_heading_bin)
+    shifted_angle = torch.remainder(angle + angle_per_class / 2, 2 * np.pi)
+    class_id = torch.floor(shifted_angle / angle_per_class).clamp(max=num_heading_bin - 1)
+    residual = shifted_angle - (class_id * angle_per_class + angle_per_class / 2)
+    return class_id.long(), residual
+
+
+def _jitter_color(colors, color_mean):
+    """Per-sample brightness and shift, per-point jitter and 30% color dropout,
+    as in SunrgbdDetectionVotesDataset. colors: (B,N,3) mean-subtracted."""
+    B, N, _ = colors.shape
+    device = colors.device
+    mean = torch.tensor(color_mean, dtype=colors.dtype, device=device)
+    rgb = colors + mean
+    rgb = rgb * (1 + 0.4 * torch.rand(B, 1, 3, device=device) - 0.2)
+    rgb = rgb + (0.1 * torch.rand(B, 1, 3, device=device) - 0.05)
+    rgb = rgb + (0.05 * torch.rand(B, N, 1, device=device) - 0.025)
+    rgb = rgb.clamp(0, 1)
+    rgb = rgb * (torch.rand(B, N, 1, device=device) > 0.3).to(rgb.dtype)
+    return rgb - mean
+
+
+def augment_batch(
+    batch_data_label,
+    dataset_config,
+    use_height=True,
+    use_color=False,
+    flip_x=True,
+    flip_y=False,
+    max_rot_angle=np.pi / 36,
+    scale_range=None,
+    oriented_boxes=False,
+    color_mean=None,
+):
+    """Augments a collated batch in place and returns it.
+
+    batch_data_label: dict of batched tensors as returned by the DataLoader,
+        with point_clouds (B,N,3+C), center_label (B,K,3), vote_label (B,N,9),
+        size_class_label/size_residual_label, heading_class_label/
+        heading_residual_label and box_label_mask (B,K).
+    dataset_config: ScannetDatasetConfig or SunrgbdDatasetConfig.
+    oriented_boxes: boxes keep their size under rotation and change heading
+        (SUN RGB-D), otherwise boxes are axis aligned and grow to the AABB of
+        the rotated box (ScanNet, rotate_aligned_boxes).
+    """
+    point_clouds = batch_data_label["point_clouds"]
+    B = point_clouds.shape[0]
+    device = point_clouds.device
+    dtype = point_clouds.dtype
+
+    sign_x = _random_sign(B, flip_x, device)
+    sign_y = _random_sign(B, flip_y, device)
+    rot_angle = (torch.rand(B, device=device) * 2 - 1) * max_rot_angle
+    if scale_range is not None:
+        scale = torch.rand(B, device=device) * (scale_range[1] - scale_range[0]) + scale_range[0]
+    else:
+        scale = torch.ones(B, device=device)
+
+    # per sample: scale * rotz(rot_angle) * diag(sign_x, sign_y, 1)
+    c, s = torch.cos(rot_angle), torch.sin(rot_angle)
+    zeros, ones = torch.zeros_like(c), torch.ones_like(c)
+    rot_mat = torch.stack(
+        [c, -s, zeros, s, c, zeros, zeros, zeros, ones], dim=1
+    ).view(B, 3, 3)
+    flip_mat = torch.diag_embed(torch.stack([sign_x, sign_y, ones], dim=1))
+    transform = (scale.view(B, 1, 1) * torch.bmm(rot_mat, flip_mat)).to(dtype)
+    transform_t = transform.transpose(1, 2)
+
+    point_clouds[:, :, 0:3] = torch.bmm(point_clouds[:, :, 0:3], transform_t)
+    if use_color and color_mean is not None:
+        point_clouds[:, :, 3:6] = _jitter_color(point_clouds[:, :, 3:6], color_mean)
+    if use_height:
+        point_clouds[:, :, -1] *= scale.to(dtype).view(B, 1)
+
+    # votes are offsets to the box centers, transformed like the points
+    votes = batch_data_label["vote_label"]
+    N = votes.shape[1]
+    votes = torch.bmm(votes.view(B, N * 3, 3), transform_t).view(B, N, 9)
+    batch_data_label["vote_label"] = votes
+    batch_data_label["center_label"] = torch.bmm(batch_data_label["center_label"], transform_t)
+
+    mask = batch_data_label["box_label_mask"].unsqueeze(-1)
+    mean_size_arr = torch.as_tensor(
+        dataset_config.mean_size_arr, dtype=torch.float32, device=device
+    )
+    size_class = batch_data_label["size_class_label"]
+    sizes = batch_data_label["size_residual_label"] + mean_size_arr[size_class]
+    if oriented_boxes:
+        sizes = sizes * scale.view(B, 1, 1)
+        angle_per_class = 2 * np.pi / float(dataset_config.num_heading_bin)
+        heading = (
+            batch_data_label["heading_class_label"].float() * angle_per_class
+            + batch_data_label["heading_residual_label"]
+        )
+        heading = torch.where(sign_x.view(B, 1) < 0, np.pi - heading, heading)
+        heading = heading - rot_angle.view(B, 1)
+        heading_class, heading_residual = _angle2class(heading, dataset_config.num_heading_bin)
+        box_mask = mask.squeeze(-1)
+        batch_data_label["heading_class_label"] = heading_class * box_mask.long()
+        batch_data_label["heading_residual_label"] = heading_residual * box_mask
+    else:
+        abs_c, abs_s = c.abs().view(B, 1), s.abs().view(B, 1)
+        sizes = torch.stack(
+            [
+                abs_c * sizes[:, :, 0] + abs_s * sizes[:, :, 1],
+                abs_s * sizes[:, :, 0] + abs_c * sizes[:, :, 1],
+                sizes[:, :, 2],
+            ],
+            dim=2,
+        ) * scale.view(B, 1, 1)
+    batch_data_label["size_residual_label"] = (sizes - mean_size_arr[size_class]) * mask
+
+    if "max_gt_bboxes" in batch_data_label:
+        # SUN RGB-D raw boxes: center, half sizes, heading, class
+        max_bboxes = batch_data_label["max_gt_bboxes"]
+        bbox_transform = transform.to(max_bboxes.dtype)
+        max_bboxes[:, :, 0:3] = torch.bmm(max_bboxes[:, :, 0:3], bbox_transform.transpose(1, 2))
+        max_bboxes[:, :, 3:6] *= scale.to(max_bboxes.dtype).view(B, 1, 1)
+        heading = max_bboxes[:, :, 6]
+        heading = torch.where(sign_x.view(B, 1) < 0, np.pi - heading, heading)
+        heading = heading - rot_angle.to(max_bboxes.dtype).view(B, 1)
+        max_bboxes[:, :, 6] = heading * mask.squeeze(-1).to(max_bboxes.dtype)
+    return batch_data_label
@@ -0,0 +1,133 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+""" Testing the batched augmentation against the per-sample SUN RGB-D one. """
+
+import os
+import sys
+import numpy as np
+import torch
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BASE_DIR)
+sys.path.append(BASE_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "sunrgbd"))
+from batch_augment import augment_batch, AUGMENT_SETTINGS
+from model_util_sunrgbd import SunrgbdDatasetConfig
+
+MAX_NUM_OBJ = 64
+
+
+def _rotz(t):
+    c, s = np.cos(t), np.sin(t)
+    return np.array([[c, -s, 0], [s, c, 0], [0, 0, 1]])
+
+
+def _augment_sample(point_cloud, bboxes, point_votes, flip, rot_angle, scale_ratio):
+    """The augmentation of SunrgbdDetectionVotesDataset with given draws."""
+    if flip:
+        point_cloud[:, 0] = -1 * point_cloud[:, 0]
+        bboxes[:, 0] = -1 * bboxes[:, 0]
+        bboxes[:, 6] = np.pi - bboxes[:, 6]
+        point_votes[:, [1, 4, 7]] = -1 * point_votes[:, [1, 4, 7]]
+    rot_mat = _rotz(rot_angle)
+    point_votes_end = np.zeros_like(point_votes)
+    for a in [1, 4, 7]:
+        point_votes_end[:, a : a + 3] = np.dot(
+            point_cloud[:, 0:3] + point_votes[:, a : a + 3], np.transpose(rot_mat)
+        )
+    point_cloud[:, 0:3] = np.dot(point_cloud[:, 0:3], np.transpose(rot_mat))
+    bboxes[:, 0:3] = np.dot(bboxes[:, 0:3], np.transpose(rot_mat))
+    bboxes[:, 6] -= rot_angle
+    for a in [1, 4, 7]:
+        point_votes[:, a : a + 3] = point_votes_end[:, a : a + 3] - point_cloud[:, 0:3]
+    point_cloud[:, 0:3] *= scale_ratio
+    bboxes[:, 0:6] *= scale_ratio
+    point_votes[:, 1:10] *= scale_ratio
+    point_cloud[:, -1] *= scale_ratio
+
+
+def _labels(DC, point_cloud, bboxes, point_votes):
+    """The labels of SunrgbdDetectionVotesDataset, without point sampling."""
+    k = bboxes.shape[0]
+    labels = {
+        "point_clouds": point_cloud,
+        "center_label": np.zeros((MAX_NUM_OBJ, 3)),
+        "heading_class_label": np.zeros(MAX_NUM_OBJ, dtype=np.int64),
+        "heading_residual_label": np.zeros(MAX_NUM_OBJ),
+        "size_class_label": np.zeros(MAX_NUM_OBJ, dtype=np.int64),
+        "size_residual_label": np.zeros((MAX_NUM_OBJ, 3)),
+        "box_label_mask": np.zeros(MAX_NUM_OBJ),
+        "max_gt_bboxes": np.zeros((MAX_NUM_OBJ, 8)),
+        "vote_label": point_votes[:, 1:],
+    }
+    labels["center_label"][:k] = bboxes[:, 0:3]
+    labels["box_label_mask"][:k] = 1
+    labels["max_gt_bboxes"][:k] = bboxes
+    for i, bbox in enumerate(bboxes):
+        angle_class, angle_residual = DC.angle2class(bbox[6])
+        size_class, size_residual = DC.size2class(bbox[3:6] * 2, DC.class2type[bbox[7]])
+        labels["heading_class_label"][i] = angle_class
+        labels["heading_residual_label"][i] = angle_residual
+        labels["size_class_label"][i] = size_class
+        labels["size_residual_label"][i] = size_residual
+    return labels
+
+
+def _scene(rng, num_points, num_boxes):
+    point_cloud = rng.rand(num_points, 4) * 4 - 2
+    bboxes = np.zeros((num_boxes, 8))
+    bboxes[:, 0:3] = rng.rand(num_boxes, 3) * 4 - 2
+    bboxes[:, 3:6] = rng.rand(num_boxes, 3) + 0.2
+    bboxes[:, 6] = rng.rand(num_boxes) * 2 * np.pi - np.pi
+    bboxes[:, 7] = rng.randint(0, 10, num_boxes)
+    point_votes = np.zeros((num_points, 10))
+    point_votes[:, 0] = rng.rand(num_points) > 0.5
+    point_votes[:, 1:] = rng.rand(num_points, 9) - 0.5
+    return point_cloud, bboxes, point_votes
+
+
+def test_augment_batch_matches_sunrgbd_dataset():
+    """With the same random draws, augment_batch gives the labels of the per
+    sample augmentation of SunrgbdDetectionVotesDataset. The draws are replayed
+    from the torch seed in the order augment_batch takes them."""
+    DC = SunrgbdDatasetConfig()
+    settings = AUGMENT_SETTINGS["sunrgbd"]
+    rng = np.random.RandomState(0)
+    B = 6
+    scenes = [_scene(rng, 300, k) for k in [1, 3, 5, 8, 12, 2]]
+    labels = [_labels(DC, *s) for s in scenes]
+    batch = {
+        key: torch.from_numpy(np.stack([l[key] for l in labels])).float()
+        for key in labels[0]
+    }
+    for key in ["heading_class_label", "size_class_label"]:
+        batch[key] = batch[key].long()
+
+    torch.manual_seed(1)
+    augment_batch(batch, DC, use_height=True, use_color=False, **settings)
+
+    torch.manual_seed(1)
+    flip_draws = torch.rand(B).numpy()
+    rot_draws = torch.rand(B).numpy().astype(np.float64)
+    scale_draws = torch.rand(B).numpy().astype(np.float64)
+    low, high = settings["scale_range"]
+    for b, (point_cloud, bboxes, point_votes) in enumerate(scenes):
+        _augment_sample(
+            point_cloud,
+            bboxes,
+            point_votes,
+            flip_draws[b] > 0.5,
+            (rot_draws[b] * 2 - 1) * settings["max_rot_angle"],
+            scale_draws[b] * (high - low) + low,
+        )
+        expected = _labels(DC, point_cloud, bboxes, point_votes)
+        for key, value in expected.items():
+            assert np.allclose(batch[key][b].numpy(), value, atol=1e-4), key
+    assert flip_draws.min() < 0.5 < flip_draws.max()
+
+
+if __name__ == "__main__":
+    test_augment_batch_matches_sunrgbd_dataset()
@@ -0,0 +1,227 @@
+""" Checkpoint registry of a log dir.
+
+Every checkpoint written through save_checkpoint is recorded in
+<log_dir>/checkpoints.json together with its iteration, epoch, metrics, the
+split file it was trained on and a sha1 of the weights. The model weights and
+the training state (optimizer, epoch, loss) go to separate files:
+
+    best_checkpoint_<iter>.tar        {"model_state_dict": ...}
+    best_checkpoint_<iter>.optim.tar  {"epoch", "optimizer_state_dict", "loss"}
+
+so scoring and evaluation only deserialize the weights, and chaining rounds
+reads the index instead of scanning and stat-ing the log dir. Loading a
+registered checkpoint checks the weights file against the recorded sha1.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import torch
+
+INDEX_NAME = "checkpoints.json"
+MODEL_EXT = ".tar"
+TRAIN_STATE_EXT = ".optim.tar"
+CHECKPOINT_PATTERN = re.compile(r"^(?:best_)?checkpoint_?(\d+)\.tar$")
+
+
+def index_path(log_dir):
+    return os.path.join(log_dir, INDEX_NAME)
+
+
+def _write_json_atomic(path, obj):
+    tmp_path = path + ".tmp.%d" % (os.getpid())
+    with open(tmp_path, "w") as f:
+        json.dump(obj, f, indent=2, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _save_atomic(obj, path):
+    tmp_path = path + ".tmp.%d" % (os.getpid())
+    torch.save(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def file_sha1(path, chunk_size=1 << 20):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def read_index(log_dir):
+    """Registered checkpoints of log_dir sorted by iteration, [] if there is no index."""
+    path = index_path(log_dir)
+    if not os.path.isfile(path):
+        return []
+    with open(path, "r") as f:
+        entries = json.load(f)["checkpoints"]
+    return sorted(entries, key=lambda e: e["iteration"])
+
+
+def _update_index(log_dir, entry):
+    entries = [e for e in read_index(log_dir) if e["iteration"] != entry["iteration"]]
+    entries.append(entry)
+    entries.sort(key=lambda e: e["iteration"])
+    _write_json_atomic(index_path(log_dir), {"checkpoints": entries})
+
+
+def save_checkpoint(
+    log_dir,
+    iteration,
+    epoch,
+    model_state_dict,
+    optimizer_state_dict=None,
+    loss=None,
+    metrics=None,
+    split_path=None,
+):
+    """Writes the weights and the training state of one checkpoint and registers it.
+
+    Returns:
+        the index entry of the checkpoint
+    """
+    if not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+    name = "best_checkpoint_{}".format(iteration)
+    model_path = os.path.join(log_dir, name + MODEL_EXT)
+    _save_atomic({"model_state_dict": model_state_dict}, model_path)
+    entry = {
+        "iteration": int(iteration),
+        "epoch": int(epoch),
+        "metrics": {k: float(v) for k, v in (metrics or {}).items()},
+        "split_path": split_path,
+        "model_file": name + MODEL_EXT,
+        "train_state_file": None,
+        "sha1": file_sha1(model_path),
+        "time": time.time(),
+    }
+    if optimizer_state_dict is not None:
+        train_state = {
+            "epoch": epoch,
+            "optimizer_state_dict": optimizer_state_dict,
+            "loss": loss,
+        }
+        _save_atomic(train_state, os.path.join(log_dir, name + TRAIN_STATE_EXT))
+        entry["train_state_file"] = name + TRAIN_STATE_EXT
+    _update_index(log_dir, entry)
+    return entry
+
+
+def index_legacy_checkpoints(log_dir):
+    """Registers *.tar files of a log dir written before the registry existed.
+    The iteration is parsed from the file name, metrics are unknown. This scans
+    the directory once, later lookups only read the index."""
+    known = set(e["model_file"] for e in read_index(log_dir))
+    for f in sorted(os.listdir(log_dir)):
+        match = CHECKPOINT_PATTERN.match(f)
+        if match is None or f in known:
+            continue
+        entry = {
+            "iteration": int(match.group(1)),
+            "epoch": None,
+            "metrics": {},
+            "split_path": None,
+            "model_file": f,
+            "train_state_file": None,
+            "legacy": True,
+            "sha1": file_sha1(os.path.join(log_dir, f)),
+            "time": os.path.getmtime(os.path.join(log_dir, f)),
+        }
+        _update_index(log_dir, entry)
+    return read_index(log_dir)
+
+
+def latest_checkpoint(log_dir):
+    """Entry with the highest iteration, None if log_dir has no checkpoint."""
+    if not os.path.isdir(log_dir):
+        return None
+    entries = read_index(log_dir)
+    if len(entries) == 0:
+        entries = index_legacy_checkpoints(log_dir)
+    return entries[-1] if len(entries) > 0 else None
+
+
+def require_latest_checkpoint(log_dir):
+    """latest_checkpoint that fails with a clear message instead of None."""
+    entry = latest_checkpoint(log_dir)
+    if entry is None:
+        raise FileNotFoundError("No checkpoint in log dir %s" % (log_dir))
+    return entry
+
+
+def best_checkpoint(log_dir, metric="mAP"):
+    """Entry with the highest value of metric, falls back to the latest one."""
+    entries = [e for e in read_index(log_dir) if metric in e["metrics"]]
+    if len(entries) == 0:
+        return latest_checkpoint(log_dir)
+    return max(entries, key=lambda e: e["metrics"][metric])
+
+
+def checkpoint_path(log_dir, entry):
+    return os.path.join(log_dir, entry["model_file"])
+
+
+def resolve_checkpoint(path):
+    """Maps a checkpoint file or a log dir to (model_path, train_state_path).
+    A log dir resolves to its latest registered checkpoint, train_state_path is
+    None if the training state is not stored separately."""
+    if os.path.isdir(path):
+        entry = latest_checkpoint(path)
+        if entry is None:
+            return None, None
+        model_path = checkpoint_path(path, entry)
+    else:
+        model_path = path
+    train_state_path = model_path[: -len(MODEL_EXT)] + TRAIN_STATE_EXT
+    if not os.path.isfile(train_state_path):
+        train_state_path = None
+    return model_path, train_state_path
+
+
+def verify_checkpoint(model_path):
+    """Checks a weights file against the sha1 recorded in the index of its log
+    dir. Files that are not registered there are not checked."""
+    log_dir, name = os.path.split(os.path.abspath(model_path))
+    entries = [e for e in read_index(log_dir) if e["model_file"] == name]
+    if len(entries) == 0 or entries[0].get("sha1") is None:
+        return
+    sha1 = file_sha1(model_path)
+    if sha1 != entries[0]["sha1"]:
+        raise RuntimeError(
+            "Checkpoint %s does not match its registered sha1 (%s, expected %s)"
+            % (model_path, sha1, entries[0]["sha1"])
+        )
+
+
+def load_checkpoint(path, map_location="cpu", with_train_state=True):
+    """Loads a checkpoint file or the latest checkpoint of a log dir.
+    The training state file is only read if with_train_state is set. Legacy
+    checkpoints keep the training state next to the weights in one file.
+
+    Returns:
+        (model_state_dict, train_state) where train_state is a dict with epoch,
+        optimizer_state_dict and loss or None
+    """
+    model_path, train_state_path = resolve_checkpoint(path)
+    if model_path is None:
+        raise FileNotFoundError("No checkpoint in log dir %s" % (path))
+    verify_checkpoint(model_path)
+    checkpoint = torch.load(model_path, map_location=map_location)
+    train_state = None
+    if with_train_state:
+        if train_state_path is not None:
+            train_state = torch.load(train_state_path, map_location=map_location)
+        elif "optimizer_state_dict" in checkpoint:
+            train_state = {
+                k: checkpoint.get(k) for k in ("epoch", "optimizer_state_dict", "loss")
+            }
+    return checkpoint["model_state_dict"], train_state
+
+
+def load_model_state(path, map_location="cpu"):
+    """Loads only the model weights of a checkpoint file or log dir."""
+    return load_checkpoint(path, map_location, with_train_state=False)[0]
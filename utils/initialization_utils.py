@@ -10,6 +10,7 @@ sys.path.append("pointnet2")
 
 from torch import nn
 from pytorch_utils import BNMomentumScheduler
+from pointnet2_modules import set_fps_mode
 from torch.utils.data import DataLoader
 import torch.optim as optim
 import torch
@@ -26,6 +27,10 @@ from model_util_scannet import ScannetDatasetConfig
 from scannet_frames_dataset import ScannetDetectionFramesDataset, MAX_NUM_OBJ
 from model_util_scannet import ScannetDatasetConfig
 from tf_visualizer import Visualizer as TfVisualizer
+from checkpoint_registry import resolve_checkpoint, load_checkpoint
+from point_sampling import make_sampler
+from mixed_precision import grad_scaler
+from backbone_module import set_activation_checkpointing
 
 
 def log_string(logger, out_str):
@@ -46,15 +51,26 @@ def initialize_dataloader(FLAGS):
     FLAGS.LOGGER = open(os.path.join(FLAGS.LOG_DIR, "log_train.txt"), "a")
     FLAGS.LOGGER.write(str(FLAGS) + "\n")  # make this prettier and readable
     # Create Dataset and Dataloader
+    # with BATCH_AUGMENT the train batches are augmented on the device in train.py
+    train_augment = not getattr(FLAGS, "BATCH_AUGMENT", False)
+    # SAMPLING only applies to the training sets, the validation sets keep
+    # pc_util.random_sampling so mAP stays comparable across runs
+    sampler = make_sampler(
+        getattr(FLAGS, "SAMPLING", "random"),
+        pool_dir=getattr(FLAGS, "SAMPLING_POOL_DIR", None),
+        voxel_size=getattr(FLAGS, "VOXEL_SIZE", 0.05),
+    )
     if FLAGS.DATASET == "sunrgbd":
         DATASET_CONFIG = SunrgbdDatasetConfig()
         TRAIN_DATASET = SunrgbdDetectionVotesDataset(
             "train",
             num_points=FLAGS.NUM_POINTS,
-            augment=True,
+            augment=train_augment,
             use_color=FLAGS.USE_COLOR,
             use_height=(not FLAGS.NO_HEIGHT),
             use_v1=(not FLAGS.USE_SUNRGBD_V2),
+            sampler=sampler,
+            packed_dir=getattr(FLAGS, "PACKED_DIR", None),
         )
         TEST_DATASET = SunrgbdDetectionVotesDataset(
             "val",
@@ -63,6 +79,7 @@ def initialize_dataloader(FLAGS):
             use_color=FLAGS.USE_COLOR,
             use_height=(not FLAGS.NO_HEIGHT),
             use_v1=(not FLAGS.USE_SUNRGBD_V2),
+            packed_dir=getattr(FLAGS, "PACKED_DIR", None),
         )
     elif FLAGS.DATASET == "scannet":
         DATASET_CONFIG = ScannetDatasetConfig()
@@ -70,20 +87,24 @@ def initialize_dataloader(FLAGS):
             TRAIN_DATASET = ScannetDetectionDataset(
                 "train",
                 num_points=FLAGS.NUM_POINTS,
-                augment=True,
+                augment=train_augment,
                 use_color=FLAGS.USE_COLOR,
                 use_height=(not FLAGS.NO_HEIGHT),
                 custom_path=FLAGS.CUSTOM_PATH,
+                packed_dir=getattr(FLAGS, "PACKED_DIR", None),
+                sampler=sampler,
             )
         else:
             TRAIN_DATASET = ScannetDetectionDataset(
                 "fractional_train",
                 num_points=FLAGS.NUM_POINTS,
-                augment=True,
+                augment=train_augment,
                 use_color=FLAGS.USE_COLOR,
                 use_height=(not FLAGS.NO_HEIGHT),
                 ratio=FLAGS.RATIO,
                 custom_path=FLAGS.CUSTOM_PATH,
+                packed_dir=getattr(FLAGS, "PACKED_DIR", None),
+                sampler=sampler,
             )
 
         TEST_DATASET = ScannetDetectionDataset(
@@ -92,6 +113,7 @@ def initialize_dataloader(FLAGS):
             augment=False,
             use_color=FLAGS.USE_COLOR,
             use_height=(not FLAGS.NO_HEIGHT),
+            packed_dir=getattr(FLAGS, "PACKED_DIR", None),
         )
 
     elif FLAGS.DATASET == "scannet_frames":
@@ -171,6 +193,15 @@ def initialize_model(FLAGS):
         sampling=FLAGS.CLUSTER_SAMPLING,
         log_var=FLAGS.LOG_VAR,
     )
+    # approximate FPS backends trade a little coverage for backbone latency
+    set_fps_mode(
+        net,
+        getattr(FLAGS, "FPS_MODE", "exact"),
+        track_coverage=getattr(FLAGS, "FPS_COVERAGE", False),
+    )
+    # recompute the activations of these backbone stages in the backward pass
+    # to fit more points or larger batches in memory
+    set_activation_checkpointing(net, getattr(FLAGS, "CHECKPOINT_STAGES", []))
 
     if torch.cuda.device_count() > 1:
         log_string(FLAGS.LOGGER, "Let's use %d GPUs!" % (torch.cuda.device_count()))
@@ -222,15 +253,20 @@ def initialize_model(FLAGS):
     # Load checkpoint if there is any
     it = -1  # for the initialize value of `LambdaLR` and `BNMomentumScheduler`
     start_epoch = 0
-    if FLAGS.CHECKPOINT_PATH is not None and os.path.isfile(FLAGS.CHECKPOINT_PATH):
-        checkpoint = torch.load(FLAGS.CHECKPOINT_PATH)
-        net.load_state_dict(checkpoint["model_state_dict"])
-        optimizer.load_state_dict(checkpoint["optimizer_state_dict"])
-        start_epoch = 0  # checkpoint['epoch']
+    # CHECKPOINT_PATH is either a checkpoint file or a log dir with a checkpoint registry
+    if FLAGS.CHECKPOINT_PATH is not None and os.path.exists(FLAGS.CHECKPOINT_PATH):
+        model_path, _ = resolve_checkpoint(FLAGS.CHECKPOINT_PATH)
+    else:
+        model_path = None
+    if model_path is not None:
+        model_state, train_state = load_checkpoint(model_path, map_location=device)
+        net.load_state_dict(model_state)
+        if train_state is not None:
+            optimizer.load_state_dict(train_state["optimizer_state_dict"])
+        start_epoch = 0  # train_state['epoch']
         log_string(
             FLAGS.LOGGER,
-            "-> loaded checkpoint %s (epoch: %d)"
-            % (FLAGS.CHECKPOINT_PATH, start_epoch),
+            "-> loaded checkpoint %s (epoch: %d)" % (model_path, start_epoch),
         )
 
     FLAGS.START_EPOCH = start_epoch
@@ -244,5 +280,9 @@ def initialize_model(FLAGS):
     )
 
     FLAGS.MODEL = MODEL
+    # PRECISION fp32, bf16 or fp16 sets the autocast of the forward passes,
+    # fp16 training scales the loss with this scaler
+    FLAGS.PRECISION = getattr(FLAGS, "PRECISION", "fp32")
+    FLAGS.GRAD_SCALER = grad_scaler(device, FLAGS.PRECISION)
 
     return net, criterion, optimizer, bnm_scheduler
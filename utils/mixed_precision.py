@@ -0,0 +1,76 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+""" Mixed precision helpers for training and inference.
+
+PRECISION in the config selects fp32 (default), bf16 or fp16. The forward pass
+runs under autocast, bf16 on CPU and bf16 or fp16 on CUDA. The numerically
+sensitive parts run in fp32 regardless: nn_distance and the box decoding are
+wrapped with full_precision, the pointnet2 ops cast their features to fp32 and
+the softmax/entropy of the uncertainty scores is computed on fp32 logits. The
+decoded end_points are therefore fp32 and the losses, parse_predictions and
+the numpy code downstream see the same dtypes as in fp32 runs.
+
+fp16 training scales the loss with a GradScaler to keep small gradients from
+flushing to zero. bf16 has the exponent range of fp32 and needs no scaling.
+"""
+
+import functools
+import contextlib
+import torch
+
+PRECISIONS = {"fp32": None, "bf16": torch.bfloat16, "fp16": torch.float16}
+
+
+def check_precision(precision, device):
+    if precision not in PRECISIONS:
+        raise ValueError(
+            "Unknown precision %s, expected one of %s" % (precision, sorted(PRECISIONS))
+        )
+    if precision == "fp16" and torch.device(device).type == "cpu":
+        raise ValueError("fp16 autocast needs a CUDA device, use bf16 on CPU")
+
+
+def autocast(device, precision):
+    """Autocast context of precision on device, a no-op for fp32."""
+    check_precision(precision, device)
+    if PRECISIONS[precision] is None:
+        return contextlib.nullcontext()
+    return torch.autocast(
+        device_type=torch.device(device).type, dtype=PRECISIONS[precision]
+    )
+
+
+def grad_scaler(device, precision):
+    """GradScaler that scales the loss of fp16 training, disabled otherwise
+    (scale() returns the loss, step() calls optimizer.step())."""
+    check_precision(precision, device)
+    enabled = precision == "fp16"
+    if hasattr(torch.amp, "GradScaler"):
+        return torch.amp.GradScaler(torch.device(device).type, enabled=enabled)
+    return torch.cuda.amp.GradScaler(enabled=enabled)
+
+
+def _to_fp32(x):
+    if torch.is_tensor(x) and x.is_floating_point() and x.dtype != torch.float32:
+        return x.float()
+    return x
+
+
+def full_precision(fn):
+    """Runs fn with autocast disabled and its floating point tensor arguments
+    in fp32. Tensors inside containers (e.g. end_points) are not cast."""
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        args = [_to_fp32(a) for a in args]
+        kwargs = {k: _to_fp32(v) for k, v in kwargs.items()}
+        tensors = [a for a in list(args) + list(kwargs.values()) if torch.is_tensor(a)]
+        if len(tensors) == 0:
+            return fn(*args, **kwargs)
+        with torch.autocast(device_type=tensors[0].device.type, enabled=False):
+            return fn(*args, **kwargs)
+
+    return wrapper
@@ -11,6 +11,7 @@ import torch
 import torch.nn as nn
 import numpy as np
 from box_util import box3d_iou
+from mixed_precision import full_precision
 
 
 def huber_loss(error, delta=1.0):
@@ -32,6 +33,7 @@ def huber_loss(error, delta=1.0):
     loss = 0.5 * quadratic**2 + delta * linear
     return loss
 
+@full_precision
 def nn_distance(pc1, pc2, l1smooth=False, delta=1.0, l1=False):
     """
     Input:
@@ -0,0 +1,165 @@
+""" Packed, memory-mapped store of per-scene arrays.
+
+A pack is <packed_dir>/<name>.bin with the rows of every section (e.g. points,
+labels, boxes) of all scenes, section after section in scene order, and
+<packed_dir>/<name>_index.npz with the scene names, the per-scene row offsets
+of every section and the dtype, byte offset and row width of every section in
+the .bin file. Reading a scene is a zero-copy slice of the memory map, and all
+DataLoader workers share the same page cache. Both files are replaced
+atomically, the .bin first. The .bin ends with a random pack id that is also
+stored in the index together with the .bin size, so a reader that finds a .bin
+and an index of different packs fails instead of slicing with wrong offsets.
+The dataset specific packers
+(scannet/pack_scannet_data.py, sunrgbd/pack_sunrgbd_data.py) only define the
+sections and how to read them from the exported files.
+"""
+import os
+import numpy as np
+
+PACK_ID_BYTES = 16
+
+
+def pack_paths(packed_dir, name):
+    return (
+        os.path.join(packed_dir, name + ".bin"),
+        os.path.join(packed_dir, name + "_index.npz"),
+    )
+
+
+def write_pack(
+    scan_names, sections, read_section, name, packed_dir, widths=None, dtypes=None
+):
+    """Writes <name>.bin and <name>_index.npz for scan_names.
+
+    Args:
+        read_section: read_section(scan_name, section, mmap) returns the array
+            of a section of a scene. It is called with mmap=True for a first
+            pass over the shapes and dtypes (a loader may return a memory map
+            there) and with mmap=False to stream the data, so only one scene is
+            in memory at a time
+        widths: {section: row width} for sections that can be empty (0,)
+            arrays in some scenes; 1-D sections have width 0
+        dtypes: {section: dtype} stored instead of the common dtype of the
+            scenes, e.g. float16
+    Returns:
+        (bin_path, index_path)
+    """
+    if not os.path.exists(packed_dir):
+        os.makedirs(packed_dir)
+    bin_path, index_path = pack_paths(packed_dir, name)
+
+    counts = {s: np.zeros(len(scan_names) + 1, dtype=np.int64) for s in sections}
+    common_dtypes, row_widths = {}, {}
+    for i, scan_name in enumerate(scan_names):
+        for s in sections:
+            arr = read_section(scan_name, s, True)
+            counts[s][i + 1] = arr.shape[0]
+            common_dtypes[s] = np.result_type(common_dtypes.get(s, arr.dtype), arr.dtype)
+            if arr.ndim > 1:
+                row_widths[s] = arr.shape[1]
+    for s, width in (widths or {}).items():
+        row_widths.setdefault(s, width)
+    common_dtypes.update({s: np.dtype(d) for s, d in (dtypes or {}).items()})
+    offsets = {s: np.cumsum(counts[s]) for s in sections}
+
+    byte_offsets = {}
+    total = 0
+    for s in sections:
+        byte_offsets[s] = total
+        total += int(offsets[s][-1]) * max(1, row_widths.get(s, 0)) * common_dtypes[s].itemsize
+
+    pack_id = os.urandom(PACK_ID_BYTES)
+    tmp_path = bin_path + ".tmp.%d" % (os.getpid())
+    with open(tmp_path, "wb") as f:
+        for s in sections:
+            for scan_name in scan_names:
+                arr = read_section(scan_name, s, False)
+                if s in row_widths:
+                    arr = arr.reshape(-1, row_widths[s])
+                f.write(np.ascontiguousarray(arr, dtype=common_dtypes[s]).tobytes())
+        f.write(pack_id)
+    os.replace(tmp_path, bin_path)
+
+    index = {
+        "scan_names": np.array(scan_names),
+        "bin_size": np.int64(total + PACK_ID_BYTES),
+        "pack_id": np.frombuffer(pack_id, dtype=np.uint8),
+    }
+    for s in sections:
+        index[s + "_offsets"] = offsets[s]
+        index[s + "_layout"] = np.array(
+            [str(common_dtypes[s]), byte_offsets[s], row_widths.get(s, 0)]
+        )
+    tmp_path = index_path[: -len(".npz")] + ".tmp.%d.npz" % (os.getpid())
+    np.savez(tmp_path, **index)
+    os.replace(tmp_path, index_path)
+    return bin_path, index_path
+
+
+class PackedScenes(object):
+    """Read-only access to the scenes of one pack.
+    The memory map is opened lazily, so the object is cheap to pickle into
+    DataLoader workers and every worker maps the file itself."""
+
+    def __init__(self, name, packed_dir, sections):
+        self.bin_path, index_path = pack_paths(packed_dir, name)
+        self.section_names = list(sections)
+        index = np.load(index_path)
+        if "pack_id" not in index.files:
+            raise ValueError("%s has no pack id, pack the data again" % (index_path))
+        self.bin_size = int(index["bin_size"])
+        self.pack_id = index["pack_id"].tobytes()
+        self.scan_names = [str(s) for s in index["scan_names"]]
+        self.scan_idx = {s: i for i, s in enumerate(self.scan_names)}
+        self.offsets = {s: index[s + "_offsets"] for s in sections}
+        self.layout = {}
+        for s in sections:
+            dtype, byte_offset, width = index[s + "_layout"]
+            self.layout[s] = (np.dtype(str(dtype)), int(byte_offset), int(width))
+        self.sections = None
+
+    def _check_bin(self):
+        """Fails if the .bin is not the one the index was written for."""
+        matches = os.path.getsize(self.bin_path) == self.bin_size
+        if matches:
+            with open(self.bin_path, "rb") as f:
+                f.seek(self.bin_size - PACK_ID_BYTES)
+                matches = f.read(PACK_ID_BYTES) == self.pack_id
+        if not matches:
+            raise RuntimeError(
+                "%s does not belong to its index, it was repacked or is being "
+                "written; reload the pack" % (self.bin_path)
+            )
+
+    def _open(self):
+        self._check_bin()
+        self.sections = {}
+        for s in self.section_names:
+            dtype, byte_offset, width = self.layout[s]
+            num_rows = int(self.offsets[s][-1])
+            shape = (num_rows, width) if width > 0 else (num_rows,)
+            if num_rows == 0:
+                self.sections[s] = np.zeros(shape, dtype=dtype)
+                continue
+            self.sections[s] = np.memmap(
+                self.bin_path, dtype=dtype, mode="r", offset=byte_offset, shape=shape
+            )
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["sections"] = None
+        return state
+
+    def __contains__(self, scan_name):
+        return scan_name in self.scan_idx
+
+    def load(self, scan_name):
+        """Returns the sections of a scene, in the order of sections, as
+        read-only views into the memory map."""
+        if self.sections is None:
+            self._open()
+        i = self.scan_idx[scan_name]
+        return tuple(
+            self.sections[s][self.offsets[s][i] : self.offsets[s][i + 1]]
+            for s in self.section_names
+        )
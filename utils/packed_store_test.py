@@ -0,0 +1,92 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+""" Testing the packed store round trip and the .bin/index pairing check. """
+
+import os
+import sys
+import shutil
+import pickle
+import tempfile
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR)
+from packed_store import write_pack, pack_paths, PackedScenes
+
+SECTIONS = ["points", "labels", "boxes"]
+
+
+def _scenes(seed, num_scenes):
+    rng = np.random.RandomState(seed)
+    return {
+        "scene%04d_00" % (i): {
+            "points": rng.rand(20 + i, 6).astype(np.float32),
+            "labels": rng.randint(0, 40, 20 + i).astype(np.int64),
+            "boxes": rng.rand(i, 7) if i > 0 else np.zeros((0,)),
+        }
+        for i in range(num_scenes)
+    }
+
+
+def _write(scenes, packed_dir):
+    return write_pack(
+        sorted(scenes),
+        SECTIONS,
+        lambda scan_name, section, mmap: scenes[scan_name][section],
+        "train",
+        packed_dir,
+        widths={"boxes": 7},
+    )
+
+
+def test_pack_round_trip():
+    packed_dir = tempfile.mkdtemp()
+    try:
+        scenes = _scenes(0, 4)
+        _write(scenes, packed_dir)
+        packed = pickle.loads(pickle.dumps(PackedScenes("train", packed_dir, SECTIONS)))
+        for scan_name, arrays in scenes.items():
+            assert scan_name in packed
+            for section, arr in zip(SECTIONS, packed.load(scan_name)):
+                assert np.array_equal(arr, arrays[section].reshape(arr.shape)), section
+        assert not any(f.startswith("train.tmp") for f in os.listdir(packed_dir))
+    finally:
+        shutil.rmtree(packed_dir)
+
+
+def test_mismatched_bin_and_index_fail():
+    """A reader whose index belongs to another .bin fails on open, both for a
+    repacked .bin and for a .bin replaced before its new index was written."""
+    packed_dir = tempfile.mkdtemp()
+    try:
+        _write(_scenes(0, 4), packed_dir)
+        packed = PackedScenes("train", packed_dir, SECTIONS)
+        # same scenes and sizes, only the pack id differs
+        _write(_scenes(1, 4), packed_dir)
+        try:
+            packed.load("scene0000_00")
+            assert False, "a repacked .bin must not be read with the old index"
+        except RuntimeError:
+            pass
+        assert PackedScenes("train", packed_dir, SECTIONS).load("scene0000_00") is not None
+
+        bin_path, index_path = pack_paths(packed_dir, "train")
+        old_index = open(index_path, "rb").read()
+        _write(_scenes(2, 3), packed_dir)
+        with open(index_path, "wb") as f:
+            f.write(old_index)
+        try:
+            PackedScenes("train", packed_dir, SECTIONS).load("scene0000_00")
+            assert False, "a new .bin must not be read with the old index"
+        except RuntimeError:
+            pass
+    finally:
+        shutil.rmtree(packed_dir)
+
+
+if __name__ == "__main__":
+    test_pack_round_trip()
+    test_mismatched_bin_and_index_fail()
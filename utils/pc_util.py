@@ -47,6 +47,51 @@ def random_sampling(pc, num_sample, replace=None, return_choices=False):
         return pc[choices]
 
 
+# ----------------------------------------
+# Vote Labels
+# ----------------------------------------
+
+
+def instance_center_votes(points, instance_labels, semantic_labels, valid_semantic_ids):
+    """Votes from every point to the axis aligned bbox center of its instance.
+    An instance gets votes if the semantic label of its first point is in
+    valid_semantic_ids. Segment min/max over a sort by instance label instead of
+    one np.where scan per instance.
+
+    Input:
+        points: (N,3) xyz
+        instance_labels, semantic_labels: (N,)
+    Output:
+        point_votes: (N,3) center - xyz, 0 for points of invalid instances
+        point_votes_mask: (N,) 1.0 for points of valid instances
+    """
+    num_points = points.shape[0]
+    if num_points == 0:
+        return np.zeros([0, 3]), np.zeros(0)
+    # one stable sort by instance label, instances become contiguous segments
+    sort_keys = instance_labels
+    if sort_keys.dtype.kind in "iu" and 0 <= sort_keys.min() and sort_keys.max() < 65536:
+        # stable sort of 16 bit keys is a radix sort
+        sort_keys = sort_keys.astype(np.uint16)
+    order = np.argsort(sort_keys, kind="stable")
+    sorted_labels = instance_labels[order]
+    new_segment = np.concatenate([[True], sorted_labels[1:] != sorted_labels[:-1]])
+    starts = np.flatnonzero(new_segment)
+    inverse = np.empty(num_points, dtype=np.int64)
+    inverse[order] = np.cumsum(new_segment) - 1
+    xyz = points[:, :3]
+    sorted_xyz = xyz[order]
+    centers = 0.5 * (
+        np.minimum.reduceat(sorted_xyz, starts, axis=0)
+        + np.maximum.reduceat(sorted_xyz, starts, axis=0)
+    )
+    # stable sort: order[starts] is the first point of every instance
+    valid = np.isin(semantic_labels[order[starts]], valid_semantic_ids)[inverse]
+    point_votes = np.where(valid[:, None], centers[inverse] - xyz, 0).astype(np.float64)
+    point_votes_mask = valid.astype(np.float64)
+    return point_votes, point_votes_mask
+
+
 # ----------------------------------------
 # Point Cloud/Volume Conversions
 # ----------------------------------------
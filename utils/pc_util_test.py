@@ -0,0 +1,52 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+""" Testing the vectorized vote labels against the per-instance loop. """
+
+import os
+import sys
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR)
+from pc_util import instance_center_votes
+
+
+def _votes_loop(point_cloud, instance_labels, semantic_labels, valid_semantic_ids):
+    """The loop of the ScanNet datasets that instance_center_votes replaced."""
+    point_votes = np.zeros([point_cloud.shape[0], 3])
+    point_votes_mask = np.zeros(point_cloud.shape[0])
+    for i_instance in np.unique(instance_labels):
+        ind = np.where(instance_labels == i_instance)[0]
+        if semantic_labels[ind[0]] in valid_semantic_ids:
+            x = point_cloud[ind, :3]
+            center = 0.5 * (x.min(0) + x.max(0))
+            point_votes[ind, :] = center - x
+            point_votes_mask[ind] = 1.0
+    return point_votes, point_votes_mask
+
+
+def test_instance_center_votes_matches_loop():
+    """Bitwise identical votes and masks for float32/float64 points, 16 bit and
+    wider instance labels and instances with invalid semantic labels."""
+    rng = np.random.RandomState(0)
+    valid_ids = np.array([3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 14, 16, 24, 28, 33, 34, 36, 39])
+    for dtype in [np.float32, np.float64]:
+        for label_dtype, max_label in [(np.uint32, 50), (np.int64, 100000)]:
+            point_cloud = rng.rand(4000, 4).astype(dtype) * 5
+            instance_labels = rng.randint(0, max_label, 4000).astype(label_dtype)
+            instance_labels[:500] = 0
+            semantic_labels = rng.randint(0, 41, 4000).astype(label_dtype)
+            expected = _votes_loop(point_cloud, instance_labels, semantic_labels, valid_ids)
+            point_votes, point_votes_mask = instance_center_votes(
+                point_cloud, instance_labels, semantic_labels, valid_ids
+            )
+            assert point_votes.dtype == expected[0].dtype
+            assert np.array_equal(point_votes, expected[0])
+            assert np.array_equal(point_votes_mask, expected[1])
+
+
+if __name__ == "__main__":
+    test_instance_center_votes_matches_loop()
@@ -0,0 +1,138 @@
+""" Point subsampling strategies for the detection datasets.
+
+pc_util.random_sampling draws a fresh np.random.choice over all N points for
+every sample, which for N~50k without replacement permutes the whole index
+range. The samplers here are drop-in replacements, called as
+sampler(point_cloud, num_sample, scan_name) -> (point_cloud[choices], choices):
+
+    random   pc_util.random_sampling, the default
+    partial  draws only num_sample indices (partial Fisher-Yates / Floyd)
+    pool     picks one of a few permutation prefixes precomputed per scene and
+             kept in <pool_dir>/<scan_name>_perm.npy
+    voxel    one random point per occupied voxel, so inputs cover the scene
+             uniformly and num_points can be lowered
+"""
+import os
+import numpy as np
+
+import pc_util
+
+SAMPLING_MODES = ["random", "partial", "pool", "voxel"]
+
+
+def _rng():
+    # drawn from the global state, so np.random.seed and the DataLoader
+    # worker_init_fn still control the sampling
+    return np.random.default_rng(np.random.randint(2 ** 31 - 1))
+
+
+def partial_choice(num_points, num_sample, rng=None):
+    """Indices of num_sample points out of num_points, without replacement
+    when there are enough points."""
+    if rng is None:
+        rng = _rng()
+    if num_points < num_sample:
+        return rng.choice(num_points, num_sample, replace=True)
+    return rng.choice(num_points, num_sample, replace=False)
+
+
+def voxel_choice(xyz, num_sample, voxel_size, rng=None):
+    """Indices of num_sample points taking one random point per voxel of
+    voxel_size. If there are more voxels than num_sample a random subset of
+    voxels is kept, if there are fewer the remaining points are drawn at random."""
+    if rng is None:
+        rng = _rng()
+    num_points = xyz.shape[0]
+    grid = np.floor((xyz - xyz.min(0)) / voxel_size).astype(np.int64)
+    dims = grid.max(0) + 1
+    keys = (grid[:, 0] * dims[1] + grid[:, 1]) * dims[2] + grid[:, 2]
+    order = rng.permutation(num_points)
+    # first occurrence in a random order is a random point of the voxel
+    _, first = np.unique(keys[order], return_index=True)
+    reps = order[first]
+    if reps.shape[0] >= num_sample:
+        return reps[rng.choice(reps.shape[0], num_sample, replace=False)]
+    rest = np.ones(num_points, dtype=bool)
+    rest[reps] = False
+    rest = np.flatnonzero(rest)
+    fill = num_sample - reps.shape[0]
+    fill = rest[partial_choice(rest.shape[0], fill, rng)] if rest.shape[0] > 0 else (
+        reps[rng.choice(reps.shape[0], fill, replace=True)]
+    )
+    return np.concatenate([reps, fill])
+
+
+class RandomSampler(object):
+    def __call__(self, pc, num_sample, scan_name=None):
+        return pc_util.random_sampling(pc, num_sample, return_choices=True)
+
+
+class PartialSampler(object):
+    def __call__(self, pc, num_sample, scan_name=None):
+        choices = partial_choice(pc.shape[0], num_sample)
+        return pc[choices], choices
+
+
+class PermutationPoolSampler(object):
+    """Keeps num_permutations random index prefixes of length num_sample per
+    scene on disk and picks one of them per call. The pool of a scene is
+    (re)built when it is missing or was made for a different point count."""
+
+    def __init__(self, pool_dir, num_permutations=8):
+        self.pool_dir = pool_dir
+        self.num_permutations = num_permutations
+        if not os.path.exists(pool_dir):
+            os.makedirs(pool_dir)
+
+    def pool_path(self, scan_name):
+        return os.path.join(self.pool_dir, "%s_perm.npy" % (scan_name))
+
+    def build(self, scan_name, num_points, num_sample):
+        rng = np.random.default_rng()
+        pool = np.stack(
+            [partial_choice(num_points, num_sample, rng) for _ in range(self.num_permutations)]
+        ).astype(np.int64)
+        # the last row stores num_points to detect pools of a re-exported scene
+        pool = np.concatenate([pool, np.full((1, num_sample), num_points)], 0)
+        path = self.pool_path(scan_name)
+        tmp_path = path + ".tmp.%d.npy" % (os.getpid())
+        np.save(tmp_path, pool)
+        os.replace(tmp_path, path)
+        return pool
+
+    def load(self, scan_name, num_points, num_sample):
+        path = self.pool_path(scan_name)
+        if os.path.isfile(path):
+            pool = np.load(path, mmap_mode="r")
+            if pool.shape == (self.num_permutations + 1, num_sample) and pool[-1, 0] == num_points:
+                return pool
+        return self.build(scan_name, num_points, num_sample)
+
+    def __call__(self, pc, num_sample, scan_name=None):
+        if scan_name is None:
+            return PartialSampler()(pc, num_sample)
+        pool = self.load(scan_name, pc.shape[0], num_sample)
+        choices = np.array(pool[np.random.randint(self.num_permutations)])
+        return pc[choices], choices
+
+
+class VoxelSampler(object):
+    def __init__(self, voxel_size=0.05):
+        self.voxel_size = voxel_size
+
+    def __call__(self, pc, num_sample, scan_name=None):
+        choices = voxel_choice(pc[:, 0:3], num_sample, self.voxel_size)
+        return pc[choices], choices
+
+
+def make_sampler(mode="random", pool_dir=None, voxel_size=0.05, num_permutations=8):
+    if mode is None or mode == "random":
+        return RandomSampler()
+    if mode == "partial":
+        return PartialSampler()
+    if mode == "pool":
+        assert pool_dir is not None, "pool sampling needs a pool_dir"
+        return PermutationPoolSampler(pool_dir, num_permutations)
+    if mode == "voxel":
+        return VoxelSampler(voxel_size)
+    raise ValueError("Unknown sampling mode %s, expected one of %s" % (mode, SAMPLING_MODES))
@@ -0,0 +1,54 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+""" Testing the output sizes and the seeding of the point samplers. """
+
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR)
+from point_sampling import make_sampler, voxel_choice, SAMPLING_MODES
+
+
+def test_sampler_sizes_and_seeding():
+    """Every sampler returns num_sample rows matching its choices, distinct
+    indices when there are enough points, and the same choices after
+    np.random.seed, as the DataLoader worker_init_fn relies on."""
+    pool_dir = tempfile.mkdtemp()
+    try:
+        pc = np.random.RandomState(0).rand(5000, 4).astype(np.float32)
+        for mode in SAMPLING_MODES:
+            sampler = make_sampler(mode, pool_dir=pool_dir, voxel_size=0.05)
+            for num_sample in [1000, 8000]:
+                runs = []
+                for _ in range(2):
+                    np.random.seed(3)
+                    points, choices = sampler(pc, num_sample, "scene0000_00")
+                    runs.append(choices)
+                    assert points.shape == (num_sample, 4), mode
+                    assert np.array_equal(points, pc[choices]), mode
+                    if num_sample <= pc.shape[0]:
+                        assert len(np.unique(choices)) == num_sample, mode
+                assert np.array_equal(runs[0], runs[1]), mode
+    finally:
+        shutil.rmtree(pool_dir)
+
+
+def test_voxel_choice_one_point_per_voxel():
+    """With more occupied voxels than num_sample no voxel is picked twice."""
+    rng = np.random.default_rng(0)
+    xyz = rng.random((4000, 3))
+    choices = voxel_choice(xyz, 500, 0.1, rng)
+    keys = np.floor((xyz[choices] - xyz.min(0)) / 0.1).astype(np.int64)
+    assert len(np.unique(keys, axis=0)) == 500
+
+
+if __name__ == "__main__":
+    test_sampler_sizes_and_seeding()
+    test_voxel_choice_one_point_per_voxel()
@@ -0,0 +1,377 @@
+""" Sharded, resumable MC dropout scoring of the unlabeled ScanNet pool.
+
+The candidate scene list is split into shards. Every shard is scored by a
+worker process and its result is written atomically to
+<out_dir>/shard_XXXX.txt as "scene_name<TAB>score" lines, so restarting the
+scoring skips shards that already have a result file. The final selection is a
+streaming top-k over all shard files.
+"""
+import os
+import sys
+import json
+import heapq
+import hashlib
+import importlib.util
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BASE_DIR)
+sys.path.append(ROOT_DIR)
+sys.path.append(BASE_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "models"))
+sys.path.append(os.path.join(ROOT_DIR, "pointnet2"))
+sys.path.append(os.path.join(ROOT_DIR, "scannet"))
+
+from uncertainty_utils import scene_uncertainty
+from mixed_precision import autocast
+from checkpoint_registry import load_model_state
+
+SHARD_LIST_EXT = ".scenes"
+SHARD_RESULT_EXT = ".txt"
+SHARD_SIGNATURE_NAME = "shards.json"
+QUANTIZED_UNITS_NAME = "quantized_units.txt"
+
+
+def load_flags(config_path):
+    """Loads the `C` config object from a python config file, as train.py does."""
+    spec = importlib.util.spec_from_file_location("C", config_path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod.C
+
+
+def read_scan_names(path):
+    with open(path, "r") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def write_atomic(path, lines):
+    """Writes lines to a temporary file and renames it over path.
+    A crashed worker never leaves a partially written result behind."""
+    tmp_path = path + ".tmp.%d" % (os.getpid())
+    with open(tmp_path, "w") as f:
+        for line in lines:
+            f.write(line + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def shard_prefix(out_dir, shard_idx):
+    return os.path.join(out_dir, "shard_%04d" % (shard_idx))
+
+
+def _pool_signature(scan_names, num_shards):
+    h = hashlib.sha1("\n".join(scan_names).encode("utf-8"))
+    return {"num_scenes": len(scan_names), "pool_sha1": h.hexdigest(), "num_shards": int(num_shards)}
+
+
+def _remove_shards(out_dir):
+    for f in os.listdir(out_dir):
+        if f.startswith("shard_") and (f.endswith(SHARD_LIST_EXT) or f.endswith(SHARD_RESULT_EXT)):
+            os.remove(os.path.join(out_dir, f))
+
+
+def make_shards(scan_names, num_shards, out_dir, rebuild=False):
+    """Splits scan_names into num_shards contiguous shards and records the
+    shard lists in out_dir, together with a hash of the pool and num_shards.
+    If the lists already exist (a restarted run) they are reused as is, so
+    resumed runs score exactly the same shards.
+
+    Lists recorded for a different pool or shard count are split again if
+    none of their shards was scored yet. Otherwise they raise a ValueError,
+    or with rebuild are deleted together with their results.
+
+    Returns:
+        list of scene name lists, one per shard
+    """
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    signature = _pool_signature(scan_names, num_shards)
+    signature_path = os.path.join(out_dir, SHARD_SIGNATURE_NAME)
+    existing = sorted(f for f in os.listdir(out_dir) if f.endswith(SHARD_LIST_EXT))
+    if len(existing) > 0:
+        shards = [read_scan_names(os.path.join(out_dir, f)) for f in existing]
+        if os.path.isfile(signature_path):
+            with open(signature_path, "r") as f:
+                matches = json.load(f) == signature
+        else:
+            # written before the signature was recorded
+            matches = [n for shard in shards for n in shard] == list(scan_names)
+        if matches:
+            return shards
+        scored = any(f.endswith(SHARD_RESULT_EXT) for f in os.listdir(out_dir) if f.startswith("shard_"))
+        if scored and not rebuild:
+            raise ValueError(
+                "%s holds the shards of a different pool or shard count, use a new out dir"
+                % (out_dir)
+            )
+        _remove_shards(out_dir)
+
+    num_shards = max(1, min(num_shards, len(scan_names)))
+    shards = [list(s) for s in np.array_split(np.array(scan_names), num_shards)]
+    for shard_idx, shard in enumerate(shards):
+        write_atomic(shard_prefix(out_dir, shard_idx) + SHARD_LIST_EXT, shard)
+    # written last, a crash while writing the lists leaves no valid signature
+    write_atomic(signature_path, [json.dumps(signature, sort_keys=True)])
+    return shards
+
+
+def pending_shards(out_dir, num_shards):
+    """Indices of the shards without a completed result file."""
+    return [
+        i
+        for i in range(num_shards)
+        if not os.path.isfile(shard_prefix(out_dir, i) + SHARD_RESULT_EXT)
+    ]
+
+
+def _float_scoring_model(FLAGS, device):
+    MODEL = importlib.import_module(FLAGS.MODEL)
+    from model_util_scannet import ScannetDatasetConfig
+
+    DATASET_CONFIG = ScannetDatasetConfig()
+    num_input_channel = int(FLAGS.USE_COLOR) * 3 + int(not FLAGS.NO_HEIGHT) * 1
+    net = MODEL.VoteNet(
+        num_class=DATASET_CONFIG.num_class,
+        num_heading_bin=DATASET_CONFIG.num_heading_bin,
+        num_size_cluster=DATASET_CONFIG.num_size_cluster,
+        mean_size_arr=DATASET_CONFIG.mean_size_arr,
+        num_proposal=FLAGS.NUM_TARGET,
+        input_feature_dim=num_input_channel,
+        vote_factor=FLAGS.VOTE_FACTOR,
+        sampling=FLAGS.CLUSTER_SAMPLING,
+        log_var=FLAGS.LOG_VAR,
+    )
+    net.load_state_dict(load_model_state(FLAGS.CHECKPOINT_PATH, map_location=device))
+    net.to(device)
+    net.eval()
+    net.enable_dropouts()
+    return net, DATASET_CONFIG
+
+
+def load_scoring_model(FLAGS, device, quantized_units=None):
+    """Builds the detector from FLAGS and loads only the model weights of
+    FLAGS.CHECKPOINT_PATH, a checkpoint file or a registered log dir (no
+    optimizer, visualizers or log files). With QUANTIZE the named
+    quantized_units run in int8, see scoring_quantized_units."""
+    from proposal_module import set_proposal_gate
+    from quantization import quantize_units
+
+    net, DATASET_CONFIG = _float_scoring_model(FLAGS, device)
+    if getattr(FLAGS, "QUANTIZE", False):
+        if device.type != "cpu":
+            raise ValueError("QUANTIZE needs CPU scoring devices, got %s" % (device))
+        if quantized_units is None:
+            quantized_units = calibrate_quantized_units(net, FLAGS, DATASET_CONFIG)
+        net = quantize_units(net, quantized_units)
+    # scores only the PROPOSAL_GATE_TOP_K proposals of highest objectness; no
+    # threshold, so the score of a scene does not depend on its batch
+    set_proposal_gate(net, top_k=getattr(FLAGS, "PROPOSAL_GATE_TOP_K", None))
+    return net
+
+
+def calibrate_quantized_units(net, FLAGS, dataset_config):
+    """Units of a CPU scoring model that stay in int8 (see
+    models/quantization.py), calibrated on the first FLAGS.QUANTIZE_SCENES
+    validation scenes. Prints the per unit results and the mAP@0.25/0.5 delta
+    on these scenes."""
+    from quantization import (
+        calibration_loader,
+        quantize_with_calibration,
+        quantized_unit_names,
+        print_report,
+    )
+    from scannet_detection_dataset import ScannetDetectionDataset
+
+    dataset = ScannetDetectionDataset(
+        "val",
+        num_points=FLAGS.NUM_POINTS,
+        augment=False,
+        use_color=FLAGS.USE_COLOR,
+        use_height=(not FLAGS.NO_HEIGHT),
+        packed_dir=getattr(FLAGS, "PACKED_DIR", None),
+    )
+    dataloader = calibration_loader(
+        dataset, getattr(FLAGS, "QUANTIZE_SCENES", 8), FLAGS.BATCH_SIZE
+    )
+    _, report = quantize_with_calibration(
+        net, dataloader, dataset_config, getattr(FLAGS, "QUANTIZE_TOLERANCE", 0.05)
+    )
+    print_report(report)
+    return quantized_unit_names(report["units"])
+
+
+def scoring_quantized_units(FLAGS, out_dir):
+    """Int8 units shared by all scoring workers of out_dir, None without
+    QUANTIZE. QUANTIZE_UNITS in the config fixes them, otherwise they are
+    calibrated once on the CPU. They are recorded in out_dir, so resumed runs
+    score their remaining shards with the same model."""
+    if not getattr(FLAGS, "QUANTIZE", False):
+        return None
+    path = os.path.join(out_dir, QUANTIZED_UNITS_NAME)
+    if os.path.isfile(path):
+        return read_scan_names(path)
+    units = getattr(FLAGS, "QUANTIZE_UNITS", None)
+    if units is None:
+        net, DATASET_CONFIG = _float_scoring_model(FLAGS, torch.device("cpu"))
+        units = calibrate_quantized_units(net, FLAGS, DATASET_CONFIG)
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    write_atomic(path, list(units))
+    return list(units)
+
+
+def score_scenes(net, dataloader, num_samples, device, precision="fp32"):
+    """Runs num_samples MC dropout passes per batch, under autocast of
+    precision, and scores every scene.
+
+    Returns:
+        list of (scene_name, score) tuples
+    """
+    scan_names = dataloader.dataset.scan_names
+    rows = []
+    for batch_data_label in dataloader:
+        inputs = {"point_clouds": batch_data_label["point_clouds"].to(device)}
+        with torch.no_grad(), autocast(device, precision):
+            mc_samples = [net(inputs)]
+            if "proposal_inds" in mc_samples[0]:
+                # gated head: the other samples decode the same proposals, so
+                # scene_uncertainty compares them proposal by proposal
+                inputs["proposal_inds"] = mc_samples[0]["proposal_inds"]
+            mc_samples += [net(inputs) for _ in range(num_samples - 1)]
+        scores = scene_uncertainty(mc_samples)
+        for scan_idx, score in zip(batch_data_label["scan_idx"].numpy(), scores):
+            rows.append((scan_names[int(scan_idx)], float(score)))
+    return rows
+
+
+def score_shard(
+    net, FLAGS, out_dir, shard_idx, num_samples, device, num_points=None, num_workers=0
+):
+    """Scores one shard and atomically writes its result file.
+    num_points overrides FLAGS.NUM_POINTS, e.g. for the low resolution pre-filter stage."""
+    from scannet_detection_dataset import ScannetDetectionDataset
+
+    prefix = shard_prefix(out_dir, shard_idx)
+    dataset = ScannetDetectionDataset(
+        "fractional_train",
+        num_points=FLAGS.NUM_POINTS if num_points is None else num_points,
+        augment=False,
+        use_color=FLAGS.USE_COLOR,
+        use_height=(not FLAGS.NO_HEIGHT),
+        custom_path=prefix + SHARD_LIST_EXT,
+        packed_dir=getattr(FLAGS, "PACKED_DIR", None),
+    )
+    dataloader = DataLoader(
+        dataset, batch_size=FLAGS.BATCH_SIZE, shuffle=False, num_workers=num_workers
+    )
+    rows = score_scenes(
+        net, dataloader, num_samples, device, getattr(FLAGS, "PRECISION", "fp32")
+    )
+    write_atomic(
+        prefix + SHARD_RESULT_EXT, ["%s\t%.8f" % (name, score) for name, score in rows]
+    )
+    return len(rows)
+
+
+def iter_shard_scores(out_dir):
+    """Streams (score, scene_name) over all completed shard result files."""
+    for f in sorted(os.listdir(out_dir)):
+        if not (f.startswith("shard_") and f.endswith(SHARD_RESULT_EXT)):
+            continue
+        with open(os.path.join(out_dir, f), "r") as fin:
+            for line in fin:
+                name, score = line.rstrip("\n").split("\t")
+                yield float(score), name
+
+
+def select_top_k(out_dir, k):
+    """Streaming top-k over the merged shard results. Only k entries are kept in
+    memory at any time, the full ranking is never materialized.
+
+    Returns:
+        list of (score, scene_name), most uncertain first
+    """
+    return heapq.nlargest(k, iter_shard_scores(out_dir))
+
+
+def read_scores(out_dir):
+    """All shard results of out_dir as a {scene_name: score} dict."""
+    return {name: score for score, name in iter_shard_scores(out_dir)}
+
+
+def rank_agreement(coarse_scores, fine_scores, budget):
+    """Compares the pre-filter ranking against the full resolution ranking on the
+    scenes that were scored by both stages.
+
+    Args:
+        coarse_scores, fine_scores: {scene_name: score} dicts
+        budget: size of the final selection
+    Returns:
+        dict with the Spearman rank correlation and the overlap of the top-budget
+        scenes of both rankings, used to tune the pre-filter cutoff
+    """
+    names = sorted(set(coarse_scores) & set(fine_scores))
+    coarse = np.array([coarse_scores[n] for n in names])
+    fine = np.array([fine_scores[n] for n in names])
+    ret_dict = {"num_scenes": len(names), "spearman": float("nan"), "top_k_overlap": float("nan")}
+    if len(names) < 2:
+        return ret_dict
+    coarse_rank = np.argsort(np.argsort(-coarse))
+    fine_rank = np.argsort(np.argsort(-fine))
+    ret_dict["spearman"] = float(np.corrcoef(coarse_rank, fine_rank)[0, 1])
+    k = max(1, min(budget, len(names)))
+    top_coarse = set(np.array(names)[coarse_rank < k])
+    top_fine = set(np.array(names)[fine_rank < k])
+    ret_dict["top_k_overlap"] = len(top_coarse & top_fine) / float(k)
+    return ret_dict
+
+
+def sample_pruned(pool, kept, num_samples, seed=0):
+    """A seeded random sample of the pool scenes the pre-filter dropped, in pool
+    order, to be scored at full resolution as an audit of the cutoff."""
+    kept = set(kept)
+    pruned = [name for name in pool if name not in kept]
+    rng = np.random.RandomState(seed)
+    choices = rng.choice(len(pruned), min(num_samples, len(pruned)), replace=False)
+    return [pruned[i] for i in sorted(choices)]
+
+
+def pruned_top_k_recall(kept_scores, audit_scores, num_pruned, budget):
+    """Estimates the recall of the true full resolution top-budget scenes of the
+    whole pool after the pre-filter cutoff.
+
+    rank_agreement only sees the scenes that survived the cutoff. Here the
+    full resolution scores of a random sample of the pruned scenes are compared
+    with the budget-th best kept score: the fraction of audited scenes above it,
+    times the number of pruned scenes, estimates how many scenes of the true
+    top-budget the cutoff dropped.
+
+    Args:
+        kept_scores, audit_scores: {scene_name: score} full resolution scores
+            of the kept scenes and of the audited pruned scenes
+        num_pruned: number of scenes the pre-filter dropped
+        budget: size of the final selection
+    Returns:
+        dict with the audit size, the audited scenes above the cutoff, the
+        estimated number of missed top-budget scenes and the estimated recall
+    """
+    ret_dict = {
+        "num_audited": len(audit_scores),
+        "audit_above_cutoff": 0,
+        "est_missed_top_k": float("nan"),
+        "est_top_k_recall": float("nan"),
+    }
+    k = min(budget, len(kept_scores))
+    if k < 1 or len(audit_scores) == 0:
+        return ret_dict
+    cutoff = heapq.nlargest(k, kept_scores.values())[-1]
+    above = sum(score > cutoff for score in audit_scores.values())
+    est_missed = min(float(k), above / float(len(audit_scores)) * num_pruned)
+    ret_dict["audit_above_cutoff"] = int(above)
+    ret_dict["est_missed_top_k"] = est_missed
+    ret_dict["est_top_k_recall"] = 1.0 - est_missed / k
+    return ret_dict
@@ -0,0 +1,117 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+""" Testing the shard bookkeeping and the selection of the pool scoring. """
+
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR)
+from pool_scoring import (
+    make_shards,
+    pending_shards,
+    shard_prefix,
+    write_atomic,
+    select_top_k,
+    rank_agreement,
+    sample_pruned,
+    pruned_top_k_recall,
+    SHARD_RESULT_EXT,
+)
+
+
+def _write_result(out_dir, shard_idx, rows):
+    write_atomic(
+        shard_prefix(out_dir, shard_idx) + SHARD_RESULT_EXT,
+        ["%s\t%.8f" % (name, score) for name, score in rows],
+    )
+
+
+def test_make_shards_and_resume():
+    """Shard lists are reused for the same pool, pending_shards skips scored
+    shards and a different pool fails instead of scoring the old one."""
+    out_dir = tempfile.mkdtemp()
+    try:
+        pool = ["scene%04d_00" % (i) for i in range(10)]
+        shards = make_shards(pool, 3, out_dir)
+        assert [n for shard in shards for n in shard] == pool
+        assert len(shards) == 3
+        assert pending_shards(out_dir, 3) == [0, 1, 2]
+
+        _write_result(out_dir, 1, [(n, 0.5) for n in shards[1]])
+        assert make_shards(pool, 3, out_dir) == shards
+        assert pending_shards(out_dir, 3) == [0, 2]
+
+        for other_pool, num_shards in [(pool[:-1], 3), (pool, 4)]:
+            try:
+                make_shards(other_pool, num_shards, out_dir)
+                assert False, "a different pool or shard count must fail"
+            except ValueError:
+                pass
+        shards = make_shards(pool[:-1], 2, out_dir, rebuild=True)
+        assert [n for shard in shards for n in shard] == pool[:-1]
+        assert pending_shards(out_dir, 2) == [0, 1]
+    finally:
+        shutil.rmtree(out_dir)
+
+
+def test_select_top_k_and_rank_agreement():
+    """The streaming top-k over all shard results is the top-k of the merged
+    scores, and identical rankings agree completely."""
+    out_dir = tempfile.mkdtemp()
+    try:
+        rng = np.random.RandomState(0)
+        scores = {"scene%04d_00" % (i): float(s) for i, s in enumerate(rng.rand(20))}
+        names = sorted(scores)
+        for shard_idx in range(4):
+            _write_result(out_dir, shard_idx, [(n, scores[n]) for n in names[shard_idx::4]])
+        expected = sorted(names, key=lambda n: -scores[n])[:5]
+        assert [n for _, n in select_top_k(out_dir, 5)] == expected
+    finally:
+        shutil.rmtree(out_dir)
+
+    agreement = rank_agreement(scores, dict(scores), 5)
+    assert agreement["num_scenes"] == 20
+    assert np.isclose(agreement["spearman"], 1.0)
+    assert agreement["top_k_overlap"] == 1.0
+    reversed_scores = {n: -s for n, s in scores.items()}
+    agreement = rank_agreement(scores, reversed_scores, 5)
+    assert np.isclose(agreement["spearman"], -1.0)
+    assert agreement["top_k_overlap"] == 0.0
+
+
+def test_pruned_audit_and_recall():
+    """The audit sample is seeded and only holds pruned scenes, and the recall
+    estimate counts the audited scenes above the budget-th kept score."""
+    pool = ["scene%04d_00" % (i) for i in range(100)]
+    kept = pool[::4]
+    audit = sample_pruned(pool, kept, 10, seed=1)
+    assert audit == sample_pruned(pool, kept, 10, seed=1)
+    assert len(set(audit)) == 10 and not set(audit) & set(kept)
+    assert len(sample_pruned(pool, kept, 1000)) == len(pool) - len(kept)
+
+    kept_scores = {n: float(i) for i, n in enumerate(kept)}
+    # budget 5: the cutoff is the 5th best kept score, 20.0
+    audit_scores = {n: 30.0 if i < 2 else 1.0 for i, n in enumerate(audit)}
+    recall = pruned_top_k_recall(kept_scores, audit_scores, len(pool) - len(kept), 5)
+    assert recall["num_audited"] == 10
+    assert recall["audit_above_cutoff"] == 2
+    # 2 of 10 audited, 75 pruned: 15 estimated misses, capped at the budget
+    assert recall["est_missed_top_k"] == 5.0
+    assert recall["est_top_k_recall"] == 0.0
+    audit_scores = {n: 1.0 for n in audit}
+    recall = pruned_top_k_recall(kept_scores, audit_scores, len(pool) - len(kept), 5)
+    assert recall["est_top_k_recall"] == 1.0
+    assert np.isnan(pruned_top_k_recall(kept_scores, {}, 75, 5)["est_top_k_recall"])
+
+
+if __name__ == "__main__":
+    test_make_shards_and_resume()
+    test_select_top_k_and_rank_agreement()
+    test_pruned_audit_and_recall()
@@ -147,7 +147,30 @@ def objectness_uncertainty(samples,threshold = None,classification=None):
     else:
         mi_obj_mask = (normalized_mi_obj > THRESHOLD(normalized_mi_obj))
     return mi_obj_mask,normalized_mi_obj
-    
+
+
+def scene_uncertainty(samples, eps=1e-10):
+    """
+    Per-scene epistemic uncertainty used for ranking the unlabeled pool.
+    Mutual information of objectness and semantic class, averaged over all proposals.
+    Works on the raw logits in the end_points, so it stays batched and on device.
+
+    Args:
+        samples: list of T end_points dicts from MC dropout forward passes
+    Returns:
+        (B,) numpy array, higher means more uncertain
+    """
+    def mutual_information(logits):
+        probs = torch.softmax(torch.stack(logits).float(), dim=-1)  # T,B,K,C
+        expected_p = probs.mean(0)
+        predictive_entropy = -torch.sum(expected_p * torch.log(expected_p + eps), -1)
+        expected_entropy = -torch.sum(probs * torch.log(probs + eps), -1).mean(0)
+        return predictive_entropy - expected_entropy  # B,K
+
+    mi_obj = mutual_information([e["objectness_scores"] for e in samples])
+    mi_cls = mutual_information([e["sem_cls_scores"] for e in samples])
+    return (mi_obj + mi_cls).mean(-1).detach().cpu().numpy()
+
 
 
 def center_uncertainty(samples):